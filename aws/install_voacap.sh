@@ -41,4 +41,18 @@ sudo -u www-data "$VENV/bin/python" "$BASE/scripts/voacap_bandconditions.py" \
   --cache-dir "$BASE/tmp/voacap-cache" --cache-ttl 0 \
   && echo "    voacap_bandconditions.py OK"
 
+echo "==> Starting resident band-conditions service (cron keeps it running)..."
+sudo chown www-data:www-data "$BASE/scripts/voacap_bandserver.py"
+sudo -u www-data "$VENV/bin/python" "$BASE/scripts/voacap_bandserver.py" --daemon
+sleep 2
+QS="YEAR=2026&MONTH=1&UTC=14&TXLAT=28.154&TXLNG=-80.644&RXLAT=37.7749&RXLNG=-122.4194&PATH=0&POW=100&MODE=19&TOA=3.0&SSN=39"
+sudo -u www-data "$VENV/bin/python" - "$BASE/tmp/voacap-band.sock" "$QS" <<'PY' && echo "    voacap_bandserver.py OK"
+import socket, sys
+s = socket.socket(socket.AF_UNIX)
+s.connect(sys.argv[1])
+s.sendall(sys.argv[2].encode() + b"\n")
+reply = b"".join(iter(lambda: s.recv(65536), b""))
+raise SystemExit(0 if reply.startswith(b"200\n") else 1)
+PY
+
 echo "Done."
@@ -1,142 +1,82 @@
 #!/usr/bin/env perl
 use strict;
 use warnings;
-use CGI qw(:standard);
-use POSIX qw(strftime);
+use IO::Socket::UNIX;
+use Socket qw(SOCK_STREAM);
 
 # fetchBandConditions.pl
-# CGI wrapper for band_service.py
-
-my $PY      = $ENV{PYTHON3} || "python3";
-my $SCRIPT  = "/opt/hamclock-backend/htdocs/ham/HamClock/band_service.py";
+# Thin CGI forwarder to the resident voacap_bandserver.py.
+#
+# The query string is passed through unchanged; validation, SSN lookup,
+# caching and the prediction itself all happen in the server, which keeps
+# dvoacap loaded between requests. If the server is not running, the same
+# code path is run once in a fresh interpreter (slow, but never wrong).
+
+my $BASE    = "/opt/hamclock-backend";
+my $SOCKET  = $ENV{OHB_BAND_SOCKET} || "$BASE/tmp/voacap-band.sock";
+my $SERVER  = "$BASE/scripts/voacap_bandserver.py";
+my $PY      = $ENV{PYTHON3} || (-x "$BASE/venv/bin/python3" ? "$BASE/venv/bin/python3" : "python3");
+my $TIMEOUT = 30;   # connect, and the whole request/reply exchange
+
+my %STATUS = (
+    200 => '200 OK',
+    400 => '400 Bad Request',
+    500 => '500 Internal Server Error',
+    504 => '504 Gateway Timeout',
+);
 
-# ---- helpers ----
-sub is_int {
-    my ($v) = @_;
-    return defined($v) && $v =~ /\A-?\d+\z/;
-}
-sub is_num {
-    my ($v) = @_;
-    return defined($v) && $v =~ /\A-?\d+(?:\.\d+)?\z/;
-}
-sub clamp {
-    my ($v, $lo, $hi) = @_;
-    return $lo if $v < $lo;
-    return $hi if $v > $hi;
-    return $v;
-}
-sub bad_request {
-    my ($msg) = @_;
-    print header(
-        -type   => 'text/plain',
-        -status => '400 Bad Request',
-        -charset => 'UTF-8'
-    );
-    print "ERROR: $msg\n";
+sub respond {
+    my ($code, $body) = @_;
+    print "Status: " . ($STATUS{$code} || $STATUS{500}) . "\r\n";
+    print "Content-Type: text/plain; charset=UTF-8\r\n\r\n";
+    print $body;
     exit 0;
 }
 
-# ---- parse query ----
-my $q = CGI->new;
-
-# Required-ish parameters (HamClock will send these)
-my $YEAR  = $q->param('YEAR');
-my $MONTH = $q->param('MONTH');
-my $RXLAT = $q->param('RXLAT');
-my $RXLNG = $q->param('RXLNG');
-my $TXLAT = $q->param('TXLAT');
-my $TXLNG = $q->param('TXLNG');
-my $UTC   = $q->param('UTC');
-my $PATH  = $q->param('PATH');
-my $POW   = $q->param('POW');
-my $MODE  = $q->param('MODE');
-my $TOA   = $q->param('TOA');
-
-# ---- validate/sanitize ----
-bad_request("Missing YEAR")  unless defined $YEAR  && length $YEAR;
-bad_request("Missing MONTH") unless defined $MONTH && length $MONTH;
-bad_request("Missing RXLAT") unless defined $RXLAT && length $RXLAT;
-bad_request("Missing RXLNG") unless defined $RXLNG && length $RXLNG;
-bad_request("Missing TXLAT") unless defined $TXLAT && length $TXLAT;
-bad_request("Missing TXLNG") unless defined $TXLNG && length $TXLNG;
-bad_request("Missing UTC")   unless defined $UTC   && length $UTC;
-bad_request("Missing PATH")  unless defined $PATH  && length $PATH;
-bad_request("Missing POW")   unless defined $POW   && length $POW;
-bad_request("Missing MODE")  unless defined $MODE  && length $MODE;
-bad_request("Missing TOA")   unless defined $TOA   && length $TOA;
-
-bad_request("YEAR must be integer")  unless is_int($YEAR);
-bad_request("MONTH must be integer") unless is_int($MONTH);
-bad_request("UTC must be integer")   unless is_int($UTC);
-bad_request("PATH must be integer")  unless is_int($PATH);
-bad_request("POW must be integer")   unless is_int($POW);
-bad_request("MODE must be integer")  unless is_int($MODE);
-
-bad_request("RXLAT must be numeric") unless is_num($RXLAT);
-bad_request("RXLNG must be numeric") unless is_num($RXLNG);
-bad_request("TXLAT must be numeric") unless is_num($TXLAT);
-bad_request("TXLNG must be numeric") unless is_num($TXLNG);
-bad_request("TOA must be numeric")   unless is_num($TOA);
-
-# Clamp to sane ranges (prevents weirdness; keeps inputs reasonable)
-$MONTH = clamp($MONTH, 1, 12);
-$UTC   = clamp($UTC,   0, 23);
-$RXLAT = clamp($RXLAT, -90,  90);
-$TXLAT = clamp($TXLAT, -90,  90);
-$RXLNG = clamp($RXLNG, -180, 180);
-$TXLNG = clamp($TXLNG, -180, 180);
-
-# ---- build command (NO shell) ----
-my @cmd = (
-    $PY, $SCRIPT,
-    "--YEAR",  $YEAR,
-    "--MONTH", $MONTH,
-    "--RXLAT", sprintf("%.3f", $RXLAT),
-    "--RXLNG", sprintf("%.3f", $RXLNG),
-    "--TXLAT", sprintf("%.3f", $TXLAT),
-    "--TXLNG", sprintf("%.3f", $TXLNG),
-    "--UTC",   $UTC,
-    "--PATH",  $PATH,
-    "--POW",   $POW,
-    "--MODE",  $MODE,
-    "--TOA",   $TOA,
-);
+# Split "CODE\nBODY" as returned by the server
+sub relay {
+    my ($reply, $who) = @_;
+    respond(500, "ERROR: no response from $who\n") unless defined $reply && length $reply;
+    my ($code, $body) = split /\n/, $reply, 2;
+    $code = 500 unless defined $code && $code =~ /\A\d{3}\z/;
+    respond($code, $body // '');
+}
 
-# ---- run ----
-# band_service.py is expected to print the exact HamClock-compatible response.
-# We forward stdout as-is. On error, return 500 with stderr.
-my $output = '';
-my $err = '';
+my $qs = $ENV{QUERY_STRING} // '';
+$qs =~ s/[\r\n]//g;
+
+# A query is KEY=VALUE pairs; anything else (e.g. the server's STATS
+# command) is not for web clients
+respond(400, "ERROR: Missing YEAR\n") unless $qs =~ /=/;
+
+# ---- fast path: resident server ----
+my $sock = IO::Socket::UNIX->new(Type => SOCK_STREAM, Peer => $SOCKET, Timeout => $TIMEOUT);
+if ($sock) {
+    # IO::Socket's Timeout only covers connect; bound the exchange with alarm
+    # so a stuck server cannot hang the CGI
+    my $reply = eval {
+        local $SIG{ALRM} = sub { die "timeout\n" };
+        alarm $TIMEOUT;
+        print {$sock} "$qs\n";
+        local $/;
+        my $r = <$sock>;
+        alarm 0;
+        $r;
+    };
+    alarm 0;
+    close($sock);
+    respond(504, "ERROR: voacap_bandserver did not answer within ${TIMEOUT}s\n")
+        if !defined $reply && ($@ // '') eq "timeout\n";
+    relay($reply, "voacap_bandserver");
+}
 
-# Capture combined output safely without invoking a shell.
+# ---- fallback: one-shot run of the same service code (list form => no shell) ----
 {
-    # localize PATH just in case (optional)
     local $ENV{PATH} = $ENV{PATH} || "/usr/bin:/bin";
-
-    # Open a pipe from the command (list form => no shell injection)
-    open(my $fh, "-|", @cmd) or do {
-        print header(-type => 'text/plain', -status => '500 Internal Server Error', -charset => 'UTF-8');
-        print "ERROR: failed to exec band_service.py: $!\n";
-        exit 0;
-    };
-
+    open(my $fh, "-|", $PY, $SERVER, "--once", $qs) or respond(500, "ERROR: failed to exec voacap_bandserver.py: $!\n");
     local $/;
-    $output = <$fh> // '';
+    my $reply = <$fh>;
     close($fh);
-
-    # close() exit status
-    if ($? != 0) {
-        my $rc = ($? >> 8);
-        print header(-type => 'text/plain', -status => '500 Internal Server Error', -charset => 'UTF-8');
-        print "ERROR: band_service.py exited with rc=$rc\n";
-        print $output if length $output;
-        exit 0;
-    }
+    respond(500, "ERROR: voacap_bandserver.py exited with rc=" . ($? >> 8) . "\n") if $? != 0;
+    relay($reply, "voacap_bandserver.py --once");
 }
-
-# ---- respond ----
-print header(-type => 'text/plain', -status => '200 OK', -charset => 'UTF-8');
-print $output;
-
-exit 0;
-
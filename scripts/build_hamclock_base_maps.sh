@@ -11,6 +11,9 @@ export MAGICK_DISK_LIMIT=8GiB
 
 mkdir -p /tmp/imcache
 
+# Shared BMPv4 RGB565 codec (streams band by band, no per-pixel Python)
+BMP565="$(dirname "${BASH_SOURCE[0]}")/lib_bmp565.py"
+
 # HamClock widths (2:1 maps)
 SIZES=(660 1320 1980 2640 3960 5280 5940 7920)
 
@@ -60,7 +63,7 @@ for W in "${SIZES[@]}"; do
 
   else
 
-    python3 ppm_to_rgb565.py ${OUT}.ppm ${OUT}.bmp
+    python3 "$BMP565" ppm2bmp ${OUT}.ppm ${OUT}.bmp
 
   fi
 
@@ -10,34 +10,82 @@ Build HamClock MUF-RT maps:
   - composite overlay onto Day and/or Night Countries base maps
   - write BMPv4 RGB565 top-down + zlib-compressed .bmp.z
 
-Dependencies: python3, pillow
-Optional: numpy (strongly recommended for speed)
+With --sizes/--basedir, stations are fetched and interpolated once on a
+canonical --grid and the field is resampled for every size; only the
+colorize / markers / composite / encode steps run per size.
+
+With --stream, each size is rendered one horizontal band at a time
+(interpolate -> colorize -> markers -> composite -> RGB565 -> zlib), with the
+band height chosen from --max-memory-mb.  Output is byte-identical to the
+default whole-image path.
+
+A fingerprint of the filtered stations, render parameters and base-map
+identities is kept next to the outputs; when it matches the previous run
+(and every output exists) the run exits without rendering.  --force
+overrides.
+
+With --idw-cache-dir (off by default; update_muf_rt_maps.sh turns it on),
+IDW neighbour indices and weights for the canonical grid are cached there,
+keyed by the station set, grid, k and p; when stations have not moved,
+interpolation is a weighted gather over the new values.  The two most
+recently used sets are kept, and grids whose matrix exceeds
+--idw-cache-max-mb are not cached.
+
+With --jobs N, every (size, D/N) render-and-encode task runs in a pool of N
+worker processes that map the interpolated field from shared memory.
+
+Dependencies: python3, pillow, numpy
+Optional: scipy (KD-tree station lookup; falls back to brute-force distances),
+          requests (stations.json through lib_upstream's shared cache; falls back to urllib)
+BMP encoding is shared with the other map pipelines via lib_bmp565.py, which
+also keeps the decoded Countries bases in a memory-mapped cache (--base-cache-dir);
+sizes, resampling, colorizing and base loading come from lib_maprender.py.
 """
 
 import argparse
 import datetime as dt
+import glob
+import hashlib
 import json
 import os
-import struct
 import sys
 import time
-import zlib
 from collections import deque
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from multiprocessing import resource_tracker, shared_memory
 from urllib.request import Request, urlopen
 
 try:
     import numpy as np
 except ImportError:
     np = None
+else:
+    import lib_bmp565
+    from lib_bmp565 import (BASE_CACHE_DIR, BmpV4Rgb565Writer, load_bmp_v4_rgb565_cached,
+                            open_bmp_v4_rgb565_rows, write_bmp_v4_rgb565_topdown)
+    from lib_maprender import base_rgb565_lut, colorize_field, load_base_map, parse_sizes, resample_field
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
 
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 
+try:
+    from lib_upstream import fetch as fetch_shared
+except ImportError:
+    fetch_shared = None
+
 
 KC2G_STATIONS_JSON = "https://prop.kc2g.com/api/stations.json"
 
 
 def http_get(url: str, timeout: int = 20) -> bytes:
+    """stations.json through the shared upstream cache when it is importable, else directly."""
+    if fetch_shared is not None:
+        return fetch_shared(url, timeout=timeout)
     req = Request(url, headers={"User-Agent": "OHB-MUF-RT/1.0"})
     with urlopen(req, timeout=timeout) as r:
         return r.read()
@@ -76,6 +124,42 @@ def haversine_rad(lon1, lat1, lon2, lat2):
     return c
 
 
+def unit_vectors(lon_r, lat_r):
+    """Lon/lat (radians, broadcastable) -> (..., 3) unit vectors on the sphere."""
+    cos_lat = np.cos(lat_r)
+    return np.stack(np.broadcast_arrays(cos_lat * np.cos(lon_r), cos_lat * np.sin(lon_r), np.sin(lat_r)), axis=-1)
+
+
+def build_station_index(lons_r, lats_r):
+    """KD-tree on station unit vectors, or None when scipy is unavailable."""
+    if cKDTree is None:
+        return None
+    return cKDTree(unit_vectors(lons_r, lats_r))
+
+
+def nearest_stations(index, lons_r, lats_r, glon_r, glat_r, k: int):
+    """
+    k nearest stations for every pixel of a row band.
+
+    glon_r is (W,), glat_r is (rows,), both radians.  Returns (dist, idx), each
+    (rows, W, k): great-circle distance in radians and station indices.
+
+    With a KD-tree each pixel costs O(k log N); chord length on the unit sphere
+    is monotonic in great-circle distance, so neighbours are the same as the
+    brute-force haversine search.
+    """
+    rows, w = glat_r.shape[0], glon_r.shape[0]
+    if index is not None:
+        pts = unit_vectors(glon_r[None, :], glat_r[:, None]).reshape(-1, 3)
+        chord, idx = index.query(pts, k=k)
+        dist = 2.0 * np.arcsin(np.minimum(1.0, chord * 0.5))
+        return dist.reshape(rows, w, k), idx.reshape(rows, w, k)
+
+    d = haversine_rad(glon_r[None, :, None], glat_r[:, None, None], lons_r[None, None, :], lats_r[None, None, :])
+    idx = np.argpartition(d, kth=k - 1, axis=2)[:, :, :k]
+    return np.take_along_axis(d, idx, axis=2), idx
+
+
 def muf_colormap(mhz: float) -> tuple[int, int, int]:
     """
     Approximate HamClock-like palette: low=blue, mid=green/yellow, high=red/purple.
@@ -107,148 +191,19 @@ def muf_colormap(mhz: float) -> tuple[int, int, int]:
     return stops[-1][1]
 
 
-def load_base_map(path: str) -> Image.Image:
-    if path.endswith(".bmp.z"):
-        raw = open(path, "rb").read()
-        bmp = zlib.decompress(raw)
-        return Image.open(BytesIO(bmp)).convert("RGB")
-    return Image.open(path).convert("RGB")
-
-
-def _rgb888_to_rgb565_le_bytes(img_rgb: Image.Image) -> bytes:
-    if img_rgb.mode != "RGB":
-        img_rgb = img_rgb.convert("RGB")
-    w, h = img_rgb.size
-    data = img_rgb.tobytes()
-    row_bytes = w * 2
-    pad = (4 - (row_bytes % 4)) % 4
-    out = bytearray((row_bytes + pad) * h)
-
-    oi = 0
-    di = 0
-    for _y in range(h):
-        for _x in range(w):
-            r = data[di]
-            g = data[di + 1]
-            b = data[di + 2]
-            di += 3
-            v = ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
-            out[oi] = v & 0xFF
-            out[oi + 1] = (v >> 8) & 0xFF
-            oi += 2
-        if pad:
-            out[oi:oi + pad] = b"\x00" * pad
-            oi += pad
-    return bytes(out)
-
-
-def write_bmpv4_rgb565_topdown_and_z(img_rgb: Image.Image, out_bmp: str, out_bmp_z: str, zlevel: int = 9) -> None:
-    if img_rgb.mode != "RGB":
-        img_rgb = img_rgb.convert("RGB")
-
-    w, h = img_rgb.size
-    pixel_bytes = _rgb888_to_rgb565_le_bytes(img_rgb)
-    row_bytes = w * 2
-    pad = (4 - (row_bytes % 4)) % 4
-    image_size = (row_bytes + pad) * h
-
-    bfType = b"BM"
-    bfOffBits = 14 + 108
-    bfSize = bfOffBits + image_size
-
-    file_header = struct.pack("<2sIHHI", bfType, bfSize, 0, 0, bfOffBits)
-
-    # BITMAPV4HEADER (108 bytes)
-    bV4Size = 108
-    bV4Width = w
-    bV4Height = -h           # top-down
-    bV4Planes = 1
-    bV4BitCount = 16
-    BI_BITFIELDS = 3
-    bV4Compression = BI_BITFIELDS
-    bV4SizeImage = image_size
-
-    bV4RedMask = 0xF800
-    bV4GreenMask = 0x07E0
-    bV4BlueMask = 0x001F
-    bV4AlphaMask = 0x0000
-
-    bV4CSType = 0x73524742    # 'sRGB'
-    endpoints = b"\x00" * 36
-    gamma0 = gamma1 = gamma2 = 0
-
-    v4_header = struct.pack(
-        "<IiiHHIIiiII"
-        "IIII"
-        "I"
-        "36s"
-        "III",
-        bV4Size,
-        bV4Width,
-        bV4Height,
-        bV4Planes,
-        bV4BitCount,
-        bV4Compression,
-        bV4SizeImage,
-        0, 0,           # XPelsPerMeter, YPelsPerMeter
-        0, 0,           # ClrUsed, ClrImportant
-        bV4RedMask,
-        bV4GreenMask,
-        bV4BlueMask,
-        bV4AlphaMask,
-        bV4CSType,
-        endpoints,
-        gamma0, gamma1, gamma2
-    )
-
-    bmp_bytes = file_header + v4_header + pixel_bytes
-
-    with open(out_bmp, "wb") as f:
-        f.write(bmp_bytes)
-
-    comp = zlib.compress(bmp_bytes, level=zlevel)
-    with open(out_bmp_z, "wb") as f:
-        f.write(comp)
-
+MUF_LUT_STEP = 0.01  # MHz per colormap LUT entry
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--width", type=int, required=True)
-    ap.add_argument("--height", type=int, required=True)
 
-    # Day/night bases:
-    ap.add_argument("--base-day", help="Countries Day base (.bmp|.bmp.z|.png)")
-    ap.add_argument("--base-night", help="Countries Night base (.bmp|.bmp.z|.png)")
-
-    ap.add_argument("--outdir", required=True)
-    ap.add_argument("--product", default="MUF-RT")
-
-    ap.add_argument("--alpha", type=float, default=0.55, help="heatmap opacity 0..1")
-    ap.add_argument("--active-seconds", type=int, default=3600)
-    ap.add_argument("--min-confidence", type=float, default=0.0)
-    ap.add_argument("--k", type=int, default=24)
-    ap.add_argument("--p", type=float, default=2.0)
-    ap.add_argument("--muf-min", type=float, default=0.0)
-    ap.add_argument("--muf-max", type=float, default=35.0)
-    ap.add_argument("--stations-url", default=KC2G_STATIONS_JSON)
-    ap.add_argument("--debug-png", action="store_true")
-    args = ap.parse_args()
-
-    if np is None:
-        print("ERROR: numpy is required for reasonable performance. Try: apt install python3-numpy", file=sys.stderr)
-        return 2
-
-    w, h = args.width, args.height
-    os.makedirs(args.outdir, exist_ok=True)
-
-    if not args.base_day and not args.base_night:
-        print("ERROR: Provide at least one of --base-day or --base-night", file=sys.stderr)
-        return 2
+def build_muf_lut(muf_min: float, muf_max: float, step: float = MUF_LUT_STEP) -> "np.ndarray":
+    """
+    Quantized muf_colormap(): entry i is the color of muf_min + i*step, as an (N, 3) uint8 array.
+    """
+    n = max(1, int(round((muf_max - muf_min) / step)) + 1)
+    return np.array([muf_colormap(muf_min + i * step) for i in range(n)], dtype=np.uint8)
 
-    # Fetch stations
-    stations = json.loads(http_get(args.stations_url).decode("utf-8", errors="replace"))
-    now = time.time()
 
+def filter_stations(stations, now: float, active_seconds: int, min_confidence: float) -> list:
+    """KC2G stations.json rows -> [(lon, lat, mufd, conf, code)] active within active_seconds."""
     pts = []
     for row in stations:
         st = row.get("station") or {}
@@ -274,80 +229,45 @@ def main():
         elif lon < -180.0:
             lon += 360.0
 
-        if (now - t) > args.active_seconds:
+        if (now - t) > active_seconds:
             continue
-        if conf < args.min_confidence:
+        if conf < min_confidence:
             continue
 
         code = (st.get("code") or "").strip()
         pts.append((lon, lat, mufd, conf, code))
 
-    if len(pts) < 4:
-        print(f"ERROR: only {len(pts)} active stations found; refusing to render.", file=sys.stderr)
-        return 2
-
-    # Prepare arrays for interpolation
-    lons = np.array([p[0] for p in pts], dtype=np.float64)
-    lats = np.array([p[1] for p in pts], dtype=np.float64)
-    vals = np.array([p[2] for p in pts], dtype=np.float64)
-    confs = np.array([p[3] for p in pts], dtype=np.float64)
-
-    lons_r = np.deg2rad(lons)
-    lats_r = np.deg2rad(lats)
-
-    xs = np.linspace(-180.0, 180.0, w, dtype=np.float64)
-    ys = np.linspace(90.0, -90.0, h, dtype=np.float64)
-    grid_lon, grid_lat = np.meshgrid(xs, ys)
-    grid_lon_r = np.deg2rad(grid_lon)
-    grid_lat_r = np.deg2rad(grid_lat)
-
-    k = max(4, min(args.k, len(pts)))
-    pwr = float(args.p)
-    eps = 1e-6
-
-    out_muf = np.empty((h, w), dtype=np.float32)
-    chunk_rows = 40
-
-    for y0 in range(0, h, chunk_rows):
-        y1 = min(h, y0 + chunk_rows)
-        glon = grid_lon_r[y0:y1, :, None]
-        glat = grid_lat_r[y0:y1, :, None]
-
-        d = haversine_rad(glon, glat, lons_r[None, None, :], lats_r[None, None, :])
-        idx = np.argpartition(d, kth=k - 1, axis=2)[:, :, :k]
-        d_k = np.take_along_axis(d, idx, axis=2)
+    return pts
 
-        w_k = 1.0 / (np.power(d_k + eps, pwr))
-        w_k = w_k * confs[idx]
 
-        v_k = vals[idx]
-        muf = np.sum(w_k * v_k, axis=2) / (np.sum(w_k, axis=2) + eps)
-        muf = np.clip(muf, args.muf_min, args.muf_max)
-        out_muf[y0:y1, :] = muf.astype(np.float32)
+MARKER_MARGIN = 32  # px beyond the dot radius a marker label may reach
 
-    # Build overlay RGBA: heatmap + station marks (no base yet)
-    overlay = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-    px = overlay.load()
-    a = int(round(max(0.0, min(1.0, args.alpha)) * 255))
 
-    for y in range(h):
-        row = out_muf[y, :]
-        for x in range(w):
-            r, g, b = muf_colormap(float(row[x]))
-            px[x, y] = (r, g, b, a)
+def draw_station_markers(overlay: Image.Image, pts: list, size: tuple = None, y0: int = 0) -> None:
+    """
+    Draw station markers onto overlay.
 
+    overlay may be a band of a larger map: size is the full (w, h) and y0 the
+    band's first row; markers are placed in full-map coordinates and only
+    those that can touch the band are drawn.
+    """
+    w, h = size or overlay.size
+    band_h = overlay.size[1]
     draw = ImageDraw.Draw(overlay)
     try:
         font = ImageFont.load_default()
     except Exception:
         font = None
 
+    # Dot radius: slightly smaller than the earlier outline circle
+    rad = max(3, int(round(min(w, h) / 140)))
+
     # KC2G-like markers (colored filled dots + MUF number; alpha fades with confidence)
     for lon, lat, mufd, conf, code in pts:
         x, y = lonlat_to_xy(lon, lat, w, h)
-
-        # Dot radius: slightly smaller than the earlier outline circle
-        rad = max(3, int(round(min(w, h) / 140)))
+        y -= y0
+        if y + rad + MARKER_MARGIN < 0 or y - rad - MARKER_MARGIN >= band_h:
+            continue
 
         # Color keyed to MUF value
         fill_r, fill_g, fill_b = muf_colormap(float(mufd))
@@ -384,31 +304,545 @@ def main():
         draw.text((tx + 1, ty + 1), label, fill=(0, 0, 0, 255), font=font)
         draw.text((tx, ty), label, fill=(255, 255, 255, 255), font=font)
 
-    def render_variant(prefix: str, base_path: str):
-        base = load_base_map(base_path)
-        if base.size != (w, h):
-            base = base.resize((w, h), resample=Image.BILINEAR)
 
-        comp = Image.alpha_composite(base.convert("RGBA"), overlay).convert("RGB")
+def write_bmpv4_rgb565_topdown_and_z(img_rgb: Image.Image, out_bmp: str, out_bmp_z: str, zlevel: int = 9) -> None:
+    write_bmp_v4_rgb565_topdown(img_rgb, out_bmp, out_bmp_z, zlevel=zlevel)
+
+
+IDW_EPS = 1e-6
+IDW_CACHE_KEEP = 2          # weight sets kept on disk
+IDW_CACHE_MAX_MB = 256.0    # larger matrices are not cached; 1980x990 at k=24 is 188 MB
+
+
+def station_arrays(pts: list):
+    """pts -> (lons_r, lats_r, vals, confs) float64 arrays."""
+    a = np.array([p[:4] for p in pts], dtype=np.float64).reshape(-1, 4)
+    return np.deg2rad(a[:, 0]), np.deg2rad(a[:, 1]), a[:, 2], a[:, 3]
+
+
+def idw_weights(index, lons_r, lats_r, xs_r, ys_r, k: int, pwr: float):
+    """
+    Neighbour indices and inverse-distance weights for a row band.
+
+    Returns (idx, wts), each (rows, W, k): station indices (uint16 when they
+    fit) and 1 / (d + eps)^p normalised to sum 1 per pixel, as float16.
+    Together they are one row band of the (pixels x stations) IDW matrix in
+    ELLPACK form (k entries per row); 4 bytes per entry keeps the default
+    grid's matrix cacheable.  Normalising does not change the result (IDW
+    divides by the weight sum anyway) but keeps weights in float16 range.
+    """
+    d_k, idx = nearest_stations(index, lons_r, lats_r, xs_r, ys_r, k)
+    idx_dtype = np.uint16 if len(lons_r) <= 0xFFFF else np.int32
+    wts = 1.0 / np.power(d_k + IDW_EPS, pwr)
+    wts /= np.sum(wts, axis=2, keepdims=True)
+    return idx.astype(idx_dtype), wts.astype(np.float16)
+
+
+def apply_idw(idx, wts, vals, confs, muf_min: float, muf_max: float) -> "np.ndarray":
+    """Confidence-scaled IDW of station values through a weight band -> (rows, W) float32."""
+    w_k = wts * confs[idx]
+    muf = np.sum(w_k * vals[idx], axis=2) / (np.sum(w_k, axis=2) + IDW_EPS)
+    return np.clip(muf, muf_min, muf_max).astype(np.float32)
+
+
+def station_order(lons_r, lats_r) -> "np.ndarray":
+    """Permutation putting stations in canonical (lon, lat) order, so the cache key ignores feed order."""
+    return np.lexsort((lats_r, lons_r))
+
+
+def idw_cache_key(lons_r, lats_r, w: int, h: int, k: int, pwr: float) -> str:
+    hsh = hashlib.sha256()
+    hsh.update(np.ascontiguousarray(lons_r).tobytes())
+    hsh.update(np.ascontiguousarray(lats_r).tobytes())
+    hsh.update(json.dumps([FINGERPRINT_VERSION, w, h, k, pwr, IDW_EPS]).encode("utf-8"))
+    return hsh.hexdigest()[:24]
+
+
+def load_idw_weights(pts: list, w: int, h: int, k: int, pwr: float, cache_dir: str,
+                     index=None, chunk_rows: int = 40, max_mb: float = IDW_CACHE_MAX_MB):
+    """
+    Whole-grid IDW matrix (idx, wts, order), memory-mapped from cache_dir.
+
+    Keyed by the station set (sorted coordinates), grid size, k and p, so a
+    run whose stations did not move only re-weights the new MUF values and
+    confidences.  idx refers to stations in canonical order: pts[order[i]].
+    On a miss the matrix is built chunk by chunk straight into the cache
+    files.  Returns None when the cache is disabled, the matrix would exceed
+    max_mb, or the cache is unusable.
+    """
+    if not cache_dir:
+        return None
+    k = max(4, min(k, len(pts)))
+    idx_dtype = np.uint16 if len(pts) <= 0xFFFF else np.int32
+    mb = w * h * k * (np.dtype(idx_dtype).itemsize + 2) / 2**20
+    if mb > max_mb:
+        print(f"INFO: IDW weight cache skipped ({w}x{h} k={k} is {mb:.0f} MB > {max_mb:g} MB)")
+        return None
+    lons_r, lats_r, _, _ = station_arrays(pts)
+    order = station_order(lons_r, lats_r)
+    if np.any(order != np.arange(len(order))):
+        # a prebuilt index is in feed order; the matrix needs canonical order
+        lons_r, lats_r, index = lons_r[order], lats_r[order], None
+    key = idw_cache_key(lons_r, lats_r, w, h, k, pwr)
+    f_idx = os.path.join(cache_dir, f"idw-{key}-idx.npy")
+    f_wts = os.path.join(cache_dir, f"idw-{key}-wts.npy")
+    try:
+        weights = np.load(f_idx, mmap_mode="r"), np.load(f_wts, mmap_mode="r"), order
+        os.utime(f_idx)
+        print(f"INFO: IDW weights reused ({key})")
+        return weights
+    except (OSError, ValueError):
+        pass
+
+    if index is None:
+        index = build_station_index(lons_r, lats_r)
+    xs_r = np.deg2rad(np.linspace(-180.0, 180.0, w, dtype=np.float64))
+    ys_r = np.deg2rad(np.linspace(90.0, -90.0, h, dtype=np.float64))
+    tmp = f".{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        m_idx = np.lib.format.open_memmap(f_idx + tmp, mode="w+", dtype=idx_dtype, shape=(h, w, k))
+        m_wts = np.lib.format.open_memmap(f_wts + tmp, mode="w+", dtype=np.float16, shape=(h, w, k))
+        for c0 in range(0, h, chunk_rows):
+            c1 = min(h, c0 + chunk_rows)
+            m_idx[c0:c1], m_wts[c0:c1] = idw_weights(index, lons_r, lats_r, xs_r, ys_r[c0:c1], k, pwr)
+        m_idx.flush()
+        m_wts.flush()
+        del m_idx, m_wts
+        os.replace(f_wts + tmp, f_wts)
+        os.replace(f_idx + tmp, f_idx)
+    except OSError as e:
+        print(f"WARN: IDW weight cache unavailable: {e}", file=sys.stderr)
+        for f in (f_idx + tmp, f_wts + tmp):
+            if os.path.exists(f):
+                os.remove(f)
+        return None
+
+    # Keep only the most recently used weight sets
+    sets = sorted(glob.glob(os.path.join(cache_dir, "idw-*-idx.npy")), key=os.path.getmtime, reverse=True)
+    for old in sets[IDW_CACHE_KEEP:]:
+        for f in (old, old[:-len("idx.npy")] + "wts.npy"):
+            if os.path.exists(f):
+                os.remove(f)
+
+    print(f"INFO: IDW weights built ({key})")
+    return np.load(f_idx, mmap_mode="r"), np.load(f_wts, mmap_mode="r"), order
+
+
+def interpolate_muf(pts: list, w: int, h: int, k: int, pwr: float,
+                    muf_min: float, muf_max: float, y0: int = 0, y1: int = None,
+                    index=None, chunk_rows: int = 40, weights=None) -> "np.ndarray":
+    """
+    IDW-on-sphere MUF field for a WxH equirectangular grid, as (H, W) float32.
+
+    y0/y1 restrict the result to rows [y0, y1) of the grid; every pixel is
+    computed independently, so bands match the corresponding rows of the
+    whole field exactly.  index is a prebuilt build_station_index() to reuse
+    across bands; weights is a whole-grid (idx, wts, order) from load_idw_weights(),
+    in which case no neighbour search is done at all.
+    """
+    lons_r, lats_r, vals, confs = station_arrays(pts)
+
+    xs_r = np.deg2rad(np.linspace(-180.0, 180.0, w, dtype=np.float64))
+    ys_r = np.deg2rad(np.linspace(90.0, -90.0, h, dtype=np.float64))
+
+    k = max(4, min(k, len(pts)))
+
+    if weights is not None:
+        vals, confs = vals[weights[2]], confs[weights[2]]
+    elif index is None:
+        index = build_station_index(lons_r, lats_r)
+
+    y1 = h if y1 is None else y1
+    out_muf = np.empty((y1 - y0, w), dtype=np.float32)
+
+    for c0 in range(y0, y1, chunk_rows):
+        c1 = min(y1, c0 + chunk_rows)
+        if weights is not None:
+            idx, wts = weights[0][c0:c1], weights[1][c0:c1]
+        else:
+            idx, wts = idw_weights(index, lons_r, lats_r, xs_r, ys_r[c0:c1], k, pwr)
+        out_muf[c0 - y0:c1 - y0, :] = apply_idw(idx, wts, vals, confs, muf_min, muf_max)
 
-        size_tag = f"{w}x{h}"
-        out_bmp = os.path.join(args.outdir, f"{prefix}-{size_tag}-{args.product}.bmp")
-        out_bmp_z = out_bmp + ".z"
-        write_bmpv4_rgb565_topdown_and_z(comp, out_bmp, out_bmp_z, zlevel=9)
+    return out_muf
 
-        if args.debug_png:
-            comp.save(os.path.join(args.outdir, f"{prefix}-{size_tag}-{args.product}.png"), format="PNG")
 
-        print(f"OK: {out_bmp_z} (stations used: {len(pts)})")
+# Rough per-pixel working set in --stream mode: overlay/colorize arrays plus,
+# per base, the RGB565 rows, decoded RGB, RGBA composite and encoded band.
+STREAM_BYTES_PER_PX = 80
+# IDW working set per pixel per neighbour (distances, indices, weights, values).
+IDW_BYTES_PER_PX_K = 48
 
-    if args.base_day:
-        render_variant("map-D", args.base_day)
-    if args.base_night:
-        render_variant("map-N", args.base_night)
 
+def stream_band_rows(w: int, k: int, max_memory_mb: float) -> tuple[int, int]:
+    """
+    Split the --max-memory-mb budget between band compositing and IDW chunks.
+
+    Returns (band_rows, chunk_rows) for a map w pixels wide.
+    """
+    budget = max(1.0, max_memory_mb) * (1 << 20) / 2
+    band_rows = max(8, int(budget // (w * STREAM_BYTES_PER_PX)))
+    chunk_rows = max(1, int(budget // (w * (IDW_BYTES_PER_PX_K * k + 64))))
+    return band_rows, chunk_rows
+
+
+def open_base_rows(path: str, band_rows: int, cache_dir: str = None):
+    """(w, h, bands) like open_bmp_v4_rgb565_rows(), served from the decoded-base cache if enabled."""
+    if not cache_dir:
+        return open_bmp_v4_rgb565_rows(path, band_rows=band_rows)
+    arr = load_bmp_v4_rgb565_cached(path, cache_dir)
+    h, w = arr.shape
+    return w, h, ((y0, arr[y0:y0 + band_rows]) for y0 in range(0, h, band_rows))
+
+
+def render_size_stream(w: int, h: int, variants: list, pts: list, field, lut, alpha: int,
+                       args, index=None, weights=None) -> bool:
+    """
+    Render every (prefix, base_path) in variants for one size, band by band.
+
+    Base rows are inflated and the outputs encoded/compressed incrementally,
+    and the MUF rows come from the canonical field (or straight from IDW when
+    field is None), so peak memory is O(w * band_rows).  Returns False when a
+    base is not a WxH BMPv4 RGB565 map; the caller then uses render_variant().
+    """
+    band_rows, chunk_rows = stream_band_rows(w, args.k, args.max_memory_mb)
+    base_lut = base_rgb565_lut()
+
+    with ExitStack() as stack:
+        readers = []
+        for prefix, base_path in variants:
+            if not base_path.endswith((".bmp", ".bmp.z")):
+                return False
+            try:
+                bw, bh, bands = open_base_rows(base_path, band_rows, args.base_cache_dir)
+            except ValueError:
+                return False
+            stack.callback(bands.close)
+            if (bw, bh) != (w, h):
+                return False
+            readers.append(bands)
+
+        writers = []
+        for prefix, _ in variants:
+            out_bmp = os.path.join(args.outdir, f"{prefix}-{w}x{h}-{args.product}.bmp")
+            writers.append(stack.enter_context(BmpV4Rgb565Writer(w, h, out_bmp, out_bmp + ".z", zlevel=9)))
+
+        for y0 in range(0, h, band_rows):
+            y1 = min(h, y0 + band_rows)
+            if field is None:
+                muf = interpolate_muf(pts, w, h, args.k, float(args.p), args.muf_min, args.muf_max,
+                                      y0=y0, y1=y1, index=index, chunk_rows=chunk_rows, weights=weights)
+            else:
+                muf = resample_field(field, w, h, y0, y1)
+            overlay = Image.fromarray(colorize_field(muf, lut, args.muf_min, alpha, MUF_LUT_STEP), mode="RGBA")
+            draw_station_markers(overlay, pts, size=(w, h), y0=y0)
+
+            for bands, writer in zip(readers, writers):
+                _, base565 = next(bands)
+                base = Image.fromarray(base_lut[base565], mode="RGB")
+                writer.write_rows(Image.alpha_composite(base.convert("RGBA"), overlay).convert("RGB"))
+
+    for prefix, _ in variants:
+        print(f"OK: {os.path.join(args.outdir, f'{prefix}-{w}x{h}-{args.product}.bmp.z')} "
+              f"(stations used: {len(pts)})")
+    return True
+
+
+FINGERPRINT_VERSION = 3  # bump when rendering changes so old fingerprints stop matching
+
+
+def file_identity(path: str):
+    """[realpath, mtime_ns, size] of a base map, or None if unset/missing."""
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.realpath(path), st.st_mtime_ns, st.st_size]
+
+
+def render_fingerprint(pts: list, jobs: list, grid: tuple, args) -> str:
+    """SHA-256 over everything that determines the output bytes of this run."""
+    doc = {
+        "version": FINGERPRINT_VERSION,
+        "stations": [list(p) for p in pts],
+        "grid": list(grid),
+        "jobs": [[w, h, file_identity(bd), file_identity(bn)] for w, h, bd, bn in jobs],
+        "params": {k: getattr(args, k) for k in ("product", "alpha", "k", "p", "muf_min", "muf_max",
+                                                  "debug_png")},
+    }
+    return hashlib.sha256(json.dumps(doc, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def expected_outputs(jobs: list, args) -> list:
+    return [os.path.join(args.outdir, f"{pfx}-{w}x{h}-{args.product}.bmp{ext}")
+            for w, h, bd, bn in jobs for pfx, b in (("map-D", bd), ("map-N", bn)) if b
+            for ext in ("", ".z")]
+
+
+def fingerprint_path(args) -> str:
+    return os.path.join(args.outdir, f".{args.product}.fingerprint")
+
+
+def read_fingerprint(args) -> str:
+    try:
+        with open(fingerprint_path(args), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def write_fingerprint(args, fp: str) -> None:
+    path = fingerprint_path(args)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(fp + "\n")
+    os.replace(tmp, path)
+
+
+def render_size(w: int, h: int, variants: list, pts: list, field, lut, alpha: int, args,
+                index=None, chunk_rows: int = 40, weights=None) -> None:
+    """
+    Render every (prefix, base_path) in variants at WxH from the canonical field.
+
+    field may be None only when WxH is the canonical grid (--stream computes
+    it band by band); it is then interpolated here if the whole-image path is
+    needed after all.
+    """
+    if args.stream:
+        if render_size_stream(w, h, variants, pts, field, lut, alpha, args, index=index, weights=weights):
+            return
+        print(f"WARN: base for {w}x{h} is not a {w}x{h} BMPv4 map; rendering whole image", file=sys.stderr)
+        if field is None:
+            field = interpolate_muf(pts, w, h, args.k, float(args.p), args.muf_min, args.muf_max,
+                                    index=index, chunk_rows=chunk_rows, weights=weights)
+
+    # Build overlay RGBA: heatmap + station marks (no base yet)
+    out_muf = resample_field(field, w, h)
+    overlay = Image.fromarray(colorize_field(out_muf, lut, args.muf_min, alpha, MUF_LUT_STEP), mode="RGBA")
+    draw_station_markers(overlay, pts)
+
+    for prefix, base_path in variants:
+        render_variant(prefix, base_path, overlay, args, len(pts))
+
+
+# Per-worker state for --jobs, set up once by _pool_init()
+_POOL = {}
+
+
+def _attach_shm(name: str) -> shared_memory.SharedMemory:
+    """
+    Map an existing block without registering it with the resource tracker;
+    the creating process owns (and unlinks) it.
+
+    Before 3.13 attaching always registers.  Pool workers share the parent's
+    tracker, so unregistering afterwards would drop the parent's entry too;
+    the registration is skipped instead (workers attach single-threaded).
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *a, **kw: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _pool_init(shm_name: str, shape: tuple, pts: list, lut, alpha: int, args) -> None:
+    # The pool is the parallelism: a per-worker ParallelDeflate thread pool
+    # would run jobs x cpu_count threads
+    lib_bmp565.DEFLATE_BACKEND = "zlib"
+    shm = _attach_shm(shm_name)
+    _POOL.update(shm=shm, field=np.ndarray(shape, dtype=np.float32, buffer=shm.buf),
+                 pts=pts, lut=lut, alpha=alpha, args=args)
+
+
+def _pool_render(w: int, h: int, prefix: str, base_path: str) -> None:
+    """One (size, D/N) task in a worker."""
+    render_size(w, h, [(prefix, base_path)], _POOL["pts"], _POOL["field"], _POOL["lut"],
+                _POOL["alpha"], _POOL["args"])
+
+
+def render_parallel(jobs: list, pts: list, field, lut, alpha: int, args) -> None:
+    """
+    Fan (size, D/N) tasks out to args.jobs processes.
+
+    The field is copied once into a shared-memory block that workers map
+    read-only, so only the small task tuples are pickled.  Workers deflate
+    single-threaded.
+    """
+    tasks = [(w, h, pfx, b) for w, h, bd, bn in jobs for pfx, b in (("map-D", bd), ("map-N", bn)) if b]
+    shm = shared_memory.SharedMemory(create=True, size=field.nbytes)
+    try:
+        np.ndarray(field.shape, dtype=np.float32, buffer=shm.buf)[:] = field
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(tasks)), initializer=_pool_init,
+                                 initargs=(shm.name, field.shape, pts, lut, alpha, args)) as pool:
+            list(pool.map(_pool_render, *zip(*tasks)))
+        wall = time.perf_counter() - t0
+    finally:
+        shm.close()
+        shm.unlink()
+    print(f"INFO: {len(tasks)} maps with --jobs {args.jobs}: {wall:.2f}s wall")
+
+
+def render_variant(prefix: str, base_path: str, overlay: Image.Image, args, n_stations: int) -> None:
+    w, h = overlay.size
+    base = load_base_map(base_path, args.base_cache_dir)
+    if base.size != (w, h):
+        base = base.resize((w, h), resample=Image.BILINEAR)
+
+    comp = Image.alpha_composite(base.convert("RGBA"), overlay).convert("RGB")
+
+    size_tag = f"{w}x{h}"
+    out_bmp = os.path.join(args.outdir, f"{prefix}-{size_tag}-{args.product}.bmp")
+    out_bmp_z = out_bmp + ".z"
+    write_bmpv4_rgb565_topdown_and_z(comp, out_bmp, out_bmp_z, zlevel=9)
+
+    if args.debug_png:
+        comp.save(os.path.join(args.outdir, f"{prefix}-{size_tag}-{args.product}.png"), format="PNG")
+
+    print(f"OK: {out_bmp_z} (stations used: {n_stations})")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--width", type=int)
+    ap.add_argument("--height", type=int)
+
+    # Day/night bases:
+    ap.add_argument("--base-day", help="Countries Day base (.bmp|.bmp.z|.png)")
+    ap.add_argument("--base-night", help="Countries Night base (.bmp|.bmp.z|.png)")
+
+    # Multi-size mode: one fetch + one interpolation, resampled to every size
+    ap.add_argument("--sizes", help="comma-separated WxH list (OHB_SIZES format); replaces --width/--height")
+    ap.add_argument("--basedir", help="directory holding map-{D,N}-<WxH>-Countries.bmp.z (with --sizes)")
+    ap.add_argument("--grid", default="1980x990",
+                    help="canonical interpolation grid for --sizes (capped at the largest size)")
+
+    ap.add_argument("--outdir", required=True)
+    ap.add_argument("--product", default="MUF-RT")
+
+    ap.add_argument("--alpha", type=float, default=0.55, help="heatmap opacity 0..1")
+    ap.add_argument("--active-seconds", type=int, default=3600)
+    ap.add_argument("--min-confidence", type=float, default=0.0)
+    ap.add_argument("--k", type=int, default=24)
+    ap.add_argument("--p", type=float, default=2.0)
+    ap.add_argument("--muf-min", type=float, default=0.0)
+    ap.add_argument("--muf-max", type=float, default=35.0)
+    ap.add_argument("--stations-url", default=KC2G_STATIONS_JSON)
+    ap.add_argument("--debug-png", action="store_true")
+    ap.add_argument("--force", action="store_true", help="render even if the input fingerprint is unchanged")
+
+    # Memory-bounded rendering (byte-identical output)
+    ap.add_argument("--stream", action="store_true",
+                    help="render in horizontal bands instead of whole images")
+    ap.add_argument("--max-memory-mb", type=float, default=64.0,
+                    help="approximate working-set budget that sizes --stream bands")
+    ap.add_argument("--base-cache-dir", default=BASE_CACHE_DIR if np is not None else "",
+                    help="decoded base-map cache (memory-mapped .npy); empty string disables")
+    ap.add_argument("--idw-cache-dir", default="",
+                    help="cache IDW weight matrices here, keyed by station set (default: off)")
+    ap.add_argument("--idw-cache-max-mb", type=float, default=IDW_CACHE_MAX_MB,
+                    help="do not cache weight matrices larger than this")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="worker processes for the per-size D/N renders (1 = serial)")
+    args = ap.parse_args()
+
+    if np is None:
+        print("ERROR: numpy is required for reasonable performance. Try: apt install python3-numpy", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.outdir, exist_ok=True)
+
+    # Work list: [(w, h, base_day, base_night)]
+    if args.sizes:
+        if not args.basedir:
+            print("ERROR: --sizes requires --basedir", file=sys.stderr)
+            return 2
+        try:
+            sizes = parse_sizes(args.sizes)
+            grid_w, grid_h = parse_sizes(args.grid)[0]
+        except (ValueError, IndexError) as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 2
+        jobs = []
+        for w, h in sizes:
+            base_day = os.path.join(args.basedir, f"map-D-{w}x{h}-Countries.bmp.z")
+            base_night = os.path.join(args.basedir, f"map-N-{w}x{h}-Countries.bmp.z")
+            missing = [b for b in (base_day, base_night) if not os.path.isfile(b)]
+            if missing:
+                print(f"WARN: missing base {missing[0]}; skipping {w}x{h}", file=sys.stderr)
+                continue
+            jobs.append((w, h, base_day, base_night))
+        if not jobs:
+            print("ERROR: no sizes left to render", file=sys.stderr)
+            return 2
+        big_w, big_h = max((j[0], j[1]) for j in jobs)
+        if grid_w > big_w:
+            grid_w, grid_h = big_w, big_h
+    else:
+        if not args.width or not args.height:
+            print("ERROR: Provide --width/--height or --sizes", file=sys.stderr)
+            return 2
+        if not args.base_day and not args.base_night:
+            print("ERROR: Provide at least one of --base-day or --base-night", file=sys.stderr)
+            return 2
+        jobs = [(args.width, args.height, args.base_day, args.base_night)]
+        grid_w, grid_h = args.width, args.height
+
+    # Fetch stations (once for all sizes)
+    stations = json.loads(http_get(args.stations_url).decode("utf-8", errors="replace"))
+    pts = filter_stations(stations, time.time(), args.active_seconds, args.min_confidence)
+
+    if len(pts) < 4:
+        print(f"ERROR: only {len(pts)} active stations found; refusing to render.", file=sys.stderr)
+        return 2
+
+    if args.stream and args.debug_png:
+        print("WARN: --debug-png is ignored with --stream", file=sys.stderr)
+        args.debug_png = False
+
+    # Skip the whole render when nothing that affects the output has changed
+    fp = render_fingerprint(pts, jobs, (grid_w, grid_h), args)
+    outputs = expected_outputs(jobs, args)
+    if not args.force and fp == read_fingerprint(args) and all(os.path.isfile(o) for o in outputs):
+        print(f"SKIP: inputs unchanged (fingerprint {fp[:12]}, stations: {len(pts)}); "
+              f"{len(outputs)} files up to date")
+        return 0
+    print(f"INFO: rendering (fingerprint {fp[:12]}, stations: {len(pts)})")
+
+    # Interpolate once on the canonical grid.  When streaming a size that is
+    # the grid itself, the field is produced band by band instead (serial only;
+    # --jobs workers share one precomputed field).
+    # With an unchanged station layout the neighbour search is skipped and
+    # the cached IDW matrix is applied to the new values.
+    field = None
+    chunk_rows = stream_band_rows(grid_w, args.k, args.max_memory_mb)[1] if args.stream else 40
+    lons_r, lats_r, _, _ = station_arrays(pts)
+    index = build_station_index(lons_r, lats_r)
+    weights = load_idw_weights(pts, grid_w, grid_h, args.k, float(args.p), args.idw_cache_dir,
+                               index=index, chunk_rows=chunk_rows, max_mb=args.idw_cache_max_mb)
+    if not args.stream or args.jobs > 1 or any((w, h) != (grid_w, grid_h) for w, h, _, _ in jobs):
+        field = interpolate_muf(pts, grid_w, grid_h, args.k, float(args.p), args.muf_min, args.muf_max,
+                                index=index, chunk_rows=chunk_rows, weights=weights)
+
+    a = int(round(max(0.0, min(1.0, args.alpha)) * 255))
+    lut = build_muf_lut(args.muf_min, args.muf_max)
+
+    if args.jobs > 1:
+        render_parallel(jobs, pts, field, lut, a, args)
+    else:
+        for w, h, base_day, base_night in jobs:
+            variants = [(pfx, b) for pfx, b in (("map-D", base_day), ("map-N", base_night)) if b]
+            render_size(w, h, variants, pts, field, lut, a, args, index=index, chunk_rows=chunk_rows,
+                        weights=weights)
+
+    write_fingerprint(args, fp)
     return 0
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Build VOACAP area-coverage maps: band score for every RX location from one TX.
+
+  - evaluate dvoacap from the TX to every cell of a coarse global RX grid
+    (--grid-step degrees), for every band and each requested UTC hour, with
+    the RX rows spread over a pool of --jobs worker processes
+  - score each cell like voacap_bandconditions.py (sigmoid(snr_xx) * muf_day^N)
+  - bilinearly upsample each band's score grid to every size in --sizes
+  - colour it, composite onto the Day and Night Countries base maps and write
+    BMPv4 RGB565 top-down .bmp.z via lib_bmp565.py
+
+The raw grid ([snr_xx, muf_day] per band and cell) is cached per UTC hour in
+--cache-dir, keyed by the TX Maidenhead cell (--tx-grid), month and SSN
+bucket (--ssn-step) plus the circuit settings, so any later request that
+lands in the same cell/month/bucket renders without running dvoacap.
+Entries not used for --cache-max-age days are removed after each run.
+
+A cell whose dvoacap run raises is given the no-signal value (band closed)
+and counted in a WARN line, so one bad path does not lose the whole map.
+
+Output: <outdir>/map-{D,N}-<WxH>-<product>-<band>m-<HH>Z.bmp.z
+
+Usage:
+  build_voacap_area.py --txlat 28.15 --txlng -80.64 --hours all \\
+      --sizes 660x330,1320x660 --basedir .../maps --outdir .../maps/voacap --jobs 4
+
+Dependencies: python3, pillow, numpy, dvoacap (same as voacap_bandconditions.py)
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image
+
+import voacap_bandconditions as vb
+from lib_bmp565 import BASE_CACHE_DIR, write_bmp_v4_rgb565_topdown
+from lib_maprender import colorize_field, load_base_map, parse_sizes, resample_field
+
+BASE = "/opt/hamclock-backend"
+MAP_DIR = f"{BASE}/htdocs/ham/HamClock/maps"
+CACHE_DIR = f"{BASE}/cache/voacap-area"
+CACHE_MAX_AGE_DAYS = 35.0  # entries are per month, so older ones are only reused a year later
+SSN_FILE = f"{BASE}/htdocs/ham/HamClock/ssn/ssn-31.txt"
+
+REL_LUT_STEP = 0.01  # score per colormap LUT entry
+
+
+def rel_colormap(score: float) -> tuple[int, int, int]:
+    """Closed bands dark blue through marginal yellow to solid green."""
+    stops = [
+        (0.00, (0, 0, 80)),
+        (0.10, (40, 0, 160)),
+        (0.30, (200, 0, 60)),
+        (0.50, (255, 140, 0)),
+        (0.70, (240, 230, 0)),
+        (0.85, (120, 220, 0)),
+        (1.00, (0, 200, 60)),
+    ]
+    for (x0, c0), (x1, c1) in zip(stops, stops[1:]):
+        if score <= x1:
+            t = max(0.0, (score - x0) / (x1 - x0))
+            return tuple(int(round(a + t * (b - a))) for a, b in zip(c0, c1))
+    return stops[-1][1]
+
+
+def build_rel_lut() -> np.ndarray:
+    n = int(round(1.0 / REL_LUT_STEP)) + 1
+    return np.array([rel_colormap(i * REL_LUT_STEP) for i in range(n)], dtype=np.uint8)
+
+
+def rx_grid(step: float) -> tuple[np.ndarray, np.ndarray]:
+    """Cell latitudes 90..-90 and longitudes -180..180 edge to edge, as resample_field() expects."""
+    nlat = int(round(180.0 / step)) + 1
+    nlon = int(round(360.0 / step)) + 1
+    return np.linspace(90.0, -90.0, nlat), np.linspace(-180.0, 180.0, nlon)
+
+
+def area_cache_key(circuit: argparse.Namespace, step: float) -> str:
+    """TX cell, month, SSN bucket, circuit settings and model constants; the year does not enter dvoacap."""
+    obj = {
+        "tx": (circuit.txlat, circuit.txlng),
+        "month": int(circuit.month),
+        "ssn": float(circuit.ssn),
+        "pow": int(circuit.pow),
+        "path": int(circuit.path),
+        "toa": float(circuit.toa),
+        "step": float(step),
+        "freqs": vb.FREQS_MHZ,
+        "req_snr": vb.CW_REQUIRED_SNR,
+        "req_rel": vb.CW_REQUIRED_RELIABILITY,
+        "noise": vb.MAN_MADE_NOISE,
+    }
+    s = json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(s).hexdigest()
+
+
+# Per-worker engine, created once by _pool_init()
+_ENGINE = None
+
+
+def _pool_init() -> None:
+    global _ENGINE
+    _ENGINE = vb.PredictionEngine()
+
+
+def _grid_row(params: dict, lat: float, lons: np.ndarray, hours: list) -> np.ndarray:
+    """(hours, 2, bands, lons) [snr_xx, muf_day] for one RX latitude row."""
+    eng = vb.configure_engine(_ENGINE, argparse.Namespace(**params))
+    out = np.empty((len(hours), 2, len(vb.FREQS_MHZ), len(lons)), dtype=np.float32)
+    failed, err = 0, None
+    for j, lon in enumerate(lons):
+        rx = vb.GeoPoint.from_degrees(float(lat), float(lon))
+        for i, h in enumerate(hours):
+            try:
+                out[i, :, :, j] = vb.hour_inputs(eng, rx, h)
+            except Exception as e:
+                # no signal: NaN snr_xx and muf_day 0 score 0 (band closed)
+                out[i, 0, :, j] = np.nan
+                out[i, 1, :, j] = 0.0
+                failed, err = failed + 1, e
+    if failed:
+        print(f"WARN: lat {lat:g}: {failed} cell-hour(s) failed, drawn as no signal (last: {err})",
+              file=sys.stderr)
+    return out
+
+
+def compute_grid(circuit: argparse.Namespace, hours: list, step: float, jobs: int) -> np.ndarray:
+    """(hours, 2, bands, nlat, nlon) dvoacap inputs over the RX grid, one latitude row per task."""
+    lats, lons = rx_grid(step)
+    # lon +180 is lon -180: compute it once and copy
+    lons_c = lons[:-1]
+    params = dict(vars(circuit))
+    grid = np.empty((len(hours), 2, len(vb.FREQS_MHZ), len(lats), len(lons)), dtype=np.float32)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_pool_init) as ex:
+            rows = ex.map(_grid_row, [params] * len(lats), lats, [lons_c] * len(lats), [hours] * len(lats))
+            for r, row in enumerate(rows):
+                grid[:, :, :, r, :-1] = row
+    else:
+        _pool_init()
+        for r, lat in enumerate(lats):
+            grid[:, :, :, r, :-1] = _grid_row(params, lat, lons_c, hours)
+    grid[..., -1] = grid[..., 0]
+    return grid
+
+
+def load_grids(circuit: argparse.Namespace, hours: list, step: float, jobs: int, cache_dir: str) -> dict:
+    """{hour: (2, bands, nlat, nlon)} from the cache, computing only the missing hours."""
+    key = area_cache_key(circuit, step)
+    d = os.path.join(cache_dir, key[:2], key) if cache_dir else ""
+    out, missing = {}, []
+    for h in hours:
+        try:
+            out[h] = np.load(os.path.join(d, f"h{h:02d}.npy")) if d else None
+        except (OSError, ValueError):
+            out[h] = None
+        if out[h] is None:
+            missing.append(h)
+    if missing:
+        t0 = time.perf_counter()
+        grid = compute_grid(circuit, missing, step, jobs)
+        print(f"INFO: computed {len(missing)} hour(s) x {grid.shape[-2]}x{grid.shape[-1]} RX cells "
+              f"in {time.perf_counter() - t0:.1f}s (jobs={jobs})")
+        for i, h in enumerate(missing):
+            out[h] = grid[i]
+            if d:
+                try:
+                    os.makedirs(d, exist_ok=True)
+                    tmp = os.path.join(d, f".h{h:02d}.{os.getpid()}.npy")
+                    np.save(tmp, grid[i])
+                    os.replace(tmp, os.path.join(d, f"h{h:02d}.npy"))
+                except OSError as e:
+                    print(f"WARN: cache write failed: {e}", file=sys.stderr)
+    else:
+        print(f"INFO: cache hit {key[:12]} for {len(hours)} hour(s)")
+        try:
+            os.utime(d)  # last use, for prune_cache()
+        except OSError:
+            pass
+    return out
+
+
+def prune_cache(cache_dir: str, max_age_days: float) -> None:
+    """Remove grid cache entries not written or hit for max_age_days."""
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for d in glob.glob(os.path.join(cache_dir, "??", "*")):
+        try:
+            if os.path.getmtime(d) < cutoff:
+                shutil.rmtree(d)
+                removed += 1
+        except OSError as e:
+            print(f"WARN: cache prune: {e}", file=sys.stderr)
+    if removed:
+        print(f"INFO: pruned {removed} cache entr{'y' if removed == 1 else 'ies'} "
+              f"older than {max_age_days:g} days")
+
+
+def render_hour(scores: np.ndarray, hour: int, bands: list, jobs_sizes: list, lut: np.ndarray,
+                alpha: int, args) -> None:
+    """Write D/N maps of every band in bands at every size for one hour's (bands, nlat, nlon) scores."""
+    for w, h, base_day, base_night in jobs_sizes:
+        bases = []
+        for pfx, path in (("map-D", base_day), ("map-N", base_night)):
+            base = load_base_map(path, args.base_cache_dir)
+            if base.size != (w, h):
+                base = base.resize((w, h), resample=Image.BILINEAR)
+            bases.append((pfx, base.convert("RGBA")))
+        for b in bands:
+            field = resample_field(scores[vb.BANDS.index(b)], w, h)
+            overlay = Image.fromarray(colorize_field(field, lut, 0.0, alpha, REL_LUT_STEP), mode="RGBA")
+            for pfx, base in bases:
+                comp = Image.alpha_composite(base, overlay).convert("RGB")
+                out = os.path.join(args.outdir, f"{pfx}-{w}x{h}-{args.product}-{b}m-{hour:02d}Z.bmp.z")
+                write_bmp_v4_rgb565_topdown(comp, out_bmp_z=out, zlevel=9)
+                print(f"OK: {out}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="VOACAP area-coverage maps for one TX")
+    ap.add_argument("--txlat", type=float, required=True)
+    ap.add_argument("--txlng", type=float, required=True)
+    ap.add_argument("--month", type=int, default=None, help="default: current UTC month")
+    ap.add_argument("--ssn", type=float, default=None, help="default: mean of --ssn-file")
+    ap.add_argument("--ssn-file", default=SSN_FILE)
+    ap.add_argument("--hours", default=None, help="comma list of UTC hours or 'all' (default: current hour)")
+    ap.add_argument("--bands", default=",".join(vb.BANDS), help="comma list of " + ",".join(vb.BANDS))
+    ap.add_argument("--pow", type=int, default=100)
+    ap.add_argument("--path", type=int, default=0)
+    ap.add_argument("--toa", type=float, default=3.0)
+    ap.add_argument("--grid-step", type=float, default=5.0, help="RX grid spacing, degrees")
+    # Defaults measured with voacap_quant_error.py (60 circuits): subsquare + SSN step 2 gives
+    # score error p99 0.01 / mean 0.001; square is p99 0.15 and SSN step 10 alone p99 0.10
+    ap.add_argument("--tx-grid", choices=sorted(vb.QUANT_GRIDS), default="subsquare",
+                    help="Maidenhead cell the TX is snapped to for caching")
+    ap.add_argument("--ssn-step", type=float, default=2.0, help="SSN bucket size for caching")
+    ap.add_argument("--sizes", default=None, help="comma-separated WxH list (default: map_sizes.txt)")
+    ap.add_argument("--basedir", default=MAP_DIR, help="directory holding map-{D,N}-<WxH>-Countries.bmp.z")
+    ap.add_argument("--outdir", default=os.path.join(MAP_DIR, "voacap"))
+    ap.add_argument("--product", default="VOACAP")
+    ap.add_argument("--alpha", type=float, default=0.55, help="overlay opacity 0..1")
+    ap.add_argument("--cache-dir", default=CACHE_DIR, help="RX grid cache; empty string disables")
+    ap.add_argument("--cache-max-age", type=float, default=CACHE_MAX_AGE_DAYS,
+                    help="days an unused RX grid cache entry is kept")
+    ap.add_argument("--base-cache-dir", default=BASE_CACHE_DIR,
+                    help="decoded base-map cache (memory-mapped .npy); empty string disables")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                    help="worker processes for the RX grid (1 = serial)")
+    args = ap.parse_args()
+
+    now = datetime.now(timezone.utc)
+    if args.hours in (None, ""):
+        hours = [now.hour]
+    elif args.hours == "all":
+        hours = list(range(24))
+    else:
+        hours = sorted({int(h) % 24 for h in args.hours.split(",")})
+    bands = [b.strip().removesuffix("m") for b in args.bands.split(",") if b.strip()]
+    bad = [b for b in bands if b not in vb.BANDS]
+    if bad:
+        print(f"ERROR: unknown band(s) {','.join(bad)}; choose from {','.join(vb.BANDS)}", file=sys.stderr)
+        return 2
+
+    if args.sizes is None:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "map_sizes.txt")) as f:
+            args.sizes = ",".join(ln.strip() for ln in f if ln.strip() and not ln.lstrip().startswith("#"))
+    try:
+        sizes = parse_sizes(args.sizes)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    jobs_sizes = []
+    for w, h in sizes:
+        base_day = os.path.join(args.basedir, f"map-D-{w}x{h}-Countries.bmp.z")
+        base_night = os.path.join(args.basedir, f"map-N-{w}x{h}-Countries.bmp.z")
+        missing = [b for b in (base_day, base_night) if not os.path.isfile(b)]
+        if missing:
+            print(f"WARN: missing base {missing[0]}; skipping {w}x{h}", file=sys.stderr)
+            continue
+        jobs_sizes.append((w, h, base_day, base_night))
+    if not jobs_sizes:
+        print("ERROR: no sizes left to render", file=sys.stderr)
+        return 2
+
+    if args.ssn is None:
+        import voacap_bandserver
+        args.ssn = round(voacap_bandserver.current_ssn(args.ssn_file))
+    request = argparse.Namespace(
+        year=now.year, month=args.month or now.month, ssn=args.ssn,
+        txlat=args.txlat, txlng=args.txlng, rxlat=args.txlat, rxlng=args.txlng,
+        rx_default_lat=None, rx_default_lon=None,
+        pow=args.pow, path=args.path, toa=args.toa, mode=19,
+    )
+    circuit = vb.canonical_args(request, args.tx_grid, args.ssn_step)
+    print(f"INFO: TX cell {circuit.txlat:.3f},{circuit.txlng:.3f} month {circuit.month} "
+          f"SSN bucket {circuit.ssn:g} hours {','.join(map(str, hours))}")
+
+    os.makedirs(args.outdir, exist_ok=True)
+    grids = load_grids(circuit, hours, args.grid_step, max(1, args.jobs), args.cache_dir)
+    if args.cache_dir:
+        prune_cache(args.cache_dir, args.cache_max_age)
+
+    lut = build_rel_lut()
+    a = int(round(max(0.0, min(1.0, args.alpha)) * 255))
+    for hr in hours:
+        scores = vb.score_array(grids[hr][0], grids[hr][1]).astype(np.float32)
+        render_hour(scores, hr, bands, jobs_sizes, lut, a, args)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
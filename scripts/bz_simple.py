@@ -1,12 +1,26 @@
 #!/usr/bin/env python3
 
-import requests
+import json
+import os
 import time
 from datetime import datetime, timezone
 
-URL = "https://services.swpc.noaa.gov/products/solar-wind/mag-3-day.json"
+import numpy as np
+
+from lib_resample import at_or_before
+from lib_ringbuf import RING_DIR, RingSeries
+from lib_upstream import fetch, output_mtime
+
+URL = "https://services.swpc.noaa.gov/products/solar-wind/mag-2-hour.json"
+SEED_URL = "https://services.swpc.noaa.gov/products/solar-wind/mag-3-day.json"
 OUT = "/opt/hamclock-backend/htdocs/ham/HamClock/Bz/Bz.txt"
 
+# History lives in a ring buffer (lib_ringbuf.py) fed from the 2-hour product;
+# the 3-day product only seeds it when empty or older than the 2-hour window.
+RING = f"{RING_DIR}/mag.ring"   # bx, by, bz, bt
+RING_CAPACITY = 4320            # 3 days @ 1 minute
+SHORT_SPAN = 2 * 3600 - 900
+
 BZBT_NV = 150          # 25 hours @ 10 minutes
 STEP = 600            # seconds
 
@@ -20,63 +34,56 @@ def iso_to_epoch(s):
 
 def main():
 
-    r = requests.get(URL, timeout=30)
-    r.raise_for_status()
+    with RingSeries(RING, 4, RING_CAPACITY) as ring:
+        seed = ring.last is None or time.time() - ring.last > SHORT_SPAN
 
-    data = r.json()
+        # Body unchanged since Bz.txt was written: keep it as is
+        body = fetch(SEED_URL if seed else URL, timeout=30, since=None if seed else output_mtime(OUT))
+        if body is None:
+            return
 
-    # Drop header row
-    rows = data[1:]
+        data = json.loads(body)
 
-    samples = []
-    for d in rows:
-        try:
-            t = iso_to_epoch(d[0])
-            bx = float(d[1])
-            by = float(d[2])
-            bz = float(d[3])
-            bt = float(d[6])
-            samples.append((t, bx, by, bz, bt))
-        except:
-            continue
+        # Drop header row
+        rows = data[1:]
 
-    if not samples:
-        raise SystemExit("No usable samples")
-
-    # sort ascending
-    samples.sort()
+        samples = []
+        for d in rows:
+            try:
+                t = iso_to_epoch(d[0])
+                bx = float(d[1])
+                by = float(d[2])
+                bz = float(d[3])
+                bt = float(d[6])
+                samples.append((t, bx, by, bz, bt))
+            except:
+                continue
 
-    # map by epoch
-    samp = {t:(bx,by,bz,bt) for t,bx,by,bz,bt in samples}
+        if samples:
+            ring.append([s[0] for s in samples], [s[1:] for s in samples])
+        t, v = ring.read()
 
-    oldest = samples[0][0]
+    if not len(t):
+        raise SystemExit("No usable samples")
 
+    # BZBT_NV bins ending at the current one, oldest first, none before the
+    # oldest sample; each takes the closest sample <= bin (t is ascending)
     now = int(time.time())
-    t = (now // STEP) * STEP
-
-    buffer = []
-
-    while len(buffer) < BZBT_NV and t >= oldest:
-
-        # closest sample <= bin
-        keys = [k for k in samp.keys() if k <= t]
-        if keys:
-            k = max(keys)
-            bx,by,bz,bt = samp[k]
-            buffer.append((t,bx,by,bz,bt))
-
-        t -= STEP
+    bins = (now // STEP) * STEP - STEP * np.arange(BZBT_NV - 1, -1, -1)
+    bins = bins[bins >= t[0]]
+    _, vals = at_or_before(t, v, bins)
+    buffer = [(int(b), *map(float, row)) for b, row in zip(bins, vals)]
 
     if len(buffer) < BZBT_NV:
         print(f"WARNING: only produced {len(buffer)} rows")
 
-    # newest->oldest → oldest->newest
-    buffer.reverse()
-
-    with open(OUT, "w") as f:
+    # Atomic: a half-written Bz.txt would look current to the next run
+    tmp = OUT + ".tmp"
+    with open(tmp, "w") as f:
         f.write("# UNIX        Bx     By     Bz     Bt\n")
         for t,bx,by,bz,bt in buffer:
             f.write(f"{t:10d} {bx:8.2f} {by:8.2f} {bz:8.2f} {bt:8.2f}\n")
+    os.replace(tmp, OUT)
 
 
 if __name__ == "__main__":
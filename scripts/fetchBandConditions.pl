@@ -1,8 +1,10 @@
 #!/usr/bin/env perl
 use strict;
 use warnings;
-use Fcntl qw(:DEFAULT);
+use Fcntl qw(:DEFAULT :flock);
 use File::Spec;
+use Digest::MD5 qw(md5_hex);
+use Time::HiRes qw(sleep);
 
 my $VOACAP_DIR = "/opt/hamclock-backend/itshfbc";
 my $RUN_DIR    = "/opt/hamclock-backend/itshfbc/run";
@@ -14,6 +16,22 @@ my $DEFAULT_TOA   = 3.0;
 my $DEFAULT_POW_W = 100.0;
 my $DEFAULT_MODE  = 19.0;
 
+# Single-flight: identical requests (same circuit cards, whatever the
+# COMMENT/LABEL text) arriving together run voacapl once; the others find the
+# circuit already queued and reuse its REL rows.
+my $SHARE_DIR = "$RUN_DIR/shared";
+my $SHARE_TTL = 60;     # seconds a computed deck's rows may be reused
+my $SHARE_GC  = 3600;   # lock/rows files idle this long are removed
+
+# Batching: circuits that miss are queued in $BATCH_DIR/pending; whoever holds
+# the leader lock gathers the queue into one multi-circuit deck, runs voacapl
+# once, publishes every circuit's rows to $SHARE_DIR and only then dequeues
+# them, so a circuit is pending until its rows (or failure) exist.
+my $BATCH_DIR    = "$RUN_DIR/batch";
+my $BATCH_WINDOW = 0.2;   # seconds a new leader waits for more circuits
+my $BATCH_MAX    = 32;    # circuits per deck
+my $BATCH_WAIT   = 90;    # seconds a queued request waits before running alone
+
 my $FREQ_CARD = "FREQUENCY  3.60 5.30 7.10 10.10 14.10 18.10 21.20 24.95 28.40 0.00 0.00\n";
 
 if (!-d $RUN_DIR) {
@@ -139,7 +157,7 @@ sub fmt_row9 {
     return join(",", map { sprintf("%.2f", $_) } @$arrref[0..8]);
 }
 
-sub parse_rel_rows {
+sub all_rel_rows {
     my ($out_text) = @_;
     my @all;
     for my $line (split /\n/, $out_text) {
@@ -148,10 +166,215 @@ sub parse_rel_rows {
         next unless @nums >= 9;
         push @all, [ @nums[0..8] ];
     }
+    return @all;
+}
+
+sub parse_rel_rows {
+    my @all = all_rel_rows(@_);
     return () if @all < 24;
     return @all[@all-24 .. @all-1];
 }
 
+# REL rows of an n-circuit deck, one [24 rows] group per EXECUTE in deck order
+sub parse_rel_groups {
+    my ($out_text, $n) = @_;
+    return ([ parse_rel_rows($out_text) ]) if $n == 1;
+    my @all = all_rel_rows($out_text);
+    return () if @all != 24 * $n;
+    return map { [ @all[24*$_ .. 24*$_ + 23] ] } 0 .. $n-1;
+}
+
+sub read_shared_rows {
+    my ($path) = @_;
+    my @st = stat($path);
+    return () if !@st || time() - $st[9] > $SHARE_TTL;
+    my ($txt) = read_entire_file($path);
+    return () if !defined $txt;
+    my @rows = map { [ split /,/ ] } grep { /\S/ } split /\n/, $txt;
+    return () if @rows != 24 || grep { @$_ != 9 } @rows;
+    return @rows;
+}
+
+sub write_shared_rows {
+    my ($path, $rows) = @_;
+    my $tmp = "$path.$$";
+    open(my $fh, '>', $tmp) or return;
+    print {$fh} join(",", @$_), "\n" for @$rows;
+    close($fh) or return unlink($tmp);
+    rename($tmp, $path) or unlink($tmp);
+}
+
+# Counters of voacapl work avoided, kept in $SHARE_DIR/<name>.count:
+#   saved   - requests answered from another request's run (single-flight)
+#   batched - voacapl starts avoided by multi-circuit decks
+sub bump_count {
+    my ($name, $by) = @_;
+    my $path = File::Spec->catfile($SHARE_DIR, "$name.count");
+    sysopen(my $fh, $path, O_RDWR|O_CREAT, 0644) or return;
+    flock($fh, LOCK_EX) or return;
+    my $n = <$fh> // 0;
+    seek($fh, 0, 0);
+    truncate($fh, 0);
+    print {$fh} (int($n) + ($by // 1)), "\n";
+    close($fh);
+}
+
+sub gc_shared {
+    opendir(my $dh, $SHARE_DIR) or return;
+    for my $f (readdir $dh) {
+        next unless $f =~ /^[0-9a-f]{32}\.(?:lock|rows|fail)$/;
+        my $p = File::Spec->catfile($SHARE_DIR, $f);
+        my @st = stat($p);
+        unlink $p if @st && time() - $st[9] > $SHARE_GC;
+    }
+    closedir($dh);
+}
+
+# Run one deck of $n circuits; returns ([groups of 24 REL rows], undef) or (undef, error)
+sub run_deck {
+    my ($dat, $n) = @_;
+
+    my $base = unique_base_8() // return (undef, "Unable to allocate unique temp filenames");
+    my $dat_name = "$base.DAT";
+    my $out_name = "$base.OUT";
+    my $dat_path = File::Spec->catfile($RUN_DIR, $dat_name);
+    my $out_path = File::Spec->catfile($RUN_DIR, $out_name);
+
+    my ($ok, $err) = safe_write_file($dat_path, $dat);
+    return (undef, "Failed to write DAT file: $err") if !$ok;
+
+    chdir($RUN_DIR) or do {
+        unlink $dat_path;
+        return (undef, "chdir($RUN_DIR) failed: $!");
+    };
+
+    $ENV{LC_ALL} = "C";
+    $ENV{LANG}   = "C";
+
+    my @cmd = ($VOACAPL, "-s", $VOACAP_DIR, $dat_name, $out_name);
+    system(@cmd);
+    my $rc = $? >> 8;
+
+    # Failed decks are left in RUN_DIR for diagnosis (named in the error)
+    if ($rc != 0) {
+        return (undef, "voacapl exited rc=$rc; cmd=@cmd; dat=$dat_name out=$out_name");
+    }
+
+    my ($out, $re) = read_entire_file($out_path);
+    if (!defined $out) {
+        return (undef, "voacapl succeeded but OUT not readable: $re");
+    }
+
+    my @groups = parse_rel_groups($out, $n);
+    if (!@groups || @{ $groups[0] } < 24) {
+        return (undef, "Could not extract " . (24 * $n) . " REL rows from VOACAP output (found "
+            . scalar(all_rel_rows($out)) . ")");
+    }
+
+    unlink $dat_path, $out_path;
+    return (\@groups, undef);
+}
+
+# Leader: one deck for up to $BATCH_MAX queued circuits; circuits of a
+# failed deck are retried one by one so a bad circuit only fails itself.
+sub run_batch {
+    my ($head) = @_;
+    my $pending = File::Spec->catfile($BATCH_DIR, "pending");
+    opendir(my $dh, $pending) or return;
+    my @files = grep { /^[0-9a-f]{32}\.blk$/ } readdir $dh;
+    closedir($dh);
+    my %mtime = map { $_ => ((stat("$pending/$_"))[9] // 0) } @files;
+    @files = sort { $mtime{$a} <=> $mtime{$b} } @files;
+    splice(@files, $BATCH_MAX) if @files > $BATCH_MAX;
+
+    my (@keys, @blocks);
+    for my $f (@files) {
+        my ($blk) = read_entire_file("$pending/$f");
+        if (!defined $blk || !length $blk) {
+            unlink "$pending/$f";
+            next;
+        }
+        push @keys, substr($f, 0, 32);
+        push @blocks, $blk;
+    }
+    return unless @keys;
+
+    my ($groups) = run_deck($head . join("", @blocks) . "QUIT\n", scalar @keys);
+    if ($groups) {
+        for my $i (0 .. $#keys) {
+            write_shared_rows(File::Spec->catfile($SHARE_DIR, "$keys[$i].rows"), $groups->[$i]);
+            unlink "$pending/$keys[$i].blk";
+        }
+        bump_count("batched", @keys - 1) if @keys > 1;
+        return;
+    }
+    for my $i (0 .. $#keys) {
+        my ($g, $err) = run_deck($head . $blocks[$i] . "QUIT\n", 1);
+        if ($g) {
+            write_shared_rows(File::Spec->catfile($SHARE_DIR, "$keys[$i].rows"), $g->[0]);
+        } elsif (open(my $fh, '>', File::Spec->catfile($SHARE_DIR, "$keys[$i].fail"))) {
+            print {$fh} $err;
+            close($fh);
+        }
+        unlink "$pending/$keys[$i].blk";
+    }
+}
+
+# Queue this circuit unless an identical one is already pending, then wait
+# for a batch to compute it, leading one if no one else is.  No lock is held
+# while waiting.  Returns (\@rows) or (undef, error); (undef, undef) means
+# batching was unavailable or timed out and the caller should run the deck
+# itself.
+sub batched_rels {
+    my ($key, $head, $block, $rows_path) = @_;
+    my $pending = File::Spec->catfile($BATCH_DIR, "pending");
+    my $blk_path = File::Spec->catfile($pending, "$key.blk");
+    my $fail = File::Spec->catfile($SHARE_DIR, "$key.fail");
+    mkdir $BATCH_DIR unless -d $BATCH_DIR;
+    mkdir $pending unless -d $pending;
+    open(my $leader, '>>', File::Spec->catfile($BATCH_DIR, "leader.lock")) or return;
+
+    my $joined = -e $blk_path;
+    my $queued = $joined;   # a .fail only answers us once the circuit was pending
+    my $deadline = time() + $BATCH_WAIT;
+    while (time() < $deadline) {
+        my @rows = read_shared_rows($rows_path);
+        if (@rows) {
+            bump_count("saved") if $joined;
+            return (\@rows);
+        }
+        if ($queued && -e $fail) {
+            my ($err) = read_entire_file($fail);
+            return (undef, $err // "voacapl failed");
+        }
+        if (!-e $blk_path) {
+            # Rows are published before the circuit is dequeued, so re-check
+            # them before queueing it (again)
+            @rows = read_shared_rows($rows_path);
+            next if @rows;
+            unlink $fail;
+            my $tmp = File::Spec->catfile($pending, ".$key.$$");
+            open(my $fh, '>', $tmp) or return;
+            print {$fh} $block;
+            if (!(close($fh) && rename($tmp, $blk_path))) {
+                unlink $tmp;
+                return;
+            }
+            $queued = 1;
+        }
+        if (flock($leader, LOCK_EX|LOCK_NB)) {
+            if (-e $blk_path) {
+                sleep($BATCH_WINDOW);
+                run_batch($head);
+            }
+            flock($leader, LOCK_UN);
+            next;
+        }
+        sleep(0.05);
+    }
+    return;
+}
+
 my %q = parse_query_string();
 
 my $year  = int(clamp_num($q{YEAR},  1900, 2100, 2026));
@@ -179,16 +402,13 @@ my ($txlng_v, $txlng_h) = lon_parts_2dp($q{TXLNG});
 my ($rxlat_v, $rxlat_h) = lat_parts_2dp($q{RXLAT});
 my ($rxlng_v, $rxlng_h) = lon_parts_2dp($q{RXLNG});
 
-my $base = unique_base_8() // http_error("Unable to allocate unique temp filenames");
-my $dat_name = "$base.DAT";
-my $out_name = "$base.OUT";
-my $dat_path = File::Spec->catfile($RUN_DIR, $dat_name);
-my $out_path = File::Spec->catfile($RUN_DIR, $out_name);
+# Deck = shared head + per-circuit block (+ QUIT); batches repeat the block
+my $head = "";
+$head .= "COMMENT    HamClock fetchBandConditions (isotropic ends)\n";
+$head .= "COEFFS    CCIR\n";
+$head .= "TIME          1   24    1    1\n";
 
 my $dat = "";
-$dat .= "COMMENT    HamClock fetchBandConditions (isotropic ends)\n";
-$dat .= "COEFFS    CCIR\n";
-$dat .= "TIME          1   24    1    1\n";
 $dat .= sprintf("MONTH      %d %.2f\n", $year, $month);
 $dat .= sprintf("SUNSPOT    %d.\n", $ssn_i);
 $dat .= "LABEL     TX_QTH              RX_QTH\n";
@@ -215,41 +435,28 @@ $dat .= "ANTENNA       2    2    2   30     0.000[default/ccir.000     ]  0.0
 #$dat .= $FREQ_CARD;
 $dat .= "METHOD       30    0\n";
 $dat .= "EXECUTE\n";
-$dat .= "QUIT\n";
-
-my ($ok, $err) = safe_write_file($dat_path, $dat);
-http_error("Failed to write DAT file: $err") if !$ok;
-
-chdir($RUN_DIR) or do {
-    unlink $dat_path;
-    http_error("chdir($RUN_DIR) failed: $!");
-};
-
-$ENV{LC_ALL} = "C";
-$ENV{LANG}   = "C";
-
-my @cmd = ($VOACAPL, "-s", $VOACAP_DIR, $dat_name, $out_name);
-system(@cmd);
-my $rc = $? >> 8;
-
-if ($rc != 0) {
-	#unlink $dat_path;
-	#unlink $out_path;
-    http_error("voacapl exited rc=$rc; cmd=@cmd; dat=$dat_name out=$out_name");
-}
-
-my ($out, $re) = read_entire_file($out_path);
-if (!defined $out) {
-	#unlink $dat_path;
-	#unlink $out_path;
-    http_error("voacapl succeeded but OUT not readable: $re");
-}
-
-my @rels = parse_rel_rows($out);
-if (@rels < 24) {
-	#    unlink $dat_path;
-	#unlink $out_path;
-    http_error("Could not extract 24 REL rows from VOACAP output (found " . scalar(@rels) . ")");
+my $block = $dat;
+$dat = $head . $block . "QUIT\n";
+
+# Keyed on the cards that determine the result, not COMMENT/LABEL text
+my $key = md5_hex(join("", grep { !/^(?:COMMENT|LABEL)\b/ } split(/^/m, $dat)));
+mkdir $SHARE_DIR unless -d $SHARE_DIR;
+my $rows_path = File::Spec->catfile($SHARE_DIR, "$key.rows");
+my @rels = read_shared_rows($rows_path);
+if (@rels) {
+    bump_count("saved");
+} else {
+    my ($rows, $err) = batched_rels($key, $head, $block, $rows_path);
+    http_error($err) if defined $err;
+    if ($rows) {
+        @rels = @$rows;
+    } else {
+        my ($groups, $e) = run_deck($dat, 1);
+        http_error($e) if !$groups;
+        @rels = @{ $groups->[0] };
+        write_shared_rows($rows_path, \@rels);
+    }
+    gc_shared() if int(rand(100)) == 0;
 }
 
 my $row_utc = fmt_row9($rels[$utc]);
@@ -269,7 +476,5 @@ for my $h (1..23) {
 }
 print "0 ", $row0, "\n";
 
-#unlink $dat_path;
-#unlink $out_path;
 exit 0;
 
@@ -28,7 +28,7 @@ import tempfile
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 
-import requests
+from lib_upstream import fetch_text as fetch_shared, session
 
 URL_DSD = "https://services.swpc.noaa.gov/text/daily-solar-indices.txt"
 URL_WWV = "https://services.swpc.noaa.gov/text/wwv.txt"
@@ -44,7 +44,7 @@ UA = "open-hamclock-backend/solarflux-99"
 
 
 def fetch_text(url: str) -> str:
-    r = requests.get(url, headers={"User-Agent": UA}, timeout=30)
+    r = session().get(url, headers={"User-Agent": UA}, timeout=30)
     r.raise_for_status()
     return r.text
 
@@ -195,7 +195,7 @@ def main() -> int:
     cache = load_cache(CACHE_PATH)
 
     try:
-        dsd_txt = fetch_text(URL_DSD)
+        dsd_txt = fetch_shared(URL_DSD)  # shared with ssn_simple.py
         dsd = parse_dsd(dsd_txt)
         if not dsd:
             raise ValueError("parsed 0 daily values from DSD")
@@ -3,6 +3,8 @@
 THIS=$(basename "$0")
 
 URL="https://services.swpc.noaa.gov/json/ovation_aurora_latest.json"
+# fetch-once cache shared with update_aurora_maps.sh (see lib_upstream.py)
+UPSTREAM="/opt/hamclock-backend/scripts/lib_upstream.py"
 OUT="/opt/hamclock-backend/htdocs/ham/HamClock/aurora/aurora.txt"
 CACHE="/opt/hamclock-backend/cache"
 LOG="/opt/hamclock-backend/logs/gen_aurora.log"
@@ -14,7 +16,7 @@ RESEED_GAP=$((12*3600))   # only reseed if >12h gap
 mkdir -p "$CACHE"
 mkdir -p "$(dirname "$LOG")"
 
-MAX_VALUE=$(curl -fs "$URL" | jq '.coordinates | map(.[2]) | max')
+MAX_VALUE=$(python3 "$UPSTREAM" get "$URL" | jq '.coordinates | map(.[2]) | max')
 
 if [ -z "$MAX_VALUE" ]; then
     echo "$(date -Is) ERROR: aurora fetch failed" >> "$LOG"
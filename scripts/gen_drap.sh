@@ -5,11 +5,13 @@ TMPFILE=$(mktemp /opt/hamclock-backend/cache/$THIS-XXXXX)
 
 # URL and Paths
 URL="https://services.swpc.noaa.gov/text/drap_global_frequencies.txt"
+# fetch-once cache shared with update_drap_maps.sh (see lib_upstream.py)
+UPSTREAM="/opt/hamclock-backend/scripts/lib_upstream.py"
 OUTPUT="/opt/hamclock-backend/htdocs/ham/HamClock/drap/stats.txt"
 LAST_DATE_FILE="/opt/hamclock-backend/htdocs/ham/HamClock/drap/last_valid_date.txt"
 
 # 1. Fetch the data into a variable to avoid multiple downloads
-RAW_DATA=$(curl -s "$URL")
+RAW_DATA=$(python3 "$UPSTREAM" get "$URL")
 
 # 2. Extract the "Product Valid At" line
 # Example line: # Product Valid At : 2026-02-03 23:01 UTC
@@ -15,6 +15,8 @@ MUFD_URL="https://prop.kc2g.com/renders/current/mufd-normal-now.geojson"
 STAS_URL="https://prop.kc2g.com/api/stations.json"
 OUTDIR="/opt/hamclock-backend/htdocs/ham/HamClock/maps"
 CPT="/opt/hamclock-backend/scripts/muf_hamclock.cpt"
+BMP565="/opt/hamclock-backend/scripts/lib_bmp565.py"
+UPSTREAM="/opt/hamclock-backend/scripts/lib_upstream.py"   # fetch-once cache; stations.json is shared with build_muf_rt.py
 R="-180/180/-90/90"
 
 mkdir -p "$OUTDIR"
@@ -26,7 +28,27 @@ fi
 # ── 1. Fetch ───────────────────────────────────────────────────────────────────
 echo "Fetching MUF data..."
 curl -fsSL "$MUFD_URL" -o mufd.geojson
-curl -fsSL "$STAS_URL" -o stations.json
+python3 "$UPSTREAM" get "$STAS_URL" -o stations.json
+
+# ── 1b. Skip if nothing changed since the last render ─────────────────────────
+# Fingerprint = KC2G inputs + palette + this script + size list. FORCE=1 renders anyway.
+FP_FILE="$OUTDIR/.MUF-RT-kc2g.fingerprint"
+FP="$( { cat mufd.geojson stations.json "$CPT" "${BASH_SOURCE[0]}"; echo "$OHB_SIZES_NORM"; } \
+  | sha256sum | cut -d' ' -f1)"
+if [[ "${FORCE:-0}" != 1 && -f "$FP_FILE" && "$(cat "$FP_FILE")" == "$FP" ]]; then
+  missing=0
+  for DN in D N; do
+    for SZ in "${SIZES[@]}"; do
+      [[ -f "$OUTDIR/map-${DN}-${SZ}-MUF-RT.bmp.z" ]] || missing=1
+    done
+  done
+  if (( missing == 0 )); then
+    echo "SKIP: KC2G inputs unchanged (fingerprint ${FP:0:12}); maps up to date"
+    rm -f mufd.geojson stations.json
+    exit 0
+  fi
+fi
+echo "Rendering (fingerprint ${FP:0:12})"
 
 # ── 2. Build smooth grid (once) ────────────────────────────────────────────────
 python3 - << 'PYEOF'
@@ -117,6 +139,7 @@ PYEOF
 
 # ── 4. Render each DN variant × size ──────────────────────────────────────────
 echo "Rendering maps..."
+failed=0
 
 for DN in D N; do
 for SZ in "${SIZES[@]}"; do
@@ -127,6 +150,7 @@ for SZ in "${SIZES[@]}"; do
   PNG="${BASE}.png"
   PNG_FIXED="${BASE}_fixed.png"
   BMP="${BASE}.bmp"
+  RAW="${BASE}.raw"
   OUTFILE="${OUTDIR}/map-${DN}-${SZ}-MUF-RT.bmp.z"
 
   echo "  -> ${DN} ${SZ}"
@@ -159,43 +183,22 @@ for SZ in "${SIZES[@]}"; do
         -Sc${CIRCLE_IN}i -G0/200/0 -W0.5p,black
     gmt text stations_labels.txt  -R${R} -J${J} \
         -F+f${FONT_PT}p,Helvetica-Bold,black+jCM
-  gmt end || { echo "    gmt failed for ${DN} ${SZ}"; continue; }
+  gmt end || { echo "    gmt failed for ${DN} ${SZ}"; failed=1; continue; }
 
   # Resize to exact pixel dimensions
   convert "$PNG" -resize "${SZ}!" "$PNG_FIXED" \
-    || { echo "    resize failed for ${DN} ${SZ}"; continue; }
-
-  # Flip vertically (GMT origin is bottom-left, HamClock expects top-down)
-  convert "$PNG_FIXED" -flip "$PNG_FIXED"
-
-  # Convert to RGB565 BMP3
-  convert "$PNG_FIXED" \
-    -type TrueColor \
-    -define bmp:subtype=RGB565 \
-    BMP3:"$BMP" || { echo "    bmp convert failed for ${DN} ${SZ}"; continue; }
-
-  # Force negative height in BMP header (top-down DIB for HamClock)
-  python3 - << EOF
-import struct
-with open("$BMP", "r+b") as f:
-    f.seek(22)
-    h = struct.unpack("<i", f.read(4))[0]
-    if h > 0:
-        f.seek(22)
-        f.write(struct.pack("<i", -h))
-EOF
-
-  # Zlib compress → final output
-  python3 - << EOF
-import zlib
-data = open("$BMP", "rb").read()
-open("${OUTFILE}", "wb").write(zlib.compress(data, 9))
-EOF
+    || { echo "    resize failed for ${DN} ${SZ}"; failed=1; continue; }
+
+  # Extract raw RGB (already top-down), then write BMPv4 RGB565 + .bmp.z (shared codec)
+  convert "$PNG_FIXED" -alpha off -depth 8 RGB:"$RAW" \
+    || { echo "    raw extract failed for ${DN} ${SZ}"; failed=1; continue; }
+  python3 "$BMP565" raw2bmp "$RAW" "$BMP" "$W" "$H" --z "$OUTFILE" \
+    || { echo "    bmp write failed for ${DN} ${SZ}"; failed=1; continue; }
 
   echo "    -> ${OUTFILE}"
 
   # Clean up intermediates for this size
-  rm -f "$PNG" "$PNG_FIXED" "$BMP"
+  rm -f "$PNG" "$PNG_FIXED" "$RAW" "$BMP"
 
 done
 done
@@ -204,4 +207,9 @@ done
 rm -f mufd.geojson stations.json mufd_grid.xyz mufd.grd \
       stations_circles.txt stations_labels.txt
 
+# Only remember the fingerprint once every map was written
+if (( failed == 0 )); then
+  echo "$FP" > "$FP_FILE"
+fi
+
 echo "Done."
@@ -16,7 +16,8 @@ from io import StringIO
 from datetime import datetime, timezone, timedelta
 
 import pandas as pd
-import requests
+
+from lib_upstream import session
 
 
 DGD_URL = "https://services.swpc.noaa.gov/text/daily-geomagnetic-indices.txt"
@@ -68,7 +69,7 @@ def load_dgd_planetary_timeseries() -> pd.DataFrame:
       time_tag (UTC datetime)  kp (float)
     Built from DGD daily rows expanded into 8 x 3-hour bins per day.
     """
-    txt = requests.get(DGD_URL, timeout=20).text
+    txt = session().get(DGD_URL, timeout=20).text
 
     data_lines = [ln for ln in txt.splitlines()
                   if len(ln) >= 5 and ln[:4].isdigit() and ln[4].isspace()]
@@ -101,7 +102,7 @@ def load_forecast_16_bins(offset_bins: int = FCST_OFFSET_BINS) -> list[float]:
     Parse NOAA 3-day geomag forecast Kp table and return 16 values as a contiguous
     slice from the 24-bin (3-day) sequence, starting at offset_bins.
     """
-    txt = requests.get(GMF_URL, timeout=20).text
+    txt = session().get(GMF_URL, timeout=20).text
     lines = txt.splitlines()
 
     start_idx = None
@@ -165,9 +166,14 @@ def build_kp72(lag_bins: int = LAG_BINS, fcst_offset_bins: int = FCST_OFFSET_BIN
     return out
 
 
-def main():
+def render() -> str:
+    """The 72-line kindex.txt text, newline-terminated."""
     kp = build_kp72(lag_bins=LAG_BINS, fcst_offset_bins=FCST_OFFSET_BINS)
-    print("\n".join(f"{v:.2f}" for v in kp))
+    return "\n".join(f"{v:.2f}" for v in kp) + "\n"
+
+
+def main():
+    print(render(), end="")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,647 @@
+#!/usr/bin/env python3
+"""
+lib_bmp565.py - shared BMPv4 RGB565 top-down codec for OHB map generators
+
+HamClock map files are BMPv4 (BITMAPV4HEADER, 108 bytes), 16bpp BI_BITFIELDS
+RGB565 little-endian, top-down (negative height), rows padded to 4 bytes, and
+served zlib-compressed as .bmp.z.  This module is the single implementation of
+that format used by build_muf_rt.py and the update_*_maps.sh pipelines.
+
+All pixel conversion is done with NumPy on whole row bands; there is no
+per-pixel Python work.  Encoded bands are written straight into the output
+buffer / file / zlib stream so peak memory stays close to one copy of the
+RGB565 bitmap.
+
+Import from Python:
+
+    from lib_bmp565 import write_bmp_v4_rgb565_topdown
+    write_bmp_v4_rgb565_topdown(rgb, "map.bmp", "map.bmp.z")
+
+or use from shell (heredoc replacements):
+
+    python3 lib_bmp565.py raw2bmp  in.rgb out.bmp W H [--z out.bmp.z]
+    python3 lib_bmp565.py ppm2bmp  in.ppm out.bmp     [--z out.bmp.z]
+    python3 lib_bmp565.py compress in.bmp out.bmp.z   [--level 9]
+    python3 lib_bmp565.py check    in.bmp[.z] [W H]
+    python3 lib_bmp565.py cache    in.bmp[.z] ...     [--cache-dir DIR]
+    python3 lib_bmp565.py bench    in.bmp [--levels 1,6,9] [--chunks 64,128,512]
+
+.bmp.z output goes through make_compressor(): "zlib" is a single zlib
+stream on one core, "parallel" deflates chunks in threads pigz-style (see
+ParallelDeflate).  Both produce standard zlib streams; OHB_DEFLATE picks
+the default backend.
+
+Decoded base maps can be memory-mapped from a persistent cache with
+load_bmp_v4_rgb565_cached(), so renderers skip the inflate on every run.
+
+Dependencies: python3, numpy
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import struct
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+BMP_FILE_HEADER_SIZE = 14
+BMP_V4_HEADER_SIZE = 108
+BMP_PIXEL_OFFSET = BMP_FILE_HEADER_SIZE + BMP_V4_HEADER_SIZE   # 122
+
+BI_BITFIELDS = 3
+RGB565_MASKS = (0xF800, 0x07E0, 0x001F, 0x0000)
+LCS_SRGB = 0x73524742   # 'sRGB'
+
+# Rows converted per band; bounds the NumPy temporaries to a few MB even at 7920 wide.
+BAND_ROWS = 256
+
+# Deflate backend for .bmp.z: zlib | parallel | auto (parallel on multi-core hosts)
+DEFLATE_BACKEND = os.environ.get("OHB_DEFLATE", "auto")
+DEFLATE_CHUNK = 512 << 10     # parallel backend input chunk; within ~2% of one stream on map data
+DEFLATE_WINDOW = 32 << 10     # deflate history carried into each chunk as a dictionary
+
+# Decoded base-map cache (see load_bmp_v4_rgb565_cached)
+BASE_CACHE_DIR = os.environ.get("OHB_BASE_CACHE_DIR", "/opt/hamclock-backend/cache/basemaps")
+
+
+def rgb565_row_stride(w: int) -> int:
+    """Bytes per stored row: 2 bytes per pixel, padded to a 4-byte boundary."""
+    return (w * 2 + 3) & ~3
+
+
+def bmp_v4_header(w: int, h: int) -> bytes:
+    """BITMAPFILEHEADER + BITMAPV4HEADER for a top-down RGB565 bitmap."""
+    image_size = rgb565_row_stride(w) * h
+    file_header = struct.pack("<2sIHHI", b"BM", BMP_PIXEL_OFFSET + image_size, 0, 0, BMP_PIXEL_OFFSET)
+    v4_header = struct.pack(
+        "<IiiHHIIiiII"
+        "IIII"
+        "I"
+        "36s"
+        "III",
+        BMP_V4_HEADER_SIZE,
+        w,
+        -h,                 # top-down
+        1,                  # planes
+        16,                 # bpp
+        BI_BITFIELDS,
+        image_size,
+        0, 0,               # XPelsPerMeter, YPelsPerMeter
+        0, 0,               # ClrUsed, ClrImportant
+        *RGB565_MASKS,
+        LCS_SRGB,
+        b"\x00" * 36,       # endpoints
+        0, 0, 0,            # gamma
+    )
+    return file_header + v4_header
+
+
+def as_rgb_array(img) -> np.ndarray:
+    """Accept an HxWx3 uint8 array (or memmap) or a PIL image; return an HxWx3 uint8 array."""
+    if not isinstance(img, np.ndarray):
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img = np.asarray(img)
+    if img.ndim != 3 or img.shape[2] < 3 or img.dtype != np.uint8:
+        raise ValueError(f"expected HxWx3 uint8 RGB array, got shape={img.shape} dtype={img.dtype}")
+    return img
+
+
+def rgb888_to_rgb565(rgb: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    Vectorized RGB888 -> RGB565 (truncating, same as HamClock/CSI tools).
+
+    rgb is HxWx3 uint8; out (optional) is an HxW little-endian uint16 array,
+    typically a view into the final BMP buffer.
+    """
+    h, w = rgb.shape[:2]
+    if out is None:
+        out = np.empty((h, w), dtype="<u2")
+    np.right_shift(rgb[:, :, 0], 3, out=out, casting="unsafe")
+    np.left_shift(out, 11, out=out)
+    tmp = np.right_shift(rgb[:, :, 1], 2).astype(np.uint16)
+    tmp <<= 5
+    out |= tmp
+    np.right_shift(rgb[:, :, 2], 3, out=tmp, casting="unsafe")
+    out |= tmp
+    return out
+
+
+def rgb565_to_rgb888(arr565: np.ndarray) -> np.ndarray:
+    """Vectorized RGB565 -> RGB888 with rounding expansion; returns HxWx3 uint8."""
+    a = arr565.astype(np.uint16)
+    r = (a >> 11) & 0x1F
+    g = (a >> 5) & 0x3F
+    b = a & 0x1F
+    r8 = ((r * 255 + 15) // 31).astype(np.uint8)
+    g8 = ((g * 255 + 31) // 63).astype(np.uint8)
+    b8 = ((b * 255 + 15) // 31).astype(np.uint8)
+    return np.stack([r8, g8, b8], axis=2)
+
+
+def _pixel_view(buf, w: int, h: int, offset: int = BMP_PIXEL_OFFSET) -> np.ndarray:
+    """HxW uint16 view (padding excluded) onto the pixel area of a BMP buffer."""
+    stride = rgb565_row_stride(w)
+    rows = np.frombuffer(buf, dtype=np.uint8, count=stride * h, offset=offset).reshape(h, stride)
+    return rows[:, :w * 2].view("<u2")
+
+
+def encode_bmp_v4_rgb565_topdown(img) -> bytearray:
+    """Encode RGB888 (array or PIL image) into a complete BMPv4 RGB565 file image."""
+    rgb = as_rgb_array(img)
+    h, w = rgb.shape[:2]
+    buf = bytearray(BMP_PIXEL_OFFSET + rgb565_row_stride(w) * h)
+    buf[:BMP_PIXEL_OFFSET] = bmp_v4_header(w, h)
+    pix = _pixel_view(buf, w, h)
+    for y0 in range(0, h, BAND_ROWS):
+        y1 = min(h, y0 + BAND_ROWS)
+        rgb888_to_rgb565(rgb[y0:y1, :, :3], out=pix[y0:y1])
+    return buf
+
+
+def adler32_combine(adler1: int, adler2: int, len2: int) -> int:
+    """Adler-32 of A+B from adler32(A), adler32(B) and len(B) (zlib's adler32_combine)."""
+    base = 65521
+    rem = len2 % base
+    sum1 = adler1 & 0xFFFF
+    sum2 = (rem * sum1) % base
+    sum1 += (adler2 & 0xFFFF) + base - 1
+    sum2 += ((adler1 >> 16) & 0xFFFF) + ((adler2 >> 16) & 0xFFFF) + base - rem
+    if sum1 >= base:
+        sum1 -= base
+    if sum1 >= base:
+        sum1 -= base
+    if sum2 >= base << 1:
+        sum2 -= base << 1
+    if sum2 >= base:
+        sum2 -= base
+    return sum1 | (sum2 << 16)
+
+
+def _deflate_chunk(chunk: bytes, zdict: bytes, level: int, last: bool) -> tuple[bytes, int]:
+    co = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict) if zdict else \
+        zlib.compressobj(level, zlib.DEFLATED, -15)
+    out = co.compress(chunk) + co.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return out, zlib.adler32(chunk)
+
+
+class ParallelDeflate:
+    """
+    pigz-style drop-in for zlib.compressobj(): compress() / flush().
+
+    Input is cut into fixed chunks that are raw-deflated in a thread pool
+    (zlib releases the GIL), each primed with the previous 32 KB of input
+    as its dictionary so the ratio stays close to a single stream.  Chunks
+    end on a sync flush, so their concatenation is one valid deflate stream;
+    it is wrapped in a zlib header and the Adler-32 combined from per-chunk
+    checksums.  Output depends only on level and chunk_size, not on the
+    number of threads.  The thread pool is shut down by flush() or close();
+    use it as a context manager so an abandoned stream does not leak it.
+    """
+
+    def __init__(self, level: int = 9, chunk_size: int = DEFLATE_CHUNK, threads: int = None):
+        self.level = level
+        self.chunk_size = chunk_size
+        self.threads = threads or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(max_workers=self.threads)
+        self._jobs = deque()
+        self._pending = bytearray()
+        self._dict = b""
+        self._adler = 1
+        self._header = True
+
+    def _submit(self, chunk: bytes, last: bool) -> None:
+        self._jobs.append((len(chunk), self._pool.submit(_deflate_chunk, chunk, self._dict, self.level, last)))
+        self._dict = chunk[-DEFLATE_WINDOW:]
+
+    def _collect(self, keep: int) -> bytes:
+        out = bytearray()
+        if self._header:
+            # CMF 0x78 (deflate, 32K window); FLG carries FLEVEL and the FCHECK bits
+            flevel = 0 if self.level < 2 else 1 if self.level < 6 else 2 if self.level == 6 else 3
+            flg = flevel << 6
+            flg |= 31 - ((0x78 << 8 | flg) % 31)
+            out += bytes((0x78, flg))
+            self._header = False
+        while len(self._jobs) > keep:
+            n, fut = self._jobs.popleft()
+            data, adler = fut.result()
+            out += data
+            self._adler = adler32_combine(self._adler, adler, n)
+        return bytes(out)
+
+    def compress(self, data) -> bytes:
+        self._pending += data
+        # Cut chunks at an offset and drop the consumed prefix once, not per chunk
+        off = 0
+        with memoryview(self._pending) as view:
+            while len(view) - off > self.chunk_size:
+                self._submit(bytes(view[off:off + self.chunk_size]), last=False)
+                off += self.chunk_size
+        del self._pending[:off]
+        # Bound memory: at most ~2 chunks per thread in flight
+        return self._collect(keep=2 * self.threads)
+
+    def flush(self) -> bytes:
+        try:
+            self._submit(bytes(self._pending), last=True)
+            self._pending = bytearray()
+            return self._collect(keep=0) + struct.pack(">I", self._adler)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Shut the thread pool down, dropping chunks not yet started; safe to repeat."""
+        self._jobs.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def make_compressor(level: int = 9, backend: str = None, chunk_size: int = DEFLATE_CHUNK):
+    """compressobj-like object for the selected deflate backend (see DEFLATE_BACKEND)."""
+    backend = backend or DEFLATE_BACKEND
+    if backend == "auto":
+        backend = "parallel" if (os.cpu_count() or 1) > 1 else "zlib"
+    if backend == "zlib":
+        return zlib.compressobj(level)
+    if backend == "parallel":
+        return ParallelDeflate(level, chunk_size)
+    raise ValueError(f"unknown deflate backend '{backend}' (expected zlib, parallel or auto)")
+
+
+class BmpV4Rgb565Writer:
+    """
+    Incremental BMPv4 RGB565 top-down writer.
+
+    Rows are fed top to bottom with write_rows(); each band is encoded into a
+    reusable buffer and streamed to the .bmp and/or through zlib into the
+    .bmp.z, so memory is bounded by the band, not the map.  Output is
+    byte-identical to encoding the whole image at once.
+    """
+
+    def __init__(self, w: int, h: int, out_bmp: str = None, out_bmp_z: str = None, zlevel: int = 9,
+                 backend: str = None):
+        if out_bmp is None and out_bmp_z is None:
+            raise ValueError("need out_bmp and/or out_bmp_z")
+        self.w, self.h = w, h
+        self.stride = rgb565_row_stride(w)
+        self.rows_written = 0
+        self._band = bytearray()
+        self._fb = open(out_bmp, "wb") if out_bmp else None
+        self._fz = open(out_bmp_z, "wb") if out_bmp_z else None
+        self._co = make_compressor(zlevel, backend) if self._fz else None
+        self._emit(bmp_v4_header(w, h))
+
+    def _emit(self, chunk) -> None:
+        if self._fb:
+            self._fb.write(chunk)
+        if self._co:
+            self._fz.write(self._co.compress(chunk))
+
+    def write_rows(self, img) -> None:
+        rgb = as_rgb_array(img)
+        rows, w = rgb.shape[:2]
+        if w != self.w or self.rows_written + rows > self.h:
+            raise ValueError(f"band {w}x{rows} does not fit {self.w}x{self.h} at row {self.rows_written}")
+        n = rows * self.stride
+        if len(self._band) < n:
+            self._band = bytearray(n)
+        rgb888_to_rgb565(rgb[:, :, :3], out=_pixel_view(self._band, w, rows, offset=0))
+        self._emit(memoryview(self._band)[:n])
+        self.rows_written += rows
+
+    def close(self) -> None:
+        try:
+            if self._co:
+                co, self._co = self._co, None
+                self._fz.write(co.flush())
+        finally:
+            self._abort()
+        if self.rows_written != self.h:
+            raise ValueError(f"wrote {self.rows_written} of {self.h} rows")
+
+    def _abort(self) -> None:
+        if isinstance(self._co, ParallelDeflate):
+            self._co.close()
+        self._co = None
+        for f in (self._fb, self._fz):
+            if f:
+                f.close()
+        self._fb = self._fz = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
+        return False
+
+
+def write_bmp_v4_rgb565_topdown(img, out_bmp: str = None, out_bmp_z: str = None, zlevel: int = 9,
+                                backend: str = None) -> None:
+    """
+    Write img as BMPv4 RGB565 top-down to out_bmp and/or zlib-compressed to out_bmp_z.
+
+    Bands are streamed to both outputs as they are encoded; the full
+    uncompressed bitmap is never concatenated in memory.
+    """
+    rgb = as_rgb_array(img)
+    h, w = rgb.shape[:2]
+    with BmpV4Rgb565Writer(w, h, out_bmp, out_bmp_z, zlevel, backend) as wr:
+        for y0 in range(0, h, BAND_ROWS):
+            wr.write_rows(rgb[y0:y0 + BAND_ROWS])
+
+
+def parse_bmp_v4_header(blob, check_size: bool = True) -> tuple[int, int, int]:
+    """
+    Validate a BMPv4 RGB565 top-down header; return (width, height, pixel_offset).
+
+    Raises ValueError on anything HamClock would not accept.
+    """
+    if len(blob) < BMP_PIXEL_OFFSET or bytes(blob[0:2]) != b"BM":
+        raise ValueError("Not BMP")
+    bfOffBits = struct.unpack_from("<I", blob, 10)[0]
+    dib = struct.unpack_from("<I", blob, 14)[0]
+    w = struct.unpack_from("<i", blob, 18)[0]
+    h = struct.unpack_from("<i", blob, 22)[0]
+    planes = struct.unpack_from("<H", blob, 26)[0]
+    bpp = struct.unpack_from("<H", blob, 28)[0]
+    comp = struct.unpack_from("<I", blob, 30)[0]
+    masks = struct.unpack_from("<III", blob, 54)
+    if bfOffBits != BMP_PIXEL_OFFSET or dib != BMP_V4_HEADER_SIZE or planes != 1 or bpp != 16 or comp != BI_BITFIELDS:
+        raise ValueError(f"Unexpected BMP header off={bfOffBits} dib={dib} planes={planes} bpp={bpp} comp={comp}")
+    if masks != RGB565_MASKS[:3]:
+        raise ValueError("Unexpected masks " + ",".join(hex(m) for m in masks))
+    if w <= 0 or h >= 0:
+        raise ValueError(f"Expected top-down BMP (negative height), got w,h={w},{h}")
+    need = bfOffBits + rgb565_row_stride(w) * -h
+    if check_size and len(blob) < need:
+        raise ValueError(f"Truncated BMP: {len(blob)} bytes, expected {need}")
+    return w, -h, bfOffBits
+
+
+def read_bmp_v4_rgb565_topdown(blob) -> np.ndarray:
+    """Decode a BMPv4 RGB565 top-down file image into an HxW uint16 array (zero-copy view)."""
+    w, h, off = parse_bmp_v4_header(blob)
+    return _pixel_view(blob, w, h, offset=off)
+
+
+def zread(path: str) -> bytes:
+    """Read a file, inflating it if it is a .z."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return zlib.decompress(data) if path.endswith(".z") else data
+
+
+def load_bmp_v4_rgb565(path: str) -> np.ndarray:
+    """Load a .bmp or .bmp.z map as an HxW uint16 RGB565 array."""
+    return read_bmp_v4_rgb565_topdown(zread(path))
+
+
+def load_bmp_v4_rgb565_cached(path: str, cache_dir: str = BASE_CACHE_DIR) -> np.ndarray:
+    """
+    load_bmp_v4_rgb565(), memory-mapped from a decoded .npy cache.
+
+    Entries are keyed by the source's real path, mtime and size, so a rebuilt
+    base map misses, is decoded once and replaces (evicts) its stale entries.
+    The returned array is a read-only np.memmap; pages come from the page
+    cache and are shared by every process mapping the same base.  If the
+    cache is unusable (empty cache_dir, unwritable directory) the map is
+    decoded in memory as before.
+    """
+    if not cache_dir:
+        return load_bmp_v4_rgb565(path)
+    st = os.stat(path)
+    tag = hashlib.sha1(os.path.realpath(path).encode()).hexdigest()[:16]
+    entry = os.path.join(cache_dir, f"{tag}-{st.st_mtime_ns}-{st.st_size}.npy")
+    try:
+        return np.load(entry, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+
+    arr = load_bmp_v4_rgb565(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(cache_dir, f"{tag}-*.npy")):
+            os.remove(stale)
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp, entry)
+        return np.load(entry, mmap_mode="r")
+    except OSError:
+        return arr
+
+
+def open_bmp_v4_rgb565_rows(path: str, band_rows: int = BAND_ROWS, read_size: int = 1 << 20):
+    """
+    Stream a .bmp or .bmp.z map top to bottom.
+
+    Returns (w, h, bands) where bands yields (y0, rows x w uint16 array).
+    .z files are inflated incrementally, so only about one band of pixels is
+    held at a time.
+    """
+    f = open(path, "rb")
+    dec = zlib.decompressobj() if path.endswith(".z") else None
+    buf = bytearray()
+    eof = False
+
+    def fill() -> None:
+        # Inflate at most read_size bytes per call; maps compress 20x+, so an
+        # unbounded decompress() of one input block could be tens of MB.
+        nonlocal eof
+        if dec and dec.unconsumed_tail:
+            buf.extend(dec.decompress(dec.unconsumed_tail, read_size))
+            return
+        raw = f.read(read_size >> 4 if dec else read_size)
+        if raw:
+            buf.extend(dec.decompress(raw, read_size) if dec else raw)
+        else:
+            if dec:
+                buf.extend(dec.flush())
+            eof = True
+
+    try:
+        while len(buf) < BMP_PIXEL_OFFSET and not eof:
+            fill()
+        w, h, off = parse_bmp_v4_header(buf, check_size=False)
+    except Exception:
+        f.close()
+        raise
+    del buf[:off]
+    stride = rgb565_row_stride(w)
+
+    def bands():
+        y0 = 0
+        try:
+            while y0 < h:
+                want = min(band_rows, h - y0) * stride
+                while len(buf) < want and not eof:
+                    fill()
+                if len(buf) < want:
+                    raise ValueError(f"{path}: truncated BMP at row {y0} of {h}")
+                rows = want // stride
+                band = np.frombuffer(bytes(buf[:want]), dtype=np.uint8).reshape(rows, stride)
+                del buf[:want]
+                yield y0, band[:, :w * 2].view("<u2")
+                y0 += rows
+        finally:
+            f.close()
+
+    return w, h, bands()
+
+
+def zlib_compress_file(src: str, dst: str, level: int = 9, backend: str = None) -> None:
+    co = make_compressor(level, backend)
+    try:
+        with open(src, "rb") as fi, open(dst, "wb") as fo:
+            for block in iter(lambda: fi.read(1 << 20), b""):
+                fo.write(co.compress(block))
+            fo.write(co.flush())
+    finally:
+        if isinstance(co, ParallelDeflate):
+            co.close()
+
+
+def bench_deflate(data: bytes, levels: list, chunks_kb: list, threads: int = None) -> None:
+    """Print time / size for zlib vs parallel deflate at each level and chunk size."""
+    ncpu = threads or os.cpu_count() or 1
+    print(f"input {len(data)} bytes, {ncpu} threads")
+    print(f"{'backend':<10} {'level':>5} {'chunk':>7} {'seconds':>8} {'bytes':>10} {'ratio':>7} {'vs zlib':>8}")
+    for level in levels:
+        t0 = time.perf_counter()
+        ref = zlib.compress(data, level)
+        t_ref = time.perf_counter() - t0
+        print(f"{'zlib':<10} {level:>5} {'-':>7} {t_ref:>8.3f} {len(ref):>10} {len(data) / len(ref):>7.2f} {'1.00x':>8}")
+        for kb in chunks_kb:
+            t0 = time.perf_counter()
+            with ParallelDeflate(level, kb << 10, threads=ncpu) as co:
+                out = co.compress(data) + co.flush()
+            dt_ = time.perf_counter() - t0
+            if zlib.decompress(out) != data:
+                raise ValueError(f"parallel deflate round-trip failed (level {level}, chunk {kb}K)")
+            print(f"{'parallel':<10} {level:>5} {str(kb) + 'K':>7} {dt_:>8.3f} {len(out):>10} "
+                  f"{len(data) / len(out):>7.2f} {t_ref / dt_:>7.2f}x")
+
+
+def read_raw_rgb(path: str, w: int, h: int) -> np.ndarray:
+    """Memory-map a raw interleaved RGB888 file (ImageMagick RGB:) as HxWx3."""
+    exp = w * h * 3
+    size = os.path.getsize(path)
+    if size != exp:
+        raise ValueError(f"RAW size {size} != expected {exp}")
+    return np.memmap(path, dtype=np.uint8, mode="r", shape=(h, w, 3))
+
+
+def read_ppm(path: str) -> np.ndarray:
+    """Memory-map a binary 8-bit PPM (P6) as HxWx3."""
+    with open(path, "rb") as f:
+        head = f.read(512)
+    tokens = []
+    pos = 0
+    while len(tokens) < 4:
+        while pos < len(head) and head[pos:pos + 1].isspace():
+            pos += 1
+        if head[pos:pos + 1] == b"#":
+            pos = head.index(b"\n", pos) + 1
+            continue
+        end = pos
+        while end < len(head) and not head[end:end + 1].isspace():
+            end += 1
+        tokens.append(head[pos:end])
+        pos = end
+    pos += 1    # single whitespace after maxval
+    if tokens[0] != b"P6" or int(tokens[3]) != 255:
+        raise ValueError(f"{path}: only 8-bit binary PPM (P6) is supported")
+    w, h = int(tokens[1]), int(tokens[2])
+    return np.memmap(path, dtype=np.uint8, mode="r", offset=pos, shape=(h, w, 3))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="BMPv4 RGB565 top-down codec for HamClock maps")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("raw2bmp", help="raw RGB888 -> BMPv4 RGB565")
+    p.add_argument("inraw")
+    p.add_argument("outbmp")
+    p.add_argument("width", type=int)
+    p.add_argument("height", type=int)
+    p.add_argument("--z", dest="outz", help="also write zlib-compressed .bmp.z")
+    p.add_argument("--level", type=int, default=9)
+    p.add_argument("--backend", choices=("zlib", "parallel", "auto"))
+
+    p = sub.add_parser("ppm2bmp", help="binary PPM -> BMPv4 RGB565")
+    p.add_argument("inppm")
+    p.add_argument("outbmp")
+    p.add_argument("--z", dest="outz", help="also write zlib-compressed .bmp.z")
+    p.add_argument("--level", type=int, default=9)
+    p.add_argument("--backend", choices=("zlib", "parallel", "auto"))
+
+    p = sub.add_parser("compress", help="zlib-compress a file")
+    p.add_argument("src")
+    p.add_argument("dst")
+    p.add_argument("--level", type=int, default=9)
+    p.add_argument("--backend", choices=("zlib", "parallel", "auto"))
+
+    p = sub.add_parser("bench", help="compare zlib vs parallel deflate on a file")
+    p.add_argument("path", help="input (.z files are inflated first)")
+    p.add_argument("--levels", default="1,6,9")
+    p.add_argument("--chunks", default="64,128,256,512", help="parallel chunk sizes in KB")
+    p.add_argument("--threads", type=int)
+
+    p = sub.add_parser("check", help="validate a .bmp or .bmp.z")
+    p.add_argument("path")
+    p.add_argument("width", type=int, nargs="?")
+    p.add_argument("height", type=int, nargs="?")
+
+    p = sub.add_parser("cache", help="decode base maps into the persistent cache")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--cache-dir", default=BASE_CACHE_DIR)
+
+    args = ap.parse_args()
+
+    try:
+        if args.cmd == "raw2bmp":
+            rgb = read_raw_rgb(args.inraw, args.width, args.height)
+            write_bmp_v4_rgb565_topdown(rgb, args.outbmp, args.outz, zlevel=args.level, backend=args.backend)
+        elif args.cmd == "ppm2bmp":
+            rgb = read_ppm(args.inppm)
+            write_bmp_v4_rgb565_topdown(rgb, args.outbmp, args.outz, zlevel=args.level, backend=args.backend)
+        elif args.cmd == "compress":
+            zlib_compress_file(args.src, args.dst, level=args.level, backend=args.backend)
+        elif args.cmd == "bench":
+            bench_deflate(zread(args.path), [int(v) for v in args.levels.split(",")],
+                          [int(v) for v in args.chunks.split(",")], threads=args.threads)
+        elif args.cmd == "check":
+            w, h, _ = parse_bmp_v4_header(zread(args.path))
+            if args.width is not None and (w, h) != (args.width, args.height):
+                raise ValueError(f"w,h={w},{h} (expected {args.width},{args.height})")
+            print(f"OK: {args.path} {w}x{h}")
+        elif args.cmd == "cache":
+            for path in args.paths:
+                h, w = load_bmp_v4_rgb565_cached(path, args.cache_dir).shape
+                print(f"OK: {path} {w}x{h}")
+    except (OSError, ValueError, zlib.error) as e:
+        print(f"BAD: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+lib_maprender.py - field-to-map helpers shared by the OHB heatmap generators
+
+  parse_sizes(spec)                        OHB_SIZES "WxH,..." -> [(w, h), ...]
+  resample_field(field, w, h, y0, y1)      bilinear grid field -> map pixels (or a row band)
+  colorize_field(field, lut, vmin, alpha)  (H, W) values -> RGBA through a colormap LUT
+  load_base_map(path, cache_dir)           Countries base (.bmp/.bmp.z/.png) as PIL RGB
+  base_rgb565_lut()                        RGB565 -> RGB exactly as PIL decodes it
+
+Used by build_muf_rt.py (MUF) and build_voacap_area.py (band scores); the
+BMP codec and decoded-base cache live in lib_bmp565.py.
+
+Dependencies: python3, pillow, numpy
+"""
+
+import zlib
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from lib_bmp565 import bmp_v4_header, load_bmp_v4_rgb565_cached
+
+
+def parse_sizes(spec: str) -> list:
+    """'660x330,1320x660' (OHB_SIZES format) -> [(660, 330), (1320, 660)], deduped in order."""
+    sizes = []
+    for tok in spec.replace(" ", "").split(","):
+        if not tok:
+            continue
+        w_s, sep, h_s = tok.partition("x")
+        if not sep or not w_s.isdigit() or not h_s.isdigit():
+            raise ValueError(f"invalid size '{tok}' (expected WxH like 660x330)")
+        sz = (int(w_s), int(h_s))
+        if sz not in sizes:
+            sizes.append(sz)
+    return sizes
+
+
+def resample_field(field: np.ndarray, w: int, h: int, y0: int = 0, y1: int = None) -> np.ndarray:
+    """
+    Bilinear resample of an (Hg, Wg) grid field to (h, w), or to rows [y0, y1) of it.
+
+    Both grids span lon -180..180 and lat 90..-90 edge to edge (np.linspace
+    endpoints), so corners map onto corners.
+    """
+    hg, wg = field.shape
+    y1 = h if y1 is None else y1
+    if (wg, hg) == (w, h):
+        return field[y0:y1]
+
+    def axis(n_out, n_in):
+        pos = np.linspace(0.0, n_in - 1, n_out)
+        i0 = np.minimum(pos.astype(np.intp), max(n_in - 2, 0))
+        i1 = np.minimum(i0 + 1, n_in - 1)
+        return i0, i1, (pos - i0).astype(np.float32)
+
+    x0, x1, fx = axis(w, wg)
+    r0, r1, fy = (a[y0:y1] for a in axis(h, hg))
+    top = field[r0][:, x0] * (1.0 - fx) + field[r0][:, x1] * fx
+    bot = field[r1][:, x0] * (1.0 - fx) + field[r1][:, x1] * fx
+    return (top * (1.0 - fy)[:, None] + bot * fy[:, None]).astype(np.float32)
+
+
+def colorize_field(field: np.ndarray, lut: np.ndarray, vmin: float, alpha: int,
+                   step: float) -> np.ndarray:
+    """
+    Map an (H, W) field to (H, W, 4) RGBA uint8 in one indexing pass; lut
+    entry i is the color of vmin + i*step.
+    """
+    idx = np.rint((field - vmin) * (1.0 / step)).astype(np.intp)
+    np.clip(idx, 0, len(lut) - 1, out=idx)
+    rgba = np.empty(field.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = lut[idx]
+    rgba[..., 3] = alpha
+    return rgba
+
+
+def load_base_map(path: str, cache_dir: str = None) -> Image.Image:
+    if cache_dir and path.endswith((".bmp", ".bmp.z")):
+        try:
+            return Image.fromarray(base_rgb565_lut()[load_bmp_v4_rgb565_cached(path, cache_dir)], mode="RGB")
+        except ValueError:
+            pass  # not a BMPv4 RGB565 map; let PIL decode it
+    if path.endswith(".bmp.z"):
+        raw = open(path, "rb").read()
+        bmp = zlib.decompress(raw)
+        return Image.open(BytesIO(bmp)).convert("RGB")
+    return Image.open(path).convert("RGB")
+
+
+@lru_cache(maxsize=None)
+def base_rgb565_lut() -> np.ndarray:
+    """
+    (65536, 3) uint8 table: RGB565 value -> RGB as PIL decodes it in load_base_map().
+
+    Built by letting PIL decode one 256x256 BMPv4 holding every 16-bit value,
+    so streamed and cached base rows expand to exactly the same colors as PIL.
+    """
+    bmp = bytearray(bmp_v4_header(256, 256))
+    bmp += np.arange(65536, dtype="<u2").tobytes()
+    img = Image.open(BytesIO(bytes(bmp))).convert("RGB")
+    return np.asarray(img, dtype=np.uint8).reshape(65536, 3)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+lib_resample.py - time-series resampling shared by the OHB space-weather generators
+
+Every function takes a sorted (ascending) epoch array t and finds bin
+boundaries with np.searchsorted, so resampling n samples into m bins costs
+O(n + m log n) instead of scanning every sample per bin.
+
+  upto(t, limit)                      samples at or before limit (lag cutoff)
+  at_or_before(t, v, at)              last value at or before each time
+  bin_reduce(t, v, start, step, n)    per-bin max / mean over [start + k*step, +step)
+
+Used by swind_simple.py (lag cutoff), bz_simple.py (last value per 10-minute
+bin) and xray_simple.py (per-bin max).
+
+Dependencies: python3, numpy
+"""
+
+import numpy as np
+
+
+def upto(t, limit) -> int:
+    """Number of samples with t <= limit, i.e. t[:upto(t, limit)] is the lag-cut series."""
+    return int(np.searchsorted(t, limit, side="right"))
+
+
+def at_or_before(t, v, at) -> tuple:
+    """
+    For each time in at, the last sample with t <= that time.
+
+    Returns (found, values): found is a bool mask, values holds v rows (NaN
+    where nothing precedes the time).
+    """
+    v = np.asarray(v, dtype=np.float64)
+    idx = np.searchsorted(t, at, side="right") - 1
+    found = idx >= 0
+    out = np.full((len(idx),) + v.shape[1:], np.nan)
+    out[found] = v[idx[found]]
+    return found, out
+
+
+def bin_reduce(t, v, start: int, step: int, nbins: int, how: str = "max") -> tuple:
+    """
+    Reduce samples into nbins fixed bins [start + k*step, start + (k+1)*step).
+
+    Returns (counts, values); empty bins are NaN.  how is "max" or "mean".
+    """
+    v = np.asarray(v, dtype=np.float64)
+    edges = np.searchsorted(t, start + step * np.arange(nbins + 1), side="left")
+    counts = np.diff(edges)
+    out = np.full((nbins,) + v.shape[1:], np.nan)
+    full = counts > 0
+    if full.any():
+        # segments between consecutive non-empty bin starts hold exactly one bin's samples
+        lo, vv = edges[:-1][full], v[:edges[-1]]
+        if how == "max":
+            out[full] = np.maximum.reduceat(vv, lo, axis=0)
+        elif how == "mean":
+            out[full] = np.add.reduceat(vv, lo, axis=0) / counts[full].reshape((-1,) + (1,) * (v.ndim - 1))
+        else:
+            raise ValueError(f"unknown reduction {how!r}")
+    return counts, out
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+lib_ringbuf.py - fixed-size memory-mapped time-series ring buffers for OHB generators
+
+swind_simple.py, bz_simple.py and xray_simple.py keep their history here
+instead of rebuilding it from the full 1-day/3-day SWPC products on every
+tick.  Each run fetches a short-window product (2-hour/6-hour), appends only
+samples newer than the newest one stored, and renders its output file from
+the buffer, so history also survives upstream gaps longer than the upstream
+window.
+
+File layout (little-endian):
+
+  header, 64 bytes   magic "OHBRING1", ncols u32, capacity u32,
+                     count i64 (samples ever appended), last i64 (newest epoch)
+  capacity records   epoch i64, ncols x f64
+
+Sample k (counting from 0 in append order) lives in slot k % capacity.  The
+header is updated after the records and is the commit point: a crash
+mid-append loses the samples being appended.  Once the ring has wrapped,
+those uncommitted records may already have replaced the oldest committed
+ones, so read() checks time order and returns only the ordered tail that
+ends at the header's newest sample; the next append overwrites the strays.
+Writers take an exclusive flock, readers a shared one.  Samples are append-only and strictly increasing in time: a late sample
+older than the newest stored one is dropped.
+
+Import from Python:
+
+    from lib_ringbuf import RingSeries
+    with RingSeries("/opt/hamclock-backend/data/ring/mag.ring", ncols=4, capacity=4320) as ring:
+        ring.append(epochs, values)         # values: (n, ncols)
+        t, v = ring.read()                  # oldest -> newest
+
+or use from shell:
+
+    python3 lib_ringbuf.py info FILE
+    python3 lib_ringbuf.py dump FILE [--tail N]
+
+Dependencies: python3, numpy
+"""
+
+import argparse
+import fcntl
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"OHBRING1"
+HEADER = struct.Struct("<8sIIqq")
+HEADER_SIZE = 64
+RING_DIR = "/opt/hamclock-backend/data/ring"
+
+
+class RingSeries:
+    """One series: epoch seconds plus ncols float64 values per sample."""
+
+    def __init__(self, path: str, ncols: int, capacity: int):
+        self.path = path
+        self.ncols = ncols
+        self.capacity = capacity
+        self.dtype = np.dtype([("t", "<i8"), ("v", "<f8", (ncols,))])
+        size = HEADER_SIZE + capacity * self.dtype.itemsize
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._f = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        fcntl.flock(self._f, fcntl.LOCK_EX)
+        try:
+            self._f.seek(0)
+            head = self._f.read(HEADER.size)
+            ok = (len(head) == HEADER.size and os.fstat(self._f.fileno()).st_size == size
+                  and HEADER.unpack(head)[:3] == (MAGIC, ncols, capacity))
+            if not ok:
+                # new file, or one written with another layout: start empty
+                self._f.truncate(0)
+                self._f.truncate(size)
+                os.pwrite(self._f.fileno(), HEADER.pack(MAGIC, ncols, capacity, 0, 0), 0)
+        finally:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._map = np.memmap(path, mode="r+", dtype=np.uint8, shape=(size,))
+        self._rec = self._map[HEADER_SIZE:].view(self.dtype)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.flush()
+            del self._rec
+            self._map = None
+            self._f.close()
+
+    def _header(self) -> tuple:
+        _, _, _, count, last = HEADER.unpack(bytes(self._map[:HEADER.size]))
+        return count, last
+
+    def __len__(self) -> int:
+        return len(self.read()[0])
+
+    @property
+    def last(self):
+        """Newest stored epoch, or None when empty."""
+        count, last = self._header()
+        return last if count else None
+
+    def append(self, t, values) -> int:
+        """Store samples newer than the newest stored one; returns how many were added."""
+        t = np.asarray(t, dtype=np.int64).reshape(-1)
+        v = np.asarray(values, dtype=np.float64).reshape(len(t), self.ncols)
+        fcntl.flock(self._f, fcntl.LOCK_EX)
+        try:
+            count, last = self._header()
+            t, first = np.unique(t, return_index=True)
+            v = v[first]
+            if count:
+                keep = t > last
+                t, v = t[keep], v[keep]
+            t, v = t[-self.capacity:], v[-self.capacity:]
+            n = len(t)
+            if n == 0:
+                return 0
+            slots = (count + np.arange(n)) % self.capacity
+            self._rec["t"][slots] = t
+            self._rec["v"][slots] = v
+            self._map.flush()
+            self._map[:HEADER.size] = np.frombuffer(
+                HEADER.pack(MAGIC, self.ncols, self.capacity, count + n, int(t[-1])), dtype=np.uint8)
+            self._map.flush()
+            return n
+        finally:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+
+    def read(self) -> tuple:
+        """(epochs, values) of every stored sample, oldest first (copies)."""
+        fcntl.flock(self._f, fcntl.LOCK_SH)
+        try:
+            count, _ = self._header()
+            n = min(count, self.capacity)
+            order = (count - n + np.arange(n)) % self.capacity
+            rec = self._rec[order]
+        finally:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+        # slots overwritten by an append that crashed before its header
+        # update sit at the front and break the time order: drop them
+        brk = np.flatnonzero(np.diff(rec["t"]) <= 0)
+        if len(brk):
+            rec = rec[brk[-1] + 1:]
+        return rec["t"].copy(), rec["v"].copy()
+
+
+def open_existing(path: str) -> RingSeries:
+    """Open a ring file using the layout recorded in its header."""
+    with open(path, "rb") as f:
+        magic, ncols, capacity, _, _ = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path}: not a ring buffer")
+    return RingSeries(path, ncols, capacity)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Inspect OHB ring-buffer series files")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    i = sub.add_parser("info")
+    i.add_argument("path")
+    d = sub.add_parser("dump")
+    d.add_argument("path")
+    d.add_argument("--tail", type=int, default=0, help="only the newest N samples")
+    args = ap.parse_args()
+
+    with open_existing(args.path) as ring:
+        t, v = ring.read()
+        if args.cmd == "info":
+            span = f"{t[0]} .. {t[-1]} ({(t[-1] - t[0]) / 3600:.1f} h)" if len(t) else "empty"
+            print(f"{args.path}: {ring.ncols} cols, {len(t)}/{ring.capacity} samples, {span}")
+            return 0
+        if args.tail:
+            t, v = t[-args.tail:], v[-args.tail:]
+        for ti, vi in zip(t, v):
+            print(ti, " ".join(f"{x:.6g}" for x in vi))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+lib_upstream.py - fetch-once cache for upstream documents shared by OHB generators
+
+Several generators pull the same upstream files on their own schedules
+(daily-solar-indices.txt for flux and SSN, the OVATION json for the aurora
+history and maps, the DRAP table for stats and maps, KC2G stations.json for
+both MUF-RT renderers).  Reading through this module downloads each URL at
+most once per freshness window and hands every other caller the local copy.
+
+  - freshness windows are per URL (FRESHNESS), DEFAULT_MAX_AGE otherwise;
+    windows sit just under the consumers' cron cadence so a job running
+    shortly after another reuses its download but never its previous one
+  - concurrent callers of a stale URL wait on a per-URL flock and share the
+    one download
+  - a stale copy is revalidated with If-None-Match / If-Modified-Since from
+    the stored ETag / Last-Modified; a 304 refreshes it without a download
+  - since=T returns None when the body has not changed since epoch T (the
+    meta records when its SHA-256 last changed), so a job passing its output
+    file's mtime (output_mtime()) skips parse and rewrite only while that
+    output is newer than the body; nothing is marked as consumed, so a job
+    that fails before writing its output gets the body again next time
+  - failed downloads raise (as the direct fetch did); a stale copy is not
+    served in its place
+  - if the cache directory cannot be used (read-only, full, wrong owner)
+    the URL is fetched uncached, with a note on stderr
+  - per-URL hits, misses, 304s, errors and bytes saved are kept in stats.json
+
+All requests go through one requests.Session per process (session()), so a
+job fetching several documents from one host reuses the connection.
+
+Import from Python:
+
+    from lib_upstream import fetch, fetch_text, output_mtime, session
+    text = fetch_text("https://services.swpc.noaa.gov/text/daily-solar-indices.txt")
+    body = fetch(URL, since=output_mtime(OUT))   # None: OUT is newer than the body
+    r = session().get(url, timeout=20)     # uncached, pooled
+
+or use from shell (in place of curl -fsSL):
+
+    python3 lib_upstream.py get URL [-o FILE] [--max-age S]
+    python3 lib_upstream.py stats [--json]
+    python3 lib_upstream.py purge
+
+OHB_UPSTREAM_DIR overrides the cache directory.
+
+Dependencies: python3, requests
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CACHE_DIR = os.environ.get("OHB_UPSTREAM_DIR", "/opt/hamclock-backend/cache/upstream")
+USER_AGENT = "open-hamclock-backend/1.0"
+
+DEFAULT_MAX_AGE = 60
+
+# url -> freshness window in seconds.  Keep each window below the shortest
+# cadence of the jobs reading the URL (see crontab).
+FRESHNESS = {
+    # flux_simple 7,37 * ; ssn_simple 15 10,14
+    "https://services.swpc.noaa.gov/text/daily-solar-indices.txt": 1500,
+    # gen_aurora 2,32 * ; update_aurora_maps 6,30 *
+    "https://services.swpc.noaa.gov/json/ovation_aurora_latest.json": 600,
+    # gen_drap */3 ; update_drap_maps 7,37 *
+    "https://services.swpc.noaa.gov/text/drap_global_frequencies.txt": 150,
+    # kc2g_muf_heatmap */15 ; build_muf_rt
+    "https://prop.kc2g.com/api/stations.json": 600,
+}
+
+
+_session = None
+
+
+def session() -> requests.Session:
+    """Process-wide keep-alive session (pooled per host); not shared across fork."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=4)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def _drop_session() -> None:
+    global _session
+    _session = None
+
+
+os.register_at_fork(after_in_child=_drop_session)
+
+
+def url_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+
+@contextmanager
+def _locked(path: str):
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _bump(url: str, cache_dir: str, **counts) -> None:
+    """Add counts to url's entry in stats.json (best effort)."""
+    path = os.path.join(cache_dir, "stats.json")
+    try:
+        with _locked(path + ".lock"):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    stats = json.load(f)
+            except (OSError, ValueError):
+                stats = {}
+            st = stats.setdefault(url, {"hits": 0, "misses": 0, "not_modified": 0, "errors": 0,
+                                        "bytes_fetched": 0, "bytes_saved": 0})
+            for k, v in counts.items():
+                if k.startswith("last_"):
+                    st[k] = v
+                else:
+                    st[k] = st.get(k, 0) + v
+            fd, tmp = tempfile.mkstemp(prefix=".stats.", dir=cache_dir)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=1, sort_keys=True)
+            os.replace(tmp, path)
+    except OSError as e:
+        print(f"lib_upstream: stats update failed: {e}", file=sys.stderr)
+
+
+def _read_meta(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(path: str, data: bytes, cache_dir: str) -> None:
+    fd, tmp = tempfile.mkstemp(prefix=".body.", dir=cache_dir)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def output_mtime(path: str):
+    """mtime of a job's output file, or None when it does not exist (for fetch(since=...))."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def fetch(url: str, max_age: float = None, timeout: float = 30, cache_dir: str = CACHE_DIR,
+          since: float = None):
+    """
+    Body of url, downloaded at most once per freshness window across all callers.
+
+    With since (epoch seconds), None is returned when the body has not
+    changed since then, i.e. output built at or after since is still current.
+    """
+    if max_age is None:
+        max_age = FRESHNESS.get(url, DEFAULT_MAX_AGE)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        return _fetch_cached(url, max_age, timeout, cache_dir, since)
+    except requests.RequestException:
+        raise
+    except OSError as e:
+        # the cache is an optimisation: a broken cache dir must not stop the job
+        print(f"lib_upstream: cache unusable ({e}); fetching {url} uncached", file=sys.stderr)
+        r = session().get(url, timeout=timeout)
+        r.raise_for_status()
+        return r.content
+
+
+def _unchanged(meta: dict, since) -> bool:
+    return since is not None and meta.get("changed") is not None and meta["changed"] <= since
+
+
+def _fetch_cached(url: str, max_age: float, timeout: float, cache_dir: str, since):
+    stem = os.path.join(cache_dir, url_key(url))
+    body_path, meta_path = stem + ".body", stem + ".meta"
+
+    with _locked(stem + ".lock"):
+        try:
+            age = time.time() - os.path.getmtime(body_path)
+        except OSError:
+            age = None
+        meta = _read_meta(meta_path) if age is not None else {}
+        if age is not None and 0 <= age < max_age:
+            with open(body_path, "rb") as f:
+                data = f.read()
+            _bump(url, cache_dir, hits=1, bytes_saved=len(data))
+            return None if _unchanged(meta, since) else data
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            r = session().get(url, headers=headers, timeout=timeout)
+            if r.status_code == 304 and headers:
+                os.utime(body_path)
+                with open(body_path, "rb") as f:
+                    data = f.read()
+                _bump(url, cache_dir, not_modified=1, bytes_saved=len(data))
+                return None if _unchanged(meta, since) else data
+            r.raise_for_status()
+        except Exception:
+            _bump(url, cache_dir, errors=1)
+            raise
+
+        data = r.content
+        sha = hashlib.sha256(data).hexdigest()
+        # "changed" is when the content last differed, not when it was last downloaded
+        changed = meta.get("changed") if sha == meta.get("sha256") else None
+        _write(body_path, data, cache_dir)
+        meta = {"url": url, "etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified"),
+                "sha256": sha, "changed": changed if changed is not None else time.time()}
+        _write(meta_path, json.dumps(meta).encode("utf-8"), cache_dir)
+        _bump(url, cache_dir, misses=1, bytes_fetched=len(data), last_fetch=time.strftime("%F %T"))
+        return None if _unchanged(meta, since) else data
+
+
+def fetch_text(url: str, max_age: float = None, timeout: float = 30, cache_dir: str = CACHE_DIR) -> str:
+    return fetch(url, max_age, timeout, cache_dir).decode("utf-8", errors="replace")
+
+
+def load_stats(cache_dir: str = CACHE_DIR) -> dict:
+    try:
+        with open(os.path.join(cache_dir, "stats.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Fetch-once cache for upstream documents")
+    ap.add_argument("--cache-dir", default=CACHE_DIR)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    g = sub.add_parser("get", help="print (or save) a URL through the cache")
+    g.add_argument("url")
+    g.add_argument("-o", "--output", default=None, help="write here (atomically) instead of stdout")
+    g.add_argument("--max-age", type=float, default=None, help="override the URL's freshness window")
+    g.add_argument("--timeout", type=float, default=30)
+    s = sub.add_parser("stats", help="per-URL hit/miss counts and bytes saved")
+    s.add_argument("--json", action="store_true")
+    sub.add_parser("purge", help="drop cached bodies (stats are kept)")
+    args = ap.parse_args()
+
+    if args.cmd == "get":
+        try:
+            data = fetch(args.url, args.max_age, args.timeout, args.cache_dir)
+        except Exception as e:
+            print(f"lib_upstream: {args.url}: {e}", file=sys.stderr)
+            return 1
+        if args.output:
+            d = os.path.dirname(os.path.abspath(args.output))
+            fd, tmp = tempfile.mkstemp(prefix=".upstream.", dir=d)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, args.output)
+        else:
+            sys.stdout.buffer.write(data)
+        return 0
+
+    if args.cmd == "stats":
+        stats = load_stats(args.cache_dir)
+        if args.json:
+            print(json.dumps(stats, indent=1, sort_keys=True))
+            return 0
+        print(f"{'hits':>7}{'misses':>8}{'304':>6}{'errors':>8}{'fetched MB':>12}{'saved MB':>10}  url")
+        for url, st in sorted(stats.items()):
+            print(f"{st['hits']:7d}{st['misses']:8d}{st.get('not_modified', 0):6d}{st['errors']:8d}"
+                  f"{st['bytes_fetched'] / 2**20:12.2f}{st['bytes_saved'] / 2**20:10.2f}  {url}")
+        return 0
+
+    n = 0
+    for name in os.listdir(args.cache_dir) if os.path.isdir(args.cache_dir) else ():
+        if name.endswith((".body", ".meta")):
+            os.unlink(os.path.join(args.cache_dir, name))
+            n += 1
+    print(f"removed {n} cached bodies")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Resident scheduler for the space-weather generators.
+
+Imports swind/xray/bz/kindex/flux/ssn_simple once (pandas, requests, ...)
+and runs each job on its former crontab cadence in a forked child, so a run
+costs a fork instead of an interpreter start plus imports.  Each child writes
+to the same per-job log the crontab lines used.
+
+  - a job whose previous run is still going skips that tick (counted)
+  - a run longer than --timeout is killed and counted as a failure
+  - per-job runs, skips, failures, last exit status and wall time are kept
+    in --status (JSON), rewritten after every run
+  - on SIGTERM running jobs get SIGTERM, up to --grace seconds to finish and
+    then SIGKILL; they are reaped and the status file is written before exit
+
+Schedules use cron's minute/hour fields in local time, as before:
+
+  ssn     15 10,14      swind   */5       bz      */10
+  flux    7,37 *        xray    */5       kindex  */15
+
+Usage:
+  ohb_scheduler.py --daemon        # start in background unless already running (cron-safe)
+  ohb_scheduler.py                 # run in foreground
+  ohb_scheduler.py --once bz       # run one job now, in this process, and exit
+
+Dependencies: python3, pandas, requests (those of the generators)
+"""
+import argparse
+import fcntl
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+
+import bz_simple
+import flux_simple
+import kindex_simple
+import ssn_simple
+import swind_simple
+import xray_simple
+
+BASE = "/opt/hamclock-backend"
+LOG_DIR = f"{BASE}/logs"
+LOCK_PATH = f"{BASE}/tmp/ohb_scheduler.lock"
+STATUS_PATH = f"{BASE}/tmp/ohb_scheduler.json"
+KINDEX_OUT = f"{BASE}/htdocs/ham/HamClock/geomag/kindex.txt"
+
+
+def write_kindex() -> int:
+    """kindex_simple.main() prints to stdout; write the same text atomically like the crontab line did."""
+    text = kindex_simple.render()
+    tmp = KINDEX_OUT + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, KINDEX_OUT)
+    return 0
+
+
+# name -> (minute spec, hour spec, entry point, log file)
+JOBS = {
+    "ssn":    ("15", "10,14", ssn_simple.main, "ssn_simple.log"),
+    "swind":  ("*/5", "*", swind_simple.main, "gen_swind_24hr.log"),
+    "bz":     ("*/10", "*", bz_simple.main, "bz_simple.log"),
+    "flux":   ("7,37", "*", flux_simple.main, "flux_simple.log"),
+    "xray":   ("*/5", "*", xray_simple.main, "xray_simple.log"),
+    "kindex": ("*/15", "*", write_kindex, "kindex_simple.log"),
+}
+
+
+def cron_field(spec: str, lo: int, hi: int) -> frozenset:
+    """Values matched by one cron field ('*', '*/n', 'a,b', 'a-b', 'a-b/n')."""
+    out = set()
+    for part in spec.split(","):
+        rng, _, step = part.partition("/")
+        if rng == "*":
+            a, b = lo, hi
+        elif "-" in rng:
+            a, b = (int(v) for v in rng.split("-"))
+        else:
+            a = b = int(rng)
+        out.update(range(a, b + 1, int(step) if step else 1))
+    return frozenset(v for v in out if lo <= v <= hi)
+
+
+def run_job(name: str) -> int:
+    """Call a job's entry point; exit status like the script's own __main__."""
+    try:
+        rc = JOBS[name][2]()
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        if not isinstance(e.code, int) and e.code is not None:
+            print(e.code, file=sys.stderr)
+    except Exception:
+        traceback.print_exc()
+        rc = 1
+    return rc if isinstance(rc, int) else 0
+
+
+class Scheduler:
+    def __init__(self, log_dir: str, status_path: str, timeout: float, grace: float = 10.0):
+        self.log_dir = log_dir
+        self.status_path = status_path
+        self.timeout = timeout
+        self.grace = grace
+        self.when = {n: (cron_field(m, 0, 59), cron_field(h, 0, 23)) for n, (m, h, _, _) in JOBS.items()}
+        self.running = {}  # name -> (pid, start)
+        self.stats = {n: {"runs": 0, "failures": 0, "skipped": 0, "last_rc": None,
+                          "last_start": None, "last_wall_s": None, "max_wall_s": 0.0} for n in JOBS}
+
+    def start(self, name: str) -> None:
+        if name in self.running:
+            self.stats[name]["skipped"] += 1
+            print(f"{time.strftime('%F %T')} {name}: previous run still going, skipping tick", flush=True)
+            return
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                fd = os.open(os.path.join(self.log_dir, JOBS[name][3]), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                os.dup2(fd, 1)
+                os.dup2(fd, 2)
+                os.close(fd)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                code = run_job(name)
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code & 0xFF)
+        self.running[name] = (pid, time.time())
+        self.stats[name]["last_start"] = time.strftime("%F %T")
+
+    def reap(self) -> None:
+        now = time.time()
+        for name, (pid, t0) in list(self.running.items()):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done, status = pid, 0
+            if not done:
+                if now - t0 > self.timeout:
+                    print(f"{time.strftime('%F %T')} {name}: running {now - t0:.0f}s, killing", flush=True)
+                    os.kill(pid, signal.SIGKILL)
+                continue
+            del self.running[name]
+            rc = os.waitstatus_to_exitcode(status)
+            st = self.stats[name]
+            st["runs"] += 1
+            st["last_rc"] = rc
+            st["last_wall_s"] = round(now - t0, 2)
+            st["max_wall_s"] = max(st["max_wall_s"], st["last_wall_s"])
+            if rc != 0:
+                st["failures"] += 1
+                print(f"{time.strftime('%F %T')} {name}: exit {rc} after {now - t0:.1f}s", flush=True)
+            self.save()
+
+    def save(self) -> None:
+        tmp = self.status_path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"pid": os.getpid(), "updated": time.strftime("%F %T"), "jobs": self.stats}, f, indent=1)
+            os.replace(tmp, self.status_path)
+        except OSError as e:
+            print(f"status write failed: {e}", file=sys.stderr)
+
+    def loop(self) -> None:
+        stop = []
+        signal.signal(signal.SIGTERM, lambda *_: stop.append(1))
+        last_minute = None
+        while not stop:
+            self.reap()
+            now = time.localtime()
+            minute = (now.tm_yday, now.tm_hour, now.tm_min)
+            if minute != last_minute:
+                last_minute = minute
+                for name, (mins, hours) in self.when.items():
+                    if now.tm_min in mins and now.tm_hour in hours:
+                        self.start(name)
+            time.sleep(1.0)
+        self.stop_children()
+
+    def stop_children(self) -> None:
+        """SIGTERM running jobs, reap them for up to self.grace seconds, SIGKILL the rest; save status."""
+        for name, (pid, _) in self.running.items():
+            print(f"{time.strftime('%F %T')} {name}: stopping (pid {pid})", flush=True)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.time() + self.grace
+        while self.running and time.time() < deadline:
+            time.sleep(0.1)
+            self.reap()
+        for name, (pid, t0) in list(self.running.items()):
+            print(f"{time.strftime('%F %T')} {name}: still running after {self.grace:g}s, killing", flush=True)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            del self.running[name]
+            st = self.stats[name]
+            st["runs"] += 1
+            st["failures"] += 1
+            st["last_rc"] = -signal.SIGKILL
+            st["last_wall_s"] = round(time.time() - t0, 2)
+        self.save()
+
+
+def daemonize(log_path: str) -> None:
+    """Classic double fork; stdout/stderr go to log_path."""
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+    null = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null, 0)
+    os.close(null)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Resident scheduler for the space-weather generators")
+    ap.add_argument("--daemon", action="store_true", help="detach; exit at once if already running")
+    ap.add_argument("--log", default=f"{LOG_DIR}/ohb_scheduler.log", help="scheduler log when --daemon")
+    ap.add_argument("--log-dir", default=LOG_DIR, help="directory of the per-job logs")
+    ap.add_argument("--status", default=STATUS_PATH, help="per-job statistics (JSON)")
+    ap.add_argument("--lock", default=LOCK_PATH)
+    ap.add_argument("--timeout", type=float, default=600.0, help="kill a run after this many seconds")
+    ap.add_argument("--grace", type=float, default=10.0, help="seconds running jobs get to finish on SIGTERM")
+    ap.add_argument("--once", choices=sorted(JOBS), help="run one job in this process and exit")
+    args = ap.parse_args()
+
+    if args.once:
+        return run_job(args.once)
+
+    # One scheduler per host: the lock is held for the life of the process
+    lock = open(args.lock, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        if not args.daemon:
+            print(f"already running ({args.lock})")
+        return 0
+    if args.daemon:
+        lock.close()
+        daemonize(args.log)
+        lock = open(args.lock, "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return 0
+
+    sched = Scheduler(args.log_dir, args.status, args.timeout, args.grace)
+    print(f"{time.strftime('%F %T')} ohb_scheduler started (pid {os.getpid()}, jobs {', '.join(JOBS)})", flush=True)
+    sched.save()
+    sched.loop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
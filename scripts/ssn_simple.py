@@ -21,7 +21,7 @@ from pathlib import Path
 from typing import Optional
 
 import pandas as pd
-import requests
+from lib_upstream import fetch_text as fetch_shared, session
 
 NOAA_URL = "https://services.swpc.noaa.gov/text/daily-solar-indices.txt"
 SWPC_JSON_URL = "https://services.swpc.noaa.gov/json/solar-cycle/swpc_observed_ssn.json"
@@ -56,9 +56,7 @@ def read_existing(out_path: Path) -> pd.DataFrame:
 
 
 def read_noaa_swpc(url: str) -> pd.DataFrame:
-    r = requests.get(url, timeout=20)
-    r.raise_for_status()
-    lines = r.text.splitlines()
+    lines = fetch_shared(url, timeout=20).splitlines()  # shared with flux_simple.py
 
     rows = []
     for line in lines:
@@ -100,7 +98,7 @@ def get_swpc_json_today(url: str, today_utc) -> Optional[int]:
       { "Obsdate": "YYYY-MM-DDT00:00:00", "swpc_ssn": 69 }
     Return today's swpc_ssn or None if not present.
     """
-    r = requests.get(url, timeout=20)
+    r = session().get(url, timeout=20)
     r.raise_for_status()
     data = r.json()
     if not isinstance(data, list):
@@ -130,7 +128,7 @@ def get_silso_today(url: str, today_utc) -> Optional[int]:
     colspecs = [(0, 4), (5, 8), (8, 10), (11, 19), (20, 23), (24, 29), (30, 33), (34, 37)]
     names = ["year", "month", "day", "dec_date", "eisn", "sd", "ncalc", "navail"]
 
-    r = requests.get(url, timeout=20)
+    r = session().get(url, timeout=20)
     r.raise_for_status()
 
     df = pd.read_fwf(
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 """
-Build swind-24hr.txt (epoch density speed) from NOAA SWPC plasma-1-day.json.
+Build swind-24hr.txt (epoch density speed) from NOAA SWPC plasma data.
 
 Upstream:
-  https://services.swpc.noaa.gov/products/solar-wind/plasma-1-day.json
+  https://services.swpc.noaa.gov/products/solar-wind/plasma-2-hour.json
+  https://services.swpc.noaa.gov/products/solar-wind/plasma-1-day.json (seeding)
+
+History is kept in a ring buffer (lib_ringbuf.py): each run appends the new
+samples of the 2-hour product and renders from the buffer.  The 1-day product
+is read only when the buffer is empty or older than the 2-hour window.
 
 Output (one row per sample):
   <unix_epoch> <density> <speed>
@@ -23,13 +28,25 @@ import json
 import os
 import sys
 import tempfile
-import urllib.request
+import time
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+
+from lib_resample import upto
+from lib_ringbuf import RING_DIR, RingSeries
+from lib_upstream import fetch, output_mtime
 
-URL = "https://services.swpc.noaa.gov/products/solar-wind/plasma-1-day.json"
+URL = "https://services.swpc.noaa.gov/products/solar-wind/plasma-2-hour.json"
+SEED_URL = "https://services.swpc.noaa.gov/products/solar-wind/plasma-1-day.json"
 OUT = "/opt/hamclock-backend/htdocs/ham/HamClock/solar-wind/swind-24hr.txt"
 
+# density, speed; two days at 1-minute cadence
+RING = f"{RING_DIR}/plasma.ring"
+RING_CAPACITY = 2880
+
+# Fall back to SEED_URL when the newest stored sample is older than this
+SHORT_SPAN = 2 * 3600 - 900
+
 # 24h at ~1-minute cadence
 KEEP_N = 1440
 
@@ -53,10 +70,12 @@ def iso_to_epoch(s: str) -> int:
     raise ValueError(f"Unrecognized time_tag format: {s!r}")
 
 
-def fetch_json(url: str, timeout: int = 20) -> Any:
-    req = urllib.request.Request(url, headers={"User-Agent": "OHB-swind/1.2"})
-    with urllib.request.urlopen(req, timeout=timeout) as r:
-        return json.loads(r.read().decode("utf-8", errors="replace"))
+def fetch_json(url: str, timeout: int = 20, since: Optional[float] = None) -> Any:
+    """Parsed JSON, or None when upstream has not changed since epoch since."""
+    body = fetch(url, timeout=timeout, since=since)
+    if body is None:
+        return None
+    return json.loads(body.decode("utf-8", errors="replace"))
 
 
 def parse_plasma(rows: Any) -> List[Tuple[int, float, float]]:
@@ -113,20 +132,13 @@ def parse_plasma(rows: Any) -> List[Tuple[int, float, float]]:
     return dedup
 
 
-def apply_window(samples: List[Tuple[int, float, float]]) -> List[Tuple[int, float, float]]:
-    s = samples[:]
-    if not s:
-        return s
+def apply_window(t, v) -> Tuple[Any, Any]:
+    """Lag cutoff and last KEEP_N samples of the ascending series (epochs t, rows v)."""
+    if len(t) and LAG_SECONDS and LAG_SECONDS > 0:
+        n = upto(t, t[-1] - LAG_SECONDS)
+        t, v = t[:n], v[:n]
 
-    if LAG_SECONDS and LAG_SECONDS > 0:
-        newest = s[-1][0]
-        lag_cutoff = newest - LAG_SECONDS
-        s = [row for row in s if row[0] <= lag_cutoff]
-
-    if len(s) > KEEP_N:
-        s = s[-KEEP_N:]
-
-    return s
+    return t[-KEEP_N:], v[-KEEP_N:]
 
 
 def atomic_write(path: str, lines: List[str]) -> None:
@@ -146,14 +158,21 @@ def atomic_write(path: str, lines: List[str]) -> None:
 
 def main() -> int:
     try:
-        rows = fetch_json(URL)
-        samples = parse_plasma(rows)
-        samples = apply_window(samples)
-
-        if not samples:
+        with RingSeries(RING, 2, RING_CAPACITY) as ring:
+            seed = ring.last is None or time.time() - ring.last > SHORT_SPAN
+            rows = fetch_json(SEED_URL if seed else URL, since=None if seed else output_mtime(OUT))
+            if rows is None:
+                return 0  # upstream unchanged since OUT was written; OUT is current
+            new = parse_plasma(rows)
+            ring.append([s[0] for s in new], [s[1:] for s in new])
+            t, v = ring.read()
+
+        t, v = apply_window(t, v)
+
+        if not len(t):
             raise ValueError("No samples left after windowing; check LAG_SECONDS or upstream feed")
 
-        lines = [f"{t} {dens:.2f} {spd:.1f}\n" for (t, dens, spd) in samples]
+        lines = [f"{ti} {dens:.2f} {spd:.1f}\n" for ti, (dens, spd) in zip(t.tolist(), v.tolist())]
         atomic_write(OUT, lines)
         return 0
 
@@ -7,11 +7,17 @@ cd $GMT_USERDIR
 source "/opt/hamclock-backend/scripts/lib_sizes.sh"
 ohb_load_sizes   # populates SIZES=(...) per OHB conventions
 
+# Shared BMPv4 RGB565 codec (vectorized; see lib_bmp565.py)
+BMP565="/opt/hamclock-backend/scripts/lib_bmp565.py"
+
+# Fetch-once upstream cache, shared with gen_aurora.sh (see lib_upstream.py)
+UPSTREAM="/opt/hamclock-backend/scripts/lib_upstream.py"
+
 JSON=ovation.json
 XYZ=ovation.xyz
 
 echo "Fetching OVATION..."
-curl -fs https://services.swpc.noaa.gov/json/ovation_aurora_latest.json -o "$JSON"
+python3 "$UPSTREAM" get https://services.swpc.noaa.gov/json/ovation_aurora_latest.json -o "$JSON"
 
 # JSON -> XYZ in 0..360 longitude space for seamless polar gridding
 # The aurora wraps around the poles so 0/360 avoids a seam in the grid.
@@ -62,52 +68,12 @@ EOF
 # Write BMPv4 (BITMAPV4HEADER), 16bpp RGB565, top-down — matches ClearSkyInstitute format
 make_bmp_v4_rgb565_topdown() {
   local inraw="$1" outbmp="$2" W="$3" H="$4"
-  python3 - <<'PY' "$inraw" "$outbmp" "$W" "$H"
-import struct, sys
-inraw, outbmp, W, H = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
-
-raw = open(inraw, "rb").read()
-exp = W*H*3
-if len(raw) != exp:
-    raise SystemExit(f"RAW size {len(raw)} != expected {exp}")
-
-pix = bytearray(W*H*2)
-j = 0
-for i in range(0, len(raw), 3):
-    r = raw[i]; g = raw[i+1]; b = raw[i+2]
-    v = ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
-    pix[j:j+2] = struct.pack("<H", v)
-    j += 2
-
-bfOffBits = 14 + 108
-bfSize = bfOffBits + len(pix)
-filehdr = struct.pack("<2sIHHI", b"BM", bfSize, 0, 0, bfOffBits)
-
-biSize = 108
-rmask, gmask, bmask, amask = 0xF800, 0x07E0, 0x001F, 0x0000
-cstype = 0x73524742  # sRGB
-endpoints = b"\x00"*36
-gamma = b"\x00"*12
-
-v4hdr = struct.pack("<IiiHHIIIIII",
-    biSize, W, -H, 1, 16, 3, len(pix), 0, 0, 0, 0
-) + struct.pack("<IIII", rmask, gmask, bmask, amask) \
-  + struct.pack("<I", cstype) + endpoints + gamma
-
-with open(outbmp, "wb") as f:
-    f.write(filehdr)
-    f.write(v4hdr)
-    f.write(pix)
-PY
+  python3 "$BMP565" raw2bmp "$inraw" "$outbmp" "$W" "$H"
 }
 
 zlib_compress() {
   local in="$1" out="$2"
-  python3 -c "
-import zlib, sys
-data = open(sys.argv[1], 'rb').read()
-open(sys.argv[2], 'wb').write(zlib.compress(data, 9))
-" "$in" "$out"
+  python3 "$BMP565" compress "$in" "$out"
 }
 
 echo "Rendering maps..."
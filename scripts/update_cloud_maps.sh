@@ -8,6 +8,9 @@ OUTDIR="/opt/hamclock-backend/htdocs/ham/HamClock/maps"
 source "/opt/hamclock-backend/scripts/lib_sizes.sh"
 ohb_load_sizes
 
+# Shared BMPv4 RGB565 codec (vectorized; see lib_bmp565.py)
+BMP565="/opt/hamclock-backend/scripts/lib_bmp565.py"
+
 FTP_DIR="ftp://public.sos.noaa.gov/rt/sat/linear/raw/"
 PATTERN='^linear_rgb_cyl_[0-9]{8}_[0-9]{4}\.jpg$'
 
@@ -54,105 +57,13 @@ curl -fsS -A "open-hamclock-backend/1.0" --retry 2 --retry-delay 2 "${FTP_DIR}${
 
 # Build BMPv4 RGB565 top-down from a raw RGB888 file
 make_bmp_v4_rgb565_topdown() {
-  local inraw="$1"
-  local outbmp="$2"
-  local W="$3"
-  local H="$4"
-
-  python3 - <<'PY' "$inraw" "$outbmp" "$W" "$H"
-import struct, sys
-
-inraw, outbmp, W, H = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
-
-raw = open(inraw, "rb").read()
-exp = W*H*3
-if len(raw) != exp:
-    raise SystemExit(f"RAW size {len(raw)} != expected {exp}")
-
-pix = bytearray(W*H*2)
-j = 0
-for i in range(0, len(raw), 3):
-    r = raw[i]
-    g = raw[i+1]
-    b = raw[i+2]
-    v = ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
-    pix[j:j+2] = struct.pack("<H", v)
-    j += 2
-
-bfType = b"BM"
-bfOffBits = 14 + 108  # 122
-bfSize = bfOffBits + len(pix)
-filehdr = struct.pack("<2sIHHI", bfType, bfSize, 0, 0, bfOffBits)
-
-biSize = 108
-biWidth = W
-biHeight = -H            # top-down
-biPlanes = 1
-biBitCount = 16
-biCompression = 3        # BI_BITFIELDS
-biSizeImage = len(pix)
-
-bV4RedMask   = 0xF800
-bV4GreenMask = 0x07E0
-bV4BlueMask  = 0x001F
-bV4AlphaMask = 0x0000
-bV4CSType    = 0x73524742  # 'sRGB'
-endpoints = b"\x00" * 36
-gamma = b"\x00" * 12
-
-v4hdr = struct.pack(
-    "<IiiHHIIIIII",
-    biSize, biWidth, biHeight, biPlanes, biBitCount, biCompression,
-    biSizeImage, 0, 0, 0, 0
-) + struct.pack("<IIII", bV4RedMask, bV4GreenMask, bV4BlueMask, bV4AlphaMask) \
-  + struct.pack("<I", bV4CSType) + endpoints + gamma
-
-if len(v4hdr) != 108:
-    raise SystemExit(f"V4 header length {len(v4hdr)} != 108")
-
-with open(outbmp, "wb") as f:
-    f.write(filehdr)
-    f.write(v4hdr)
-    f.write(pix)
-
-# Validate core expectations (prevents "file not bmp" surprises)
-with open(outbmp, "rb") as f:
-    if f.read(2) != b"BM":
-        raise SystemExit("BAD: signature")
-    f.seek(2); fsize = struct.unpack("<I", f.read(4))[0]
-    f.seek(10); off = struct.unpack("<I", f.read(4))[0]
-    f.seek(14); dib = struct.unpack("<I", f.read(4))[0]
-    w = struct.unpack("<i", f.read(4))[0]
-    h = struct.unpack("<i", f.read(4))[0]
-    planes = struct.unpack("<H", f.read(2))[0]
-    bpp = struct.unpack("<H", f.read(2))[0]
-    comp = struct.unpack("<I", f.read(4))[0]
-    f.seek(14+40); r,g,b = struct.unpack("<III", f.read(12))
-
-exp_size = 122 + W*H*2
-errs = []
-if off != 122: errs.append(f"bfOffBits={off} (expected 122)")
-if dib != 108: errs.append(f"DIB size={dib} (expected 108 BMPv4)")
-if w != W or h != -H: errs.append(f"w,h={w},{h} (expected {W},-{H})")
-if planes != 1: errs.append(f"planes={planes} (expected 1)")
-if bpp != 16: errs.append(f"bpp={bpp} (expected 16)")
-if comp != 3: errs.append(f"comp={comp} (expected 3)")
-if (r,g,b) != (0xF800,0x07E0,0x001F): errs.append(f"masks={hex(r)},{hex(g)},{hex(b)}")
-if fsize != exp_size: errs.append(f"file size={fsize} (expected {exp_size})")
-
-if errs:
-    raise SystemExit("BAD BMP:\n  " + "\n  ".join(errs))
-PY
+  local inraw="$1" outbmp="$2" W="$3" H="$4"
+  python3 "$BMP565" raw2bmp "$inraw" "$outbmp" "$W" "$H"
 }
 
 zlib_compress() {
-  local in="$1"
-  local out="$2"
-  python3 - <<'PY' "$in" "$out"
-import zlib, sys
-data = open(sys.argv[1], "rb").read()
-open(sys.argv[2], "wb").write(zlib.compress(data, 9))
-PY
+  local in="$1" out="$2"
+  python3 "$BMP565" compress "$in" "$out"
 }
 
 for wh in "${SIZES[@]}"; do
@@ -208,18 +119,9 @@ for wh in "${SIZES[@]}"; do
     fi
   done
 
-  # Verify .z actually decompresses into a BMP and has expected size
-  python3 - <<'PY' "$day_out_z" "$night_out_z" "$W" "$H"
-import sys, zlib, struct
-W, H = int(sys.argv[3]), int(sys.argv[4])
-exp = 122 + W*H*2  # BMPv4 header (122) + RGB565 pixels
-for p in sys.argv[1:3]:
-    data = zlib.decompress(open(p, "rb").read())
-    if data[:2] != b"BM":
-        raise SystemExit(f"BAD: {p} does not decompress to BMP (missing 'BM')")
-    if len(data) != exp:
-        raise SystemExit(f"BAD: {p} decompressed size {len(data)} != expected {exp}")
-PY
+  # Verify .z actually decompresses into a valid BMPv4 RGB565 of the expected size
+  python3 "$BMP565" check "$day_out_z"   "$W" "$H" >/dev/null
+  python3 "$BMP565" check "$night_out_z" "$W" "$H" >/dev/null
 
   # Emit strong “created” log lines with byte sizes (easy to grep in cron logs)
   log "CREATED: $day_out_bmp bytes=$(filesize "$day_out_bmp") zbytes=$(filesize "$day_out_z")"
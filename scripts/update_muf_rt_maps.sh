@@ -13,34 +13,40 @@ PY="${PY:-python3}"
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 BUILDER="${BUILDER:-$SCRIPT_DIR/build_muf_rt.py}"
 
-for sz in "${SIZES[@]}"; do
-  w="${sz%x*}"
-  h="${sz#*x}"
-
-  base_day="$MAPDIR/map-D-$sz-Countries.bmp.z"
-  base_night="$MAPDIR/map-N-$sz-Countries.bmp.z"
-
-  if [[ ! -s "$base_day" ]]; then
-    echo "WARN: missing base day $base_day; skipping $sz" >&2
-    continue
-  fi
-  if [[ ! -s "$base_night" ]]; then
-    echo "WARN: missing base night $base_night; skipping $sz" >&2
-    continue
-  fi
-
-  echo "Rendering MUF-RT $sz (D+N) ..."
-  "$PY" "$BUILDER" \
-    --width "$w" --height "$h" \
-    --base-day "$base_day" \
-    --base-night "$base_night" \
-    --outdir "$OUTDIR" \
-    --product "MUF-RT" \
-    --alpha 0.55 \
-    --active-seconds 3600 \
-    --min-confidence 0.0 \
-    --k 24 \
-    --p 2.0 \
-    --debug-png
-done
-
+# Low-RAM hosts (e.g. Raspberry Pi): set MUF_RT_MAX_MEMORY_MB to render in
+# row bands within roughly that budget. Output is identical; --debug-png is
+# skipped in that mode.
+STREAM_ARGS=()
+if [[ -n "${MUF_RT_MAX_MEMORY_MB:-}" ]]; then
+  STREAM_ARGS=(--stream --max-memory-mb "$MUF_RT_MAX_MEMORY_MB")
+fi
+
+# Per-size D/N renders can run in parallel worker processes. Each 7920x3960
+# task holds a few hundred MB, so the default is serial; hosts with RAM to
+# spare can set e.g. MUF_RT_JOBS=$(nproc).
+JOBS="${MUF_RT_JOBS:-1}"
+
+# IDW neighbour weights are cached per station set so a run whose stations
+# have not moved skips the neighbour search. The builder keeps the two most
+# recent sets (about 190 MB each at the default grid and k). Set
+# MUF_RT_IDW_CACHE_DIR= (empty) to turn the cache off.
+IDW_CACHE_DIR="${MUF_RT_IDW_CACHE_DIR-/opt/hamclock-backend/cache/muf-rt-idw}"
+
+# One builder run for every size: stations are fetched and interpolated once,
+# then the field is resampled per size. Sizes missing a D or N Countries base
+# are skipped with a warning by the builder.
+echo "Rendering MUF-RT ${OHB_SIZES_NORM} (D+N) ..."
+"$PY" "$BUILDER" \
+  --sizes "$OHB_SIZES_NORM" \
+  --basedir "$MAPDIR" \
+  --outdir "$OUTDIR" \
+  --product "MUF-RT" \
+  --alpha 0.55 \
+  --active-seconds 3600 \
+  --min-confidence 0.0 \
+  --k 24 \
+  --p 2.0 \
+  --debug-png \
+  --jobs "$JOBS" \
+  --idw-cache-dir "$IDW_CACHE_DIR" \
+  "${STREAM_ARGS[@]}"
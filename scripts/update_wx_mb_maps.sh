@@ -98,97 +98,29 @@ fi
 render_one() {
   local tag="$1" W="$2" H="$3" base="$4"
 
+  PYTHONPATH="/opt/hamclock-backend/scripts${PYTHONPATH:+:$PYTHONPATH}" \
   python3 - <<'PY' "$TMPDIR/gfs.grb2" "$base" "$OUTDIR" "$tag" "$W" "$H"
-import sys, zlib, struct
+import sys
 import numpy as np
 import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import pygrib
+from lib_bmp565 import load_bmp_v4_rgb565_cached, rgb565_to_rgb888, write_bmp_v4_rgb565_topdown
 
 grb_path, base_path, outdir, tag, W, H = sys.argv[1:]
 W = int(W); H = int(H)
 
-def zread(path: str) -> bytes:
-    data = open(path, "rb").read()
-    return zlib.decompress(data) if path.endswith(".z") else data
-
-def read_bmp_v4_rgb565_topdown(blob: bytes):
-    if blob[0:2] != b"BM":
-        raise ValueError("Not BMP")
-    bfOffBits = struct.unpack_from("<I", blob, 10)[0]
-    dib = struct.unpack_from("<I", blob, 14)[0]
-    w = struct.unpack_from("<i", blob, 18)[0]
-    h = struct.unpack_from("<i", blob, 22)[0]
-    planes = struct.unpack_from("<H", blob, 26)[0]
-    bpp = struct.unpack_from("<H", blob, 28)[0]
-    comp = struct.unpack_from("<I", blob, 30)[0]
-    if bfOffBits != 122 or dib != 108 or planes != 1 or bpp != 16 or comp != 3:
-        raise ValueError(f"Unexpected BMP header off={bfOffBits} dib={dib} planes={planes} bpp={bpp} comp={comp}")
-    if h >= 0:
-        raise ValueError("Expected top-down BMP (negative height)")
-    H0 = -h
-    pix = blob[bfOffBits:bfOffBits + (w*H0*2)]
-    arr = np.frombuffer(pix, dtype="<u2").reshape((H0, w))
-    return w, H0, arr
-
-def rgb565_to_rgb888(arr565: np.ndarray) -> np.ndarray:
-    a = arr565.astype(np.uint16)
-    r = ((a >> 11) & 0x1F).astype(np.uint16)
-    g = ((a >> 5)  & 0x3F).astype(np.uint16)
-    b = (a & 0x1F).astype(np.uint16)
-    r8 = ((r * 255 + 15) // 31).astype(np.uint8)
-    g8 = ((g * 255 + 31) // 63).astype(np.uint8)
-    b8 = ((b * 255 + 15) // 31).astype(np.uint8)
-    return np.stack([r8, g8, b8], axis=2)
-
-def rgb888_to_rgb565(rgb: np.ndarray) -> np.ndarray:
-    r = (rgb[:,:,0].astype(np.uint16) >> 3) & 0x1F
-    g = (rgb[:,:,1].astype(np.uint16) >> 2) & 0x3F
-    b = (rgb[:,:,2].astype(np.uint16) >> 3) & 0x1F
-    return (r << 11) | (g << 5) | b
-
-def write_bmp_v4_rgb565_topdown(path: str, arr565: np.ndarray):
-    H0, W0 = arr565.shape
-    bfOffBits = 122
-    pix = arr565.astype("<u2").tobytes()
-    bfSize = bfOffBits + len(pix)
-    filehdr = struct.pack("<2sIHHI", b"BM", bfSize, 0, 0, bfOffBits)
-
-    biSize = 108
-    biWidth = W0
-    biHeight = -H0
-    biPlanes = 1
-    biBitCount = 16
-    biCompression = 3
-    biSizeImage = len(pix)
-
-    rmask, gmask, bmask, amask = 0xF800, 0x07E0, 0x001F, 0x0000
-    cstype = 0x73524742  # 'sRGB'
-    endpoints = b"\x00"*36
-    gamma0 = b"\x00"*12
-
-    v4hdr = struct.pack(
-        "<IiiHHIIIIII",
-        biSize, biWidth, biHeight, biPlanes, biBitCount, biCompression,
-        biSizeImage, 0, 0, 0, 0
-    ) + struct.pack("<IIII", rmask, gmask, bmask, amask) + struct.pack("<I", cstype) + endpoints + gamma0
-
-    with open(path, "wb") as f:
-        f.write(filehdr); f.write(v4hdr); f.write(pix)
-
-def zwrite(path: str, blob: bytes):
-    with open(path, "wb") as f:
-        f.write(zlib.compress(blob, 9))
-
 def resize_nn(arr: np.ndarray, out_h: int, out_w: int) -> np.ndarray:
     in_h, in_w = arr.shape
     yi = (np.linspace(0, in_h-1, out_h)).astype(np.int32)
     xi = (np.linspace(0, in_w-1, out_w)).astype(np.int32)
     return arr[yi][:, xi]
 
-# Load size-matched countries base (must already be WxH)
-bw, bh, base565 = read_bmp_v4_rgb565_topdown(zread(base_path))
+# Load size-matched countries base (must already be WxH); decoded once and
+# memory-mapped from the base cache on later runs
+base565 = load_bmp_v4_rgb565_cached(base_path)
+bh, bw = base565.shape
 if (bw, bh) != (W, H):
     raise SystemExit(f"ERROR: base map is {bw}x{bh}, expected {W}x{H}: {base_path}")
 base_rgb = rgb565_to_rgb888(base565)
@@ -256,9 +188,7 @@ plt.close(fig)
 out_bmp = f"{outdir}/map-{tag}-{W}x{H}-Wx-mB.bmp"
 out_z   = out_bmp + ".z"
 
-arr565 = rgb888_to_rgb565(img)
-write_bmp_v4_rgb565_topdown(out_bmp, arr565)
-zwrite(out_z, open(out_bmp, "rb").read())
+write_bmp_v4_rgb565_topdown(img, out_bmp, out_z)
 
 print("OK:", out_z)
 PY
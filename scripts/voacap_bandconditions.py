@@ -19,17 +19,31 @@ Fields used from dvoacap Prediction:
 Sigmoid parameters (c=-2.0, k=0.14, N=0.40) were grid-search optimised against the
 full CSI 24-hour reference output for FL→CA path, Jan 2026, SSN=39.
 """
+from __future__ import annotations
+
 import argparse
+import fcntl
+import hashlib
 import json
 import math
+import multiprocessing
+import os
+import queue
 import sys
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
 
 import numpy as np
-from dvoacap.path_geometry import GeoPoint
-from dvoacap.prediction_engine import PredictionEngine
+
+# dvoacap is imported where an engine is first needed (and by __getattr__ for
+# vb.GeoPoint / vb.PredictionEngine), so a cache hit never loads it
+if TYPE_CHECKING:
+    from dvoacap.path_geometry import GeoPoint
+    from dvoacap.prediction_engine import PredictionEngine
 
 # 9 columns, CSI/HamClock style: 160, 80, 40, 30, 20, 17, 15, 12, 10
 FREQS_MHZ = [1.8, 3.5, 7.0, 10.1, 14.0, 18.1, 21.0, 24.9, 28.0]
@@ -48,6 +62,20 @@ MUF_EXPONENT      =  0.40  # muf_day^N — suppresses near/above-MUF bands
 # muf_day below this is treated as "band above MUF" → score = 0
 MUF_DEAD_THRESHOLD = 1e-4
 
+# Result cache budgets (see BandCache)
+CACHE_MAX_BYTES     = 64 * 1024 * 1024  # disk tier
+CACHE_MEM_BYTES     = 8 * 1024 * 1024   # in-process tier
+CACHE_SWEEP_SECONDS = 60                # min interval between disk sweeps
+CACHE_ORPHAN_SECONDS = 3600             # idle lock / leftover temp files older than this are removed
+
+# Opt-in request quantisation (see canonical_args): Maidenhead cell sizes, degrees (lat, lon).
+# Error per level is measured with voacap_quant_error.py; on random circuits "subsquare"
+# kept p99 error at 0.01 (max 0.12 near band edges), "square" reached p99 0.33.
+QUANT_GRIDS = {
+    "subsquare": (2.5 / 60.0, 5.0 / 60.0),  # 6-char locator, ~4.6 x 9 km at the equator
+    "square":    (1.0, 2.0),                # 4-char locator
+}
+
 
 def clamp01(x: float) -> float:
     if x != x:
@@ -67,13 +95,51 @@ def path_int_to_string(path_int: int) -> str:
     return "LP" if path_int == 1 else "SP"
 
 
+def __getattr__(name: str):
+    if name == "GeoPoint":
+        from dvoacap.path_geometry import GeoPoint
+        return GeoPoint
+    if name == "PredictionEngine":
+        from dvoacap.prediction_engine import PredictionEngine
+        return PredictionEngine
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def resolve_rx(args: argparse.Namespace) -> GeoPoint:
+    from dvoacap.path_geometry import GeoPoint
     if abs(args.rxlat) < 1e-9 and abs(args.rxlng) < 1e-9:
         if args.rx_default_lat is not None and args.rx_default_lon is not None:
             return GeoPoint.from_degrees(args.rx_default_lat, args.rx_default_lon)
     return GeoPoint.from_degrees(args.rxlat, args.rxlng)
 
 
+def prediction_inputs(pred) -> tuple:
+    """(snr_xx, muf_day) of one dvoacap Prediction; NaN snr / 0 muf where missing."""
+    sig_obj = getattr(pred, "signal", None)
+    if sig_obj is None:
+        return math.nan, 0.0
+    snr_xx = getattr(pred, "snr_xx", None)
+    if snr_xx is None:
+        snr_xx = getattr(sig_obj, "snr_xx", None)
+    return (math.nan if snr_xx is None else float(snr_xx)), float(getattr(sig_obj, "muf_day", 0.0))
+
+
+def score_array(snr_xx: np.ndarray, muf_day: np.ndarray) -> np.ndarray:
+    """
+    Vectorised score_prediction() over arrays of any (matching) shape.
+
+    Entries with muf_day < MUF_DEAD_THRESHOLD, a missing (NaN) snr_xx or a
+    NaN result score 0.0, exactly like the scalar path.
+    """
+    snr = np.asarray(snr_xx, dtype=np.float64)
+    muf = np.asarray(muf_day, dtype=np.float64)
+    live = (muf >= MUF_DEAD_THRESHOLD) & ~np.isnan(snr)
+    with np.errstate(over="ignore", invalid="ignore"):
+        sigmoid = 1.0 / (1.0 + np.exp(-SIGMOID_STEEPNESS * (snr - SIGMOID_CENTER)))
+        score = sigmoid * np.power(np.where(live, muf, 0.0), MUF_EXPONENT)
+    return np.where(live, np.clip(np.nan_to_num(score, nan=0.0), 0.0, 1.0), 0.0)
+
+
 def score_prediction(band: str, pred, debug: bool = False) -> float:
     """
     Compute 0..1 band score from a dvoacap Prediction object.
@@ -115,17 +181,31 @@ def score_prediction(band: str, pred, debug: bool = False) -> float:
     return score
 
 
+def hour_inputs(eng: PredictionEngine, rx: GeoPoint, hour: int) -> np.ndarray:
+    """Run one hour and return its (2, 9) [snr_xx, muf_day] inputs; missing bands score 0."""
+    eng.predict(rx_location=rx, utc_time=float(hour) / 24.0, frequencies=FREQS_MHZ)
+    out = np.empty((2, len(FREQS_MHZ)), dtype=np.float64)
+    out[0] = math.nan
+    out[1] = 0.0
+    for i, pred in enumerate(eng.predictions[:len(FREQS_MHZ)]):
+        out[:, i] = prediction_inputs(pred)
+    return out
+
+
 def compute_hour_row(
     eng: PredictionEngine, rx: GeoPoint, hour: int, debug: bool = False
 ) -> List[float]:
-    eng.predict(rx_location=rx, utc_time=float(hour) / 24.0, frequencies=FREQS_MHZ)
     if debug:
+        eng.predict(rx_location=rx, utc_time=float(hour) / 24.0, frequencies=FREQS_MHZ)
         print(f"\nUTC {hour:02d}:", file=sys.stderr)
-    row = [score_prediction(b, p, debug=debug) for b, p in zip(BANDS, eng.predictions)]
-    return (row + [0.0] * 9)[:9]
+        row = [score_prediction(b, p, debug=debug) for b, p in zip(BANDS, eng.predictions)]
+        return (row + [0.0] * 9)[:9]
+    snr_xx, muf_day = hour_inputs(eng, rx, hour)
+    return score_array(snr_xx, muf_day).tolist()
 
 
 def cache_key(args: argparse.Namespace) -> str:
+    """SHA-256 over the canonical JSON of every parameter that affects the rows."""
     obj = {
         "year":   args.year,
         "month":  args.month,
@@ -148,39 +228,268 @@ def cache_key(args: argparse.Namespace) -> str:
         "muf_n":    MUF_EXPONENT,
     }
     s = json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("utf-8")
-    return str(abs(sum(s) + 1315423911 * len(s)))
+    return hashlib.sha256(s).hexdigest()
 
 
-def load_cache(cache_dir: Path, key: str, ttl: int) -> Optional[List[List[float]]]:
-    if ttl <= 0:
-        return None
-    p = cache_dir / f"bandcond_{key}.json"
-    try:
-        if (time.time() - p.stat().st_mtime) > ttl:
-            return None
-        obj = json.loads(p.read_text(encoding="utf-8"))
-        rows = obj.get("rows")
-        if isinstance(rows, list) and len(rows) == 24:
-            return rows
-    except Exception:
-        return None
-    return None
-
+def snap_to_grid(lat: float, lon: float, grid: str) -> tuple:
+    """Centre of the QUANT_GRIDS[grid] Maidenhead cell containing (lat, lon)."""
+    dlat, dlon = QUANT_GRIDS[grid]
+    lat = min(max(lat, -90.0), 90.0 - 1e-9)
+    lon = ((lon + 180.0) % 360.0) - 180.0
+    return (
+        round(-90.0 + (math.floor((lat + 90.0) / dlat) + 0.5) * dlat, 6),
+        round(-180.0 + (math.floor((lon + 180.0) / dlon) + 0.5) * dlon, 6),
+    )
 
-def save_cache(cache_dir: Path, key: str, rows: List[List[float]]) -> None:
-    try:
-        cache_dir.mkdir(parents=True, exist_ok=True)
-        p = cache_dir / f"bandcond_{key}.json"
-        p.write_text(json.dumps({"rows": rows}), encoding="utf-8")
-    except Exception:
-        pass
 
+def canonical_args(args: argparse.Namespace, grid: Optional[str] = None,
+                   ssn_step: float = 0.0) -> argparse.Namespace:
+    """
+    Copy of args with TX/RX snapped to grid-cell centres and SSN rounded to a
+    multiple of ssn_step, so nearby requests share one computation and cache
+    entry.  grid=None and ssn_step<=0 leave the respective values alone.
+    """
+    out = argparse.Namespace(**vars(args))
+    if grid:
+        if abs(out.rxlat) < 1e-9 and abs(out.rxlng) < 1e-9 and \
+                out.rx_default_lat is not None and out.rx_default_lon is not None:
+            out.rxlat, out.rxlng = out.rx_default_lat, out.rx_default_lon
+        out.rx_default_lat = out.rx_default_lon = None
+        out.txlat, out.txlng = snap_to_grid(out.txlat, out.txlng, grid)
+        out.rxlat, out.rxlng = snap_to_grid(out.rxlat, out.rxlng, grid)
+    if ssn_step > 0:
+        out.ssn = max(0.0, round(float(out.ssn) / ssn_step) * ssn_step)
+    return out
+
+
+class BandCache:
+    """
+    Two-tier cache of 24-hour score rows: in-process LRU in front of disk.
+
+    Disk entries live in cache_dir/<key[:2]>/<key>.json and hold the
+    creation time, which the TTL is checked against; the file mtime is
+    bumped on every hit and serves as the LRU clock.  Both tiers are bounded
+    by a byte budget: the memory tier evicts on insert, the disk tier is
+    swept (expired first, then least recently used down to 90% of budget) at
+    most every CACHE_SWEEP_SECONDS or as soon as this process has written
+    more than a tenth of the budget.  Thread-safe; counters are in stats().
+
+    get_or_compute() is single-flight across threads and processes: callers
+    missing the same key serialise on <key>.lock, and those that waited read
+    the first caller's result ("coalesced" counts the computations saved).
+    The sweep only ages and evicts the .json entries; a lock file is removed
+    once idle for CACHE_ORPHAN_SECONDS and only while holding its flock, and
+    a lock holder re-opens the path if it was removed underneath it.
+    """
 
-def compute_rows(args: argparse.Namespace, debug: bool = False) -> List[List[float]]:
+    def __init__(self, cache_dir, ttl: int, max_bytes: int = CACHE_MAX_BYTES,
+                 mem_bytes: int = CACHE_MEM_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.mem_bytes = mem_bytes
+        self._mem = OrderedDict()  # key -> (created, size, rows)
+        self._mem_used = 0
+        self._written = 0
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(
+            ("mem_hits", "disk_hits", "misses", "expired", "mem_evictions", "disk_evictions",
+             "coalesced"), 0)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def _remember(self, key: str, created: float, size: int, rows) -> None:
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._mem_used -= old[1]
+            if size > self.mem_bytes:
+                return
+            self._mem[key] = (created, size, rows)
+            self._mem_used += size
+            while self._mem_used > self.mem_bytes:
+                _, (_, sz, _) = self._mem.popitem(last=False)
+                self._mem_used -= sz
+                self.counters["mem_evictions"] += 1
+
+    def get(self, key: str) -> Optional[List[List[float]]]:
+        if self.ttl <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None and now - hit[0] <= self.ttl:
+                self._mem.move_to_end(key)
+                self.counters["mem_hits"] += 1
+                return hit[2]
+        p = self._path(key)
+        try:
+            data = p.read_bytes()
+            obj = json.loads(data)
+            created, rows = float(obj["t"]), obj["rows"]
+            if now - created > self.ttl:
+                self._count("expired")
+                raise LookupError(key)
+            if not (isinstance(rows, list) and len(rows) == 24):
+                raise ValueError(key)
+        except Exception:
+            self._count("misses")
+            return None
+        try:
+            os.utime(p)
+        except OSError:
+            pass
+        self._remember(key, created, len(data), rows)
+        self._count("disk_hits")
+        return rows
+
+    def put(self, key: str, rows: List[List[float]]) -> None:
+        created = time.time()
+        data = json.dumps({"t": created, "rows": rows}).encode("utf-8")
+        self._remember(key, created, len(data), rows)
+        p = self._path(key)
+        tmp = p.with_name(f".{p.name}.{os.getpid()}.{threading.get_ident()}")
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(data)
+            os.replace(tmp, p)
+        except OSError:
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._written += len(data)
+            due = self._written > self.max_bytes // 10
+        if due or self._sweep_due():
+            self.sweep()
+
+    def get_or_compute(self, key: str, compute) -> List[List[float]]:
+        """Cached rows for key, else compute() them once for all concurrent callers."""
+        rows = self.get(key)
+        if rows is not None:
+            return rows
+        lock_path = self._path(key).with_suffix(".lock")
+        waited = False
+        while True:
+            try:
+                if self.ttl <= 0:
+                    raise OSError("cache disabled, nothing to share")
+                lock_path.parent.mkdir(parents=True, exist_ok=True)
+                lf = open(lock_path, "a")
+            except OSError:
+                rows = compute()
+                self.put(key, rows)
+                return rows
+            with lf:
+                try:
+                    fcntl.flock(lf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Someone is computing this key: wait for them, then use their rows
+                    fcntl.flock(lf, fcntl.LOCK_EX)
+                    waited = True
+                try:
+                    same = os.fstat(lf.fileno()).st_ino == os.stat(lock_path).st_ino
+                except OSError:
+                    same = False
+                if not same:
+                    continue  # swept while we waited: lock the current file instead
+                if waited:
+                    rows = self.get(key)
+                    if rows is not None:
+                        self._count("coalesced")
+                        return rows
+                os.utime(lf.fileno())  # last use, for the sweep
+                rows = compute()
+                self.put(key, rows)
+                return rows
+
+    def _sweep_due(self) -> bool:
+        try:
+            return time.time() - (self.cache_dir / ".sweep").stat().st_mtime > CACHE_SWEEP_SECONDS
+        except OSError:
+            return True
+
+    def sweep(self) -> None:
+        """Drop expired entries, then least recently used ones until under budget."""
+        try:
+            (self.cache_dir / ".sweep").touch()
+        except OSError:
+            return
+        with self._lock:
+            self._written = 0
+        now = time.time()
+        entries, total, evicted = [], 0, 0
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir(follow_symlinks=False):
+                # pre-sharding flat layout (bandcond_<n>.json) is never read again
+                if shard.name.startswith("bandcond_"):
+                    try:
+                        os.unlink(shard.path)
+                    except OSError:
+                        pass
+                continue
+            for e in os.scandir(shard.path):
+                try:
+                    st = e.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if not e.name.endswith(".json") or e.name.startswith("."):
+                    # <key>.lock and in-flight .<key>.json.<pid>.<tid> files are not entries
+                    if now - st.st_mtime > CACHE_ORPHAN_SECONDS:
+                        self._drop_orphan(e.path, e.name.endswith(".lock"))
+                    continue
+                # mtime is last use; an entry idle for a whole TTL is expired too
+                if self.ttl > 0 and now - st.st_mtime > self.ttl:
+                    try:
+                        os.unlink(e.path)
+                        evicted += 1
+                    except OSError:
+                        pass
+                    continue
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+        if total > self.max_bytes:
+            target = self.max_bytes * 9 // 10
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                    evicted += 1
+                    total -= size
+                except OSError:
+                    pass
+        self._count("disk_evictions", evicted)
+
+    @staticmethod
+    def _drop_orphan(path: str, is_lock: bool) -> None:
+        """Unlink a leftover temp file, or a lock file nobody holds (checked with a non-blocking flock)."""
+        try:
+            if not is_lock:
+                os.unlink(path)
+                return
+            with open(path, "a") as lf:
+                fcntl.flock(lf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.unlink(path)
+        except OSError:
+            pass  # held (BlockingIOError) or already gone
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, "mem_entries": len(self._mem), "mem_bytes": self._mem_used}
+
+
+def configure_engine(eng: PredictionEngine, args: argparse.Namespace) -> PredictionEngine:
+    """Set every request-dependent engine parameter, so one engine can serve many requests."""
+    from dvoacap.path_geometry import GeoPoint
     tx = GeoPoint.from_degrees(args.txlat, args.txlng)
-    rx = resolve_rx(args)
-
-    eng = PredictionEngine()
     eng.params.ssn                  = float(args.ssn)
     eng.params.month                = int(args.month)
     eng.params.tx_location          = tx
@@ -190,10 +499,186 @@ def compute_rows(args: argparse.Namespace, debug: bool = False) -> List[List[flo
     eng.params.required_snr         = CW_REQUIRED_SNR
     eng.params.required_reliability = CW_REQUIRED_RELIABILITY
     eng.params.man_made_noise_at_3mhz = MAN_MADE_NOISE
+    return eng
+
+
+# Per-process engine for HourPool workers, created once by _hour_worker_init()
+_WORKER_ENGINE: Optional[PredictionEngine] = None
+
+
+def _hour_worker_init() -> None:
+    global _WORKER_ENGINE
+    from dvoacap.prediction_engine import PredictionEngine
+    _WORKER_ENGINE = PredictionEngine()
+
+
+def _hour_worker_ready(_: int) -> int:
+    return os.getpid()
 
+
+def _hour_worker_rows(params: dict, hours: List[int]) -> List[List[float]]:
+    args = argparse.Namespace(**params)
+    eng = configure_engine(_WORKER_ENGINE, args)
+    rx = resolve_rx(args)
+    return [compute_hour_row(eng, rx, h) for h in hours]
+
+
+class HourPool:
+    """
+    Process pool for the 24 independent UTC hours of one request.
+
+    Each worker keeps its own PredictionEngine and reconfigures it per
+    request; hours are dealt round-robin (worker i gets i, i+n, ...) so day
+    and night hours, which cost differently, are spread evenly.  Rows are
+    identical to the serial loop.
+
+    Workers come from a forkserver, never a fork of the caller: the band
+    server is threaded, and forking it while another thread holds a lock
+    (cache, logging, an engine mid-request) would leave that lock held in
+    the child for good.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(1, min(24, workers))
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_hour_worker_init,
+                                            mp_context=multiprocessing.get_context("forkserver"))
+
+    def prime(self) -> None:
+        """Start every worker (and load its engine) now rather than on the first cache miss."""
+        list(self.executor.map(_hour_worker_ready, range(self.workers)))
+
+    def rows(self, args: argparse.Namespace) -> List[List[float]]:
+        params = dict(vars(args))
+        slices = [list(range(i, 24, self.workers)) for i in range(self.workers)]
+        rows: List[List[float]] = [[] for _ in range(24)]
+        for hours, part in zip(slices, self.executor.map(_hour_worker_rows, [params] * len(slices), slices)):
+            for h, row in zip(hours, part):
+                rows[h] = row
+        return rows
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+
+def compute_rows(
+    args: argparse.Namespace, debug: bool = False, eng: Optional[PredictionEngine] = None,
+    pool: Optional[HourPool] = None,
+) -> List[List[float]]:
+    if pool is not None and not debug:
+        return pool.rows(args)
+    from dvoacap.prediction_engine import PredictionEngine
+    rx = resolve_rx(args)
+    eng = configure_engine(eng or PredictionEngine(), args)
     return [compute_hour_row(eng, rx, h, debug=debug) for h in range(24)]
 
 
+def batch_scores(
+    args: argparse.Namespace, pairs, eng: Optional[PredictionEngine] = None,
+) -> np.ndarray:
+    """
+    Scores for many circuits sharing args' month, SSN, power, path and TOA.
+
+    pairs is (P, 4) [txlat, txlng, rxlat, rxlng] or (P, 2) [rxlat, rxlng]
+    with the transmitter taken from args.  Returns a (P, 24, 9) float array in
+    FREQS_MHZ column order, equal to compute_rows() for each pair.  The
+    engine is reconfigured only when the transmitter changes, and scoring is
+    one score_array() call over all P*24*9 predictions.
+    """
+    pairs = np.atleast_2d(np.asarray(pairs, dtype=np.float64))
+    if pairs.size == 0:
+        return np.zeros((0, 24, len(FREQS_MHZ)), dtype=np.float64)
+    if pairs.shape[1] == 2:
+        tx = np.broadcast_to([float(args.txlat), float(args.txlng)], (len(pairs), 2))
+        pairs = np.hstack([tx, pairs])
+    elif pairs.shape[1] != 4:
+        raise ValueError(f"pairs must have 2 or 4 columns, not {pairs.shape[1]}")
+
+    from dvoacap.path_geometry import GeoPoint
+    from dvoacap.prediction_engine import PredictionEngine
+    eng = eng or PredictionEngine()
+    inputs = np.empty((len(pairs), 24, 2, len(FREQS_MHZ)), dtype=np.float64)
+    # Group by transmitter so each TX configures the engine once
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    current_tx = None
+    for i in order:
+        txlat, txlng, rxlat, rxlng = pairs[i]
+        if current_tx != (txlat, txlng):
+            current_tx = (txlat, txlng)
+            configure_engine(eng, argparse.Namespace(**{**vars(args), "txlat": txlat, "txlng": txlng}))
+        rx = GeoPoint.from_degrees(rxlat, rxlng)
+        for h in range(24):
+            inputs[i, h] = hour_inputs(eng, rx, h)
+    return score_array(inputs[:, :, 0], inputs[:, :, 1])
+
+
+def load_pairs(path: str) -> np.ndarray:
+    """Whitespace/comma separated 'RXLAT RXLNG' or 'TXLAT TXLNG RXLAT RXLNG' lines; '#' comments."""
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].replace(",", " ").split()
+            if line:
+                rows.append([float(v) for v in line])
+    if not rows:
+        return np.empty((0, 4), dtype=np.float64)
+    if len({len(r) for r in rows}) != 1 or len(rows[0]) not in (2, 4):
+        raise ValueError(f"{path}: every line needs the same 2 or 4 columns")
+    return np.asarray(rows, dtype=np.float64)
+
+
+def format_response(args: argparse.Namespace, rows: List[List[float]]) -> str:
+    """CSI fetchBandConditions.pl body: requested-UTC row, header, then hours 1..23 and 0."""
+    utc = int(args.utc) % 24
+    header = (
+        f"{int(args.pow)}W,"
+        f"{mode_int_to_string(int(args.mode))},"
+        f"TOA>{float(args.toa):g},"
+        f"{path_int_to_string(int(args.path))},"
+        f"S={int(round(float(args.ssn)))}"
+    )
+
+    lines = [fmt_row(rows[utc]), header]
+    lines += [f"{h} {fmt_row(rows[h])}" for h in range(1, 24)]
+    lines.append(f"0 {fmt_row(rows[0])}")
+    return "\n".join(lines) + "\n"
+
+
+def band_conditions(
+    args: argparse.Namespace, cache: BandCache,
+    debug: bool = False, eng: Optional[PredictionEngine] = None,
+    pool: Optional[HourPool] = None, timing: bool = False,
+    grid: Optional[str] = None, ssn_step: float = 0.0,
+    engines: Optional[queue.Queue] = None,
+) -> str:
+    """
+    Cached 24-hour table for args, formatted as the CSI response text.
+
+    With grid/ssn_step the rows are computed and keyed on canonical_args();
+    the response header still shows the requested values.  engines is a
+    queue (anything with get/put) of PredictionEngines to borrow from, only
+    on a cache miss computed in this process, so hits never wait for a busy
+    engine.
+    """
+    canon = canonical_args(args, grid, ssn_step) if grid or ssn_step > 0 else args
+
+    def compute() -> List[List[float]]:
+        t0 = time.perf_counter()
+        if engines is not None and (pool is None or debug):
+            e = engines.get()
+            try:
+                rows = compute_rows(canon, debug=debug, eng=e, pool=pool)
+            finally:
+                engines.put(e)
+        else:
+            rows = compute_rows(canon, debug=debug, eng=eng, pool=pool)
+        if timing:
+            print(f"compute_rows: {time.perf_counter() - t0:.3f}s "
+                  f"(workers={pool.workers if pool else 1})", file=sys.stderr)
+        return rows
+
+    return format_response(args, cache.get_or_compute(cache_key(canon), compute))
+
+
 def main() -> int:
     ap = argparse.ArgumentParser()
     ap.add_argument("--year",   type=int,   required=True)
@@ -201,8 +686,8 @@ def main() -> int:
     ap.add_argument("--utc",    type=int,   required=True)
     ap.add_argument("--txlat",  type=float, required=True)
     ap.add_argument("--txlng",  type=float, required=True)
-    ap.add_argument("--rxlat",  type=float, required=True)
-    ap.add_argument("--rxlng",  type=float, required=True)
+    ap.add_argument("--rxlat",  type=float, default=None)
+    ap.add_argument("--rxlng",  type=float, default=None)
     ap.add_argument("--path",   type=int,   default=0)
     ap.add_argument("--pow",    type=int,   default=100)
     ap.add_argument("--mode",   type=int,   default=19)
@@ -210,10 +695,25 @@ def main() -> int:
     ap.add_argument("--ssn",    type=float, required=True)
     ap.add_argument("--cache-dir", type=str, default="/opt/hamclock-backend/cache/voacap-cache")
     ap.add_argument("--cache-ttl", type=int, default=300)
+    ap.add_argument("--cache-max-mb", type=float, default=CACHE_MAX_BYTES / 2**20,
+                    help="Disk cache budget; least recently used entries are evicted beyond it")
     ap.add_argument("--rx-default-lat", type=float, default=None)
     ap.add_argument("--rx-default-lon", type=float, default=None)
     ap.add_argument("--debug",  action="store_true",
                     help="Print raw dvoacap values to stderr for diagnostics")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Processes for the 24 hours on a cache miss (1 = serial)")
+    ap.add_argument("--timing", action="store_true",
+                    help="Report compute time on a cache miss to stderr")
+    ap.add_argument("--quantize", choices=sorted(QUANT_GRIDS), default=None,
+                    help="Snap TX/RX to this Maidenhead cell centre before computing/caching")
+    ap.add_argument("--ssn-step", type=float, default=0.0,
+                    help="Round SSN to a multiple of this before computing/caching (0 = exact)")
+    ap.add_argument("--pairs", type=str, default=None,
+                    help="Batch mode: file of 'RXLAT RXLNG' (TX from --txlat/--txlng) or "
+                         "'TXLAT TXLNG RXLAT RXLNG' lines; needs --batch-out")
+    ap.add_argument("--batch-out", type=str, default=None,
+                    help="Batch mode: write the (pairs, 24, 9) score array here as .npy")
 
     args = ap.parse_args()
 
@@ -224,29 +724,31 @@ def main() -> int:
         print("bad utc", file=sys.stderr)
         return 2
 
-    cache_dir = Path(args.cache_dir)
-    key = cache_key(args)
-
-    rows = load_cache(cache_dir, key, args.cache_ttl)
-    if rows is None:
-        rows = compute_rows(args, debug=args.debug)
-        save_cache(cache_dir, key, rows)
-
-    utc = int(args.utc) % 24
-    header = (
-        f"{int(args.pow)}W,"
-        f"{mode_int_to_string(int(args.mode))},"
-        f"TOA>{float(args.toa):g},"
-        f"{path_int_to_string(int(args.path))},"
-        f"S={int(round(float(args.ssn)))}"
-    )
-
-    print(fmt_row(rows[utc]))
-    print(header)
-    for h in range(1, 24):
-        print(f"{h} {fmt_row(rows[h])}")
-    print(f"0 {fmt_row(rows[0])}")
+    if args.pairs:
+        if not args.batch_out:
+            print("--pairs needs --batch-out", file=sys.stderr)
+            return 2
+        t0 = time.perf_counter()
+        scores = batch_scores(args, load_pairs(args.pairs))
+        np.save(args.batch_out, scores.astype(np.float32))
+        if args.timing:
+            print(f"batch_scores: {len(scores)} pairs in {time.perf_counter() - t0:.3f}s",
+                  file=sys.stderr)
+        return 0
+    if args.rxlat is None or args.rxlng is None:
+        print("--rxlat and --rxlng are required", file=sys.stderr)
+        return 2
 
+    pool = HourPool(args.workers) if args.workers > 1 else None
+    try:
+        cache = BandCache(args.cache_dir, args.cache_ttl, max_bytes=int(args.cache_max_mb * 2**20))
+        sys.stdout.write(band_conditions(args, cache, debug=args.debug, pool=pool, timing=args.timing,
+                                         grid=args.quantize, ssn_step=args.ssn_step))
+        if args.timing:
+            print(f"cache: {json.dumps(cache.stats())}", file=sys.stderr)
+    finally:
+        if pool:
+            pool.close()
     return 0
 
 
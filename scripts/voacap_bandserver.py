@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Persistent VOACAP band-conditions service for fetchBandConditions.pl.
+
+Keeps NumPy, dvoacap and warm PredictionEngine instances resident and answers
+band-conditions queries over a Unix socket, so a HamClock request costs a
+socket round trip instead of a Python interpreter start + imports.
+
+Protocol (one request per connection):
+  request:  the CGI QUERY_STRING on one line, e.g.
+            YEAR=2026&MONTH=1&UTC=14&TXLAT=28.15&TXLNG=-80.64&RXLAT=37.77&RXLNG=-122.42&PATH=0&POW=100&MODE=19&TOA=3
+  response: HTTP status code on the first line (200/400/500), then the body
+            exactly as voacap_bandconditions.py prints it.
+  The request line STATS instead returns the cache counters as JSON; the CGI
+  does not forward it and --once does not answer it.
+
+SSN is taken from the optional SSN= parameter, else the mean of the backend's
+ssn-31.txt, else DEFAULT_SSN.
+
+Usage:
+  voacap_bandserver.py --daemon          # start in background unless already running (cron-safe)
+  voacap_bandserver.py                   # run in foreground
+  voacap_bandserver.py --once 'QUERY'    # answer one query on stdout (CGI fallback path)
+
+Dependencies: python3, numpy, dvoacap (same as voacap_bandconditions.py)
+"""
+import argparse
+import fcntl
+import gzip
+import json
+import math
+import os
+import queue
+import re
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Iterator, Optional
+from urllib.parse import parse_qs, unquote
+
+import voacap_bandconditions as vb
+
+BASE = "/opt/hamclock-backend"
+SOCKET_PATH = f"{BASE}/tmp/voacap-band.sock"
+LOG_PATH = f"{BASE}/logs/voacap_bandserver.log"
+SSN_FILE = f"{BASE}/htdocs/ham/HamClock/ssn/ssn-31.txt"
+CACHE_DIR = f"{BASE}/cache/voacap-cache"
+DEFAULT_SSN = 107.0
+MAX_REQUEST = 4096
+
+# lighttpd access log: ... [17/Oct/2026:10:00:00 +0000] "GET /ham/HamClock/fetchBandConditions.pl?QS HTTP/1.1" ...
+ACCESS_LOG = "/var/log/lighttpd/access.log"
+LOG_QUERY_RE = re.compile(r'\[([^\]]+)\] "GET \S*fetchBandConditions\.pl\?(\S+)')
+
+# Parameter syntax of the former CGI wrapper (is_int / is_num)
+INT_RE = re.compile(r"-?\d+", re.ASCII)
+NUM_RE = re.compile(r"-?\d+(\.\d+)?", re.ASCII)
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def current_ssn(path: str = SSN_FILE) -> float:
+    """Mean SSN of ssn-31.txt (YYYY MM DD SSN lines); DEFAULT_SSN if unreadable."""
+    vals = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 4:
+                    try:
+                        vals.append(float(parts[3]))
+                    except ValueError:
+                        pass
+    except OSError:
+        pass
+    return sum(vals) / len(vals) if vals else DEFAULT_SSN
+
+
+def parse_query(qs: str, ssn_file: str = SSN_FILE) -> SimpleNamespace:
+    """
+    HamClock query string -> voacap_bandconditions args.
+
+    Same required parameters, type checks and clamps as the former CGI
+    wrapper, plus a TOA clamp and a finite check (long digit strings overflow
+    float() to inf).
+    """
+    q = {k: v[-1] for k, v in parse_qs(qs.strip(), keep_blank_values=True).items()}
+
+    def need(name: str) -> str:
+        v = q.get(name, "")
+        if not v:
+            raise BadRequest(f"Missing {name}")
+        return v
+
+    def as_int(name: str) -> int:
+        v = need(name)
+        if not INT_RE.fullmatch(v):
+            raise BadRequest(f"{name} must be integer")
+        return int(v)
+
+    def as_num(name: str) -> float:
+        v = need(name)
+        if not NUM_RE.fullmatch(v) or not math.isfinite(float(v)):
+            raise BadRequest(f"{name} must be numeric")
+        return float(v)
+
+    def clamp(v, lo, hi):
+        return max(lo, min(hi, v))
+
+    args = SimpleNamespace(
+        year=as_int("YEAR"),
+        month=clamp(as_int("MONTH"), 1, 12),
+        rxlat=round(clamp(as_num("RXLAT"), -90.0, 90.0), 3),
+        rxlng=round(clamp(as_num("RXLNG"), -180.0, 180.0), 3),
+        txlat=round(clamp(as_num("TXLAT"), -90.0, 90.0), 3),
+        txlng=round(clamp(as_num("TXLNG"), -180.0, 180.0), 3),
+        utc=clamp(as_int("UTC"), 0, 23),
+        path=as_int("PATH"),
+        pow=as_int("POW"),
+        mode=as_int("MODE"),
+        toa=clamp(as_num("TOA"), 0.0, 90.0),
+        rx_default_lat=None,
+        rx_default_lon=None,
+    )
+    if q.get("SSN"):
+        args.ssn = clamp(as_num("SSN"), 0.0, 400.0)
+    else:
+        args.ssn = round(current_ssn(ssn_file))
+    return args
+
+
+def logged_queries(paths, since: Optional[float] = None) -> Iterator[str]:
+    """
+    Band-conditions query strings from lighttpd access logs (plain or .gz),
+    optionally only those logged at or after the epoch time since.
+    """
+    for path in paths:
+        opener = gzip.open if str(path).endswith(".gz") else open
+        try:
+            with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    m = LOG_QUERY_RE.search(line)
+                    if not m:
+                        continue
+                    if since is not None:
+                        try:
+                            if datetime.strptime(m.group(1), "%d/%b/%Y:%H:%M:%S %z").timestamp() < since:
+                                continue
+                        except ValueError:
+                            continue
+                    yield unquote(m.group(2))
+        except OSError as e:
+            print(f"{path}: {e}", file=sys.stderr)
+
+
+class _Engines:
+    """
+    Up to size PredictionEngines, built on first need, with the queue's
+    get/put; a request served from the cache never builds one (or imports
+    dvoacap).
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._idle = queue.Queue()
+        self._made = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            make = self._made < self.size
+            if make:
+                self._made += 1
+        if not make:
+            return self._idle.get()
+        try:
+            return vb.PredictionEngine()
+        except BaseException:
+            with self._lock:
+                self._made -= 1
+            raise
+
+    def put(self, eng) -> None:
+        self._idle.put(eng)
+
+
+class BandService:
+    """Engines + cache settings; answer() is what both the socket and --once use."""
+
+    def __init__(self, cache_dir: str, cache_ttl: int, engines: int = 1, ssn_file: str = SSN_FILE,
+                 workers: int = 1, cache_max_bytes: int = vb.CACHE_MAX_BYTES,
+                 cache_mem_bytes: int = vb.CACHE_MEM_BYTES, grid: Optional[str] = None,
+                 ssn_step: float = 0.0):
+        self.cache = vb.BandCache(cache_dir, cache_ttl, max_bytes=cache_max_bytes,
+                                  mem_bytes=cache_mem_bytes)
+        self.ssn_file = ssn_file
+        self.grid = grid
+        self.ssn_step = ssn_step
+        self.engines = _Engines(engines)
+        # Cache misses fan the 24 hours out to worker processes with their own engines
+        self.pool = vb.HourPool(workers) if workers > 1 else None
+        self.requests = 0
+        self._count_lock = threading.Lock()
+
+    def stats(self) -> str:
+        return json.dumps({"requests": self.requests, **self.cache.stats()}) + "\n"
+
+    def answer(self, qs: str) -> tuple:
+        """Query string -> (status, body)."""
+        try:
+            args = parse_query(qs, self.ssn_file)
+        except BadRequest as e:
+            return 400, f"ERROR: {e}\n"
+        # The cache is consulted first; an engine is borrowed only to compute a miss
+        try:
+            return 200, vb.band_conditions(args, self.cache, engines=self.engines, pool=self.pool,
+                                            grid=self.grid, ssn_step=self.ssn_step)
+        except Exception as e:
+            return 500, f"ERROR: band conditions failed: {e}\n"
+        finally:
+            with self._count_lock:
+                self.requests += 1
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        t0 = time.perf_counter()
+        qs = self.rfile.readline(MAX_REQUEST).decode("utf-8", errors="replace")
+        if qs.strip() == "STATS":
+            self.wfile.write(f"200\n{self.server.service.stats()}".encode("utf-8"))
+            return
+        status, body = self.server.service.answer(qs)
+        self.wfile.write(f"{status}\n{body}".encode("utf-8"))
+        if status != 200:
+            print(f"{time.strftime('%F %T')} {status} {qs.strip()} "
+                  f"({(time.perf_counter() - t0) * 1000:.0f} ms)", flush=True)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def daemonize(log_path: str) -> None:
+    """Classic double fork; stdout/stderr go to log_path."""
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+    null = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null, 0)
+    os.close(null)
+
+
+def serve(args: argparse.Namespace) -> int:
+    # One server per socket: the lock is held for the life of the process
+    lock = open(args.socket + ".lock", "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        print(f"already running on {args.socket}")
+        return 0
+
+    if args.daemon:
+        lock.close()
+        daemonize(args.log)
+        lock = open(args.socket + ".lock", "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return 0
+
+    service = BandService(args.cache_dir, args.cache_ttl, engines=args.engines, ssn_file=args.ssn_file,
+                          workers=args.workers, cache_max_bytes=int(args.cache_max_mb * 2**20),
+                          cache_mem_bytes=int(args.cache_mem_mb * 2**20),
+                          grid=args.quantize, ssn_step=args.ssn_step)
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = _Server(args.socket, _Handler)
+    os.chmod(args.socket, 0o660)
+    server.service = service
+    if service.pool is not None:
+        # start the workers before the first thread exists
+        service.pool.prime()
+    print(f"{time.strftime('%F %T')} voacap_bandserver listening on {args.socket} "
+          f"(pid {os.getpid()}, engines {args.engines}, workers {args.workers})", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        os.unlink(args.socket)
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Persistent VOACAP band-conditions service")
+    ap.add_argument("--socket", default=SOCKET_PATH)
+    ap.add_argument("--daemon", action="store_true", help="detach; exit at once if already running")
+    ap.add_argument("--log", default=LOG_PATH, help="log file when --daemon")
+    ap.add_argument("--once", metavar="QUERY", help="answer one query string on stdout and exit")
+    ap.add_argument("--engines", type=int, default=1, help="PredictionEngine instances (each built on the first cache miss that needs it)")
+    ap.add_argument("--workers", type=int, default=2,
+                    help="processes that split the 24 hours of a cache miss (1 = serial); "
+                         "each holds its own engine, so size this to the host, not its cores")
+    ap.add_argument("--cache-dir", default=CACHE_DIR)
+    ap.add_argument("--cache-ttl", type=int, default=300)
+    ap.add_argument("--cache-max-mb", type=float, default=vb.CACHE_MAX_BYTES / 2**20,
+                    help="disk cache budget (LRU eviction beyond it)")
+    ap.add_argument("--cache-mem-mb", type=float, default=vb.CACHE_MEM_BYTES / 2**20,
+                    help="in-process cache budget")
+    ap.add_argument("--ssn-file", default=SSN_FILE)
+    ap.add_argument("--quantize", choices=sorted(vb.QUANT_GRIDS), default=None,
+                    help="share results within a Maidenhead cell (see voacap_quant_error.py)")
+    ap.add_argument("--ssn-step", type=float, default=0.0, help="share results within SSN buckets")
+    args = ap.parse_args()
+
+    if args.once is not None:
+        service = BandService(args.cache_dir, args.cache_ttl, ssn_file=args.ssn_file,
+                              cache_max_bytes=int(args.cache_max_mb * 2**20),
+                              grid=args.quantize, ssn_step=args.ssn_step)
+        status, body = service.answer(args.once)
+        sys.stdout.write(f"{status}\n{body}")
+        return 0
+
+    return serve(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
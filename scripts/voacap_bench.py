@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Latency / accuracy benchmark for the band-conditions back ends.
+
+Runs the recorded circuits in voacap/bench_cases.json and reports, per case:
+
+  python back end (voacap_bandconditions.py, in process)
+    cold     first request: new PredictionEngine + 24 hours
+    warm     median of --repeat runs on a warm engine (no cache)
+    engine   part of warm spent in dvoacap predict()
+    score    part of warm spent in score_array()
+    hit      BandCache lookup of the same request (fresh temp cache)
+    poolN    with --workers N > 1: 24 hours through an HourPool
+  voacapl back end (fetchBandConditions.pl run as a CGI)
+    cold     first request (voacapl run)
+    warm     repeat request (answered from the shared rows)
+
+plus peak RSS after the case and two kinds of deviation of the served
+(2-decimal) table:
+
+  accuracy    against each external reference table the case carries:
+              "csi" (the ClearSkyInstitute server the scoring was fitted to)
+              and "voacapl" (the voacapl back end).  These are captured from
+              a running server with --fetch-reference and never rewritten by
+              --record.  A case without a given reference shows "-".
+  regression  against the case's baseline for the back end, a snapshot of
+              our own output recorded with --record.  It says nothing about
+              accuracy, only whether a change moved the numbers.
+
+Usage:
+  voacap_bench.py                              # python back end, all cases
+  voacap_bench.py --backend voacapl --cases fl-ca,w1-g
+  voacap_bench.py --workers 4 --json out.json  # include HourPool timing, save results
+  voacap_bench.py --record                     # (re)record the back end's regression baselines
+  voacap_bench.py --fetch-reference csi=http://clearskyinstitute.com/ham/HamClock/fetchBandConditions.pl
+  voacap_bench.py --fetch-reference voacapl=./fetchBandConditions.pl   # local CGI, run with perl
+
+Exit status is 1 if any case deviates from its baseline by more than
+--tolerance, or from a reference by more than --ref-tolerance when given.
+
+Dependencies: python3, numpy, dvoacap (python back end); perl, voacapl (voacapl back end)
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import urllib.request
+from datetime import date
+
+import numpy as np
+
+import voacap_bandconditions as vb
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CASES_FILE = os.path.join(HERE, "voacap", "bench_cases.json")
+VOACAPL_CGI = os.path.join(HERE, "fetchBandConditions.pl")
+REFERENCES = ("csi", "voacapl")
+
+
+def case_args(case: dict) -> argparse.Namespace:
+    return argparse.Namespace(
+        year=case["year"], month=case["month"], utc=case.get("utc", 0), ssn=float(case["ssn"]),
+        txlat=case["tx"][0], txlng=case["tx"][1], rxlat=case["rx"][0], rxlng=case["rx"][1],
+        path=case.get("path", 0), pow=case.get("pow", 100), mode=case.get("mode", 19),
+        toa=case.get("toa", 3.0), rx_default_lat=None, rx_default_lon=None,
+    )
+
+
+def served(rows) -> np.ndarray:
+    """24x9 table as it appears in the response (clamped, 2 decimals)."""
+    return np.round(np.clip(np.nan_to_num(np.asarray(rows, dtype=np.float64)), 0.0, 1.0), 2)
+
+
+def peak_rss_mb(children: bool = False) -> float:
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return resource.getrusage(who).ru_maxrss / 1024.0
+
+
+def bench_python(case: dict, repeat: int, pool) -> tuple[dict, np.ndarray]:
+    args = case_args(case)
+    rx = vb.resolve_rx(args)
+
+    t0 = time.perf_counter()
+    eng = vb.PredictionEngine()
+    rows = vb.compute_rows(args, eng=eng)
+    cold = time.perf_counter() - t0
+
+    warm, engine, score = [], [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        vb.configure_engine(eng, args)
+        inputs = np.stack([vb.hour_inputs(eng, rx, h) for h in range(24)])
+        t1 = time.perf_counter()
+        rows = vb.score_array(inputs[:, 0], inputs[:, 1])
+        t2 = time.perf_counter()
+        warm.append(t2 - t0)
+        engine.append(t1 - t0)
+        score.append(t2 - t1)
+
+    with tempfile.TemporaryDirectory() as d:
+        cache = vb.BandCache(d, 300)
+        vb.band_conditions(args, cache, eng=eng)
+        t0 = time.perf_counter()
+        vb.band_conditions(args, cache, eng=eng)
+        hit = time.perf_counter() - t0
+
+    res = {
+        "cold_s": cold, "warm_s": statistics.median(warm), "engine_s": statistics.median(engine),
+        "score_s": statistics.median(score), "hit_s": hit,
+    }
+    if pool is not None:
+        t0 = time.perf_counter()
+        pool.rows(args)
+        res["pool_s"] = time.perf_counter() - t0
+    res["peak_rss_mb"] = peak_rss_mb()
+    return res, served(rows)
+
+
+def cgi_query(case: dict) -> str:
+    a = case_args(case)
+    return (f"YEAR={a.year}&MONTH={a.month}&UTC={a.utc}&TXLAT={a.txlat}&TXLNG={a.txlng}"
+            f"&RXLAT={a.rxlat}&RXLNG={a.rxlng}&PATH={a.path}&POW={a.pow}&MODE={a.mode}"
+            f"&TOA={a.toa:g}&SSN={int(round(a.ssn))}")
+
+
+def parse_cgi_table(body: str) -> np.ndarray:
+    """Hour-indexed 24x9 table from a fetchBandConditions response (headers, summary, meta, 'H v,..' rows)."""
+    table = np.full((24, 9), np.nan)
+    for line in body.splitlines():
+        hour, sep, vals = line.partition(" ")
+        if sep and hour.isdigit() and vals.count(",") == 8:
+            table[int(hour)] = [float(v) for v in vals.split(",")]
+    if np.isnan(table).any():
+        raise RuntimeError("incomplete table: " + body.strip().splitlines()[-1][:120] if body.strip() else "empty")
+    return table
+
+
+def run_cgi(cgi: str, qs: str) -> tuple[float, str]:
+    t0 = time.perf_counter()
+    p = subprocess.run(["perl", cgi], env={**os.environ, "QUERY_STRING": qs},
+                       capture_output=True, text=True, timeout=300)
+    return time.perf_counter() - t0, p.stdout
+
+
+def fetch_table(source: str, case: dict) -> np.ndarray:
+    """Table a CSI-format fetchBandConditions.pl serves for case: a local CGI path (run with perl) or a URL."""
+    qs = cgi_query(case)
+    if os.path.isfile(source):
+        _, body = run_cgi(source, qs)
+    else:
+        req = urllib.request.Request(f"{source}?{qs}", headers={"User-Agent": "open-hamclock-backend/1.0"})
+        with urllib.request.urlopen(req, timeout=120) as r:
+            body = r.read().decode("utf-8", errors="replace")
+    return served(parse_cgi_table(body))
+
+
+def as_rows(table: np.ndarray) -> list:
+    return [",".join(f"{v:.2f}" for v in r) for r in table]
+
+
+def deviation(table: np.ndarray, rows: list) -> tuple[float, float]:
+    """(max, mean) absolute deviation of table from stored rows."""
+    dev = np.abs(table - np.array([[float(v) for v in r.split(",")] for r in rows]))
+    return float(dev.max()), float(dev.mean())
+
+
+def fetch_references(cases: list, spec: str, cases_file: str, only=None) -> int:
+    name, sep, source = spec.partition("=")
+    if not sep or name not in REFERENCES:
+        print(f"--fetch-reference wants NAME=URL or NAME=CGI with NAME one of {', '.join(REFERENCES)}")
+        return 2
+    failed = False
+    for case in cases:
+        if only is not None and case["name"] not in only:
+            continue
+        try:
+            table = fetch_table(source, case)
+        except Exception as e:
+            print(f"{case['name']:<12}ERROR: {e}")
+            failed = True
+            continue
+        case.setdefault("reference", {})[name] = as_rows(table)
+        case.setdefault("reference_source", {})[name] = f"{source} ({date.today().isoformat()})"
+        print(f"{case['name']:<12}{name} reference stored")
+    with open(cases_file, "w", encoding="utf-8") as f:
+        json.dump(cases, f, indent=1)
+        f.write("\n")
+    return 1 if failed else 0
+
+
+def bench_voacapl(case: dict, cgi: str) -> tuple[dict, np.ndarray]:
+    qs = cgi_query(case)
+    cold, body = run_cgi(cgi, qs)
+    table = parse_cgi_table(body)
+    warm, _ = run_cgi(cgi, qs)
+    return {"cold_s": cold, "warm_s": warm, "peak_rss_mb": peak_rss_mb(children=True)}, served(table)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Band-conditions latency/accuracy benchmark")
+    ap.add_argument("--backend", choices=("python", "voacapl"), default="python")
+    ap.add_argument("--cases-file", default=CASES_FILE)
+    ap.add_argument("--cases", default=None, help="comma list of case names (default: all)")
+    ap.add_argument("--repeat", type=int, default=3, help="warm runs per case (python)")
+    ap.add_argument("--workers", type=int, default=1, help="also time an HourPool of this size (python)")
+    ap.add_argument("--cgi", default=VOACAPL_CGI, help="voacapl CGI to run (voacapl back end)")
+    ap.add_argument("--tolerance", type=float, default=0.0, help="max abs deviation from the baseline")
+    ap.add_argument("--ref-tolerance", type=float, default=None,
+                    help="max abs deviation from a reference (default: report only)")
+    ap.add_argument("--json", default=None, help="write per-case results here")
+    ap.add_argument("--record", action="store_true", help="store this run's tables as the back end's baseline")
+    ap.add_argument("--fetch-reference", default=None, metavar="NAME=SOURCE",
+                    help=f"store what SOURCE (URL or local CGI) serves for each case as reference NAME "
+                         f"({', '.join(REFERENCES)}), then exit")
+    args = ap.parse_args()
+
+    with open(args.cases_file, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    if args.cases:
+        wanted = set(args.cases.split(","))
+        unknown = wanted - {c["name"] for c in cases}
+        if unknown:
+            ap.error(f"unknown case(s): {', '.join(sorted(unknown))}")
+    if args.fetch_reference:
+        return fetch_references(cases, args.fetch_reference, args.cases_file,
+                                wanted if args.cases else None)
+    pool = vb.HourPool(args.workers) if args.backend == "python" and args.workers > 1 else None
+
+    cols = ["cold_s", "warm_s", "engine_s", "score_s", "hit_s"] if args.backend == "python" else ["cold_s", "warm_s"]
+    if pool:
+        cols.append("pool_s")
+    print(f"{'case':<12}" + "".join(f"{c[:-2] + ' ms':>11}" for c in cols) + f"{'rss MB':>9}"
+          + "".join(f"{n + ' max':>12}{n + ' mean':>13}" for n in REFERENCES + ("base",)))
+    results, failed = [], False
+    try:
+        for case in cases:
+            if args.cases and case["name"] not in wanted:
+                continue
+            try:
+                if args.backend == "python":
+                    res, table = bench_python(case, max(1, args.repeat), pool)
+                else:
+                    res, table = bench_voacapl(case, args.cgi)
+            except Exception as e:
+                print(f"{case['name']:<12}ERROR: {e}")
+                failed = True
+                continue
+            # accuracy: external references; regression: our own recorded baseline
+            devs = {}
+            for name in REFERENCES:
+                rows = case.get("reference", {}).get(name)
+                if rows is not None:
+                    devs[name] = deviation(table, rows)
+                    failed |= args.ref_tolerance is not None and devs[name][0] > args.ref_tolerance + 1e-9
+            base = case.get("baseline", {}).get(args.backend)
+            if base is not None:
+                devs["base"] = deviation(table, base)
+                failed |= devs["base"][0] > args.tolerance + 1e-9
+            if args.record:
+                case.setdefault("baseline", {})[args.backend] = as_rows(table)
+                case.setdefault("recorded", {})[args.backend] = date.today().isoformat()
+            res.update({f"{n}_max_dev": d[0] for n, d in devs.items()})
+            res.update({f"{n}_mean_dev": d[1] for n, d in devs.items()})
+            results.append({"name": case["name"], "backend": args.backend, **res})
+            dev_txt = "".join(f"{devs[n][0]:12.2f}{devs[n][1]:13.4f}" if n in devs else f"{'-':>12}{'-':>13}"
+                              for n in REFERENCES + ("base",))
+            print(f"{case['name']:<12}" + "".join(f"{res[c] * 1000:11.1f}" for c in cols)
+                  + f"{res['peak_rss_mb']:9.1f}" + dev_txt, flush=True)
+    finally:
+        if pool:
+            pool.close()
+
+    if args.record:
+        with open(args.cases_file, "w", encoding="utf-8") as f:
+            json.dump(cases, f, indent=1)
+            f.write("\n")
+        print(f"recorded {args.backend} baselines in {args.cases_file}")
+        failed = False
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Pre-warm the band-conditions cache from observed traffic.
+
+Collects the distinct fetchBandConditions.pl queries in the lighttpd access
+logs of the last --days days, moves them to the current year/month and SSN
+(as voacap_bandserver would answer them today), and computes every circuit
+that is not already fresh in the cache.  Run nightly in the off-peak window so
+interactive requests hit.
+
+The job is polite to the map renderers: it runs at --nice, waits while the
+1-minute load average is above --max-load, and stops once it has used
+--cpu-seconds of CPU or the clock passes --until.  Circuits are computed in
+order of popularity, so a cut-short run still covers the busiest ones.
+
+Queries without SSN= are keyed on the monthly mean of ssn-31.txt, which
+ssn_simple refreshes at 10:15 and 14:15.  Each run records the SSN it
+used in the cache directory; a run with --if-ssn-changed exits at once
+unless that value has moved since, and otherwise computes only the circuits
+whose key changed with it (the rest are still fresh).
+
+Usage:
+  voacap_prewarm.py --days 7 --cpu-seconds 1800 --until 05:30
+  voacap_prewarm.py --days 7 --cpu-seconds 600 --if-ssn-changed
+
+Dependencies: python3, numpy, dvoacap (same as voacap_bandconditions.py)
+"""
+import argparse
+import glob
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import voacap_bandconditions as vb
+import voacap_bandserver as vs
+
+
+def log(msg: str) -> None:
+    print(f"{time.strftime('%F %T')} {msg}", flush=True)
+
+
+def recent_logs(pattern: str, since: float) -> list:
+    """Access log and rotations (access.log.1, .2.gz, ...) modified since the cutoff, oldest first."""
+    paths = [p for p in glob.glob(pattern + "*") if os.path.getmtime(p) >= since]
+    return sorted(paths, key=os.path.getmtime)
+
+
+def wanted_circuits(queries, ssn_file: str, grid, ssn_step: float) -> list:
+    """Distinct canonical requests for today's year/month, most requested first."""
+    now = datetime.now(timezone.utc)
+    counts, circuits = Counter(), {}
+    for qs in queries:
+        try:
+            args = vs.parse_query(qs, ssn_file)
+        except vs.BadRequest:
+            continue
+        args.year, args.month = now.year, now.month
+        canon = vb.canonical_args(args, grid, ssn_step) if grid or ssn_step > 0 else args
+        key = vb.cache_key(canon)
+        counts[key] += 1
+        circuits.setdefault(key, canon)
+    return [(key, circuits[key]) for key, _ in counts.most_common()]
+
+
+def read_stamp(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return float(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def until_epoch(hhmm: str) -> float:
+    """Next local occurrence of HH:MM as epoch seconds."""
+    h, m = (int(v) for v in hhmm.split(":"))
+    now = datetime.now()
+    t = now.replace(hour=h, minute=m, second=0, microsecond=0)
+    if t <= now:
+        t += timedelta(days=1)
+    return t.timestamp()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Pre-warm the band-conditions cache from the access log")
+    ap.add_argument("--log", default=vs.ACCESS_LOG, help="access log; rotated siblings are read too")
+    ap.add_argument("--days", type=float, default=7.0, help="look back this many days")
+    ap.add_argument("--ssn-file", default=vs.SSN_FILE)
+    ap.add_argument("--cache-dir", default=vs.CACHE_DIR)
+    ap.add_argument("--cache-ttl", type=int, default=86400, help="must match the band server's --cache-ttl")
+    ap.add_argument("--cache-max-mb", type=float, default=vb.CACHE_MAX_BYTES / 2**20)
+    ap.add_argument("--quantize", choices=sorted(vb.QUANT_GRIDS), default=None,
+                    help="must match the band server's --quantize")
+    ap.add_argument("--ssn-step", type=float, default=0.0, help="must match the band server's --ssn-step")
+    ap.add_argument("--cpu-seconds", type=float, default=1800.0, help="stop after this much CPU time")
+    ap.add_argument("--until", default=None, metavar="HH:MM", help="stop at this local time")
+    ap.add_argument("--max-load", type=float, default=float(os.cpu_count() or 1),
+                    help="pause while the 1-minute load average is above this")
+    ap.add_argument("--nice", type=int, default=19)
+    ap.add_argument("--dry-run", action="store_true", help="only report what would be computed")
+    ap.add_argument("--if-ssn-changed", action="store_true",
+                    help="do nothing unless ssn-31.txt gives another SSN than the last run used")
+    args = ap.parse_args()
+
+    # the value parse_query fills in for queries without SSN=, as the server would now
+    ssn = round(vs.current_ssn(args.ssn_file))
+    stamp = os.path.join(args.cache_dir, "prewarm.ssn")
+    if args.if_ssn_changed and read_stamp(stamp) == ssn:
+        log(f"SSN still {ssn}, nothing to refresh")
+        return 0
+
+    if args.nice:
+        os.nice(args.nice)
+    deadline = until_epoch(args.until) if args.until else None
+
+    since = time.time() - args.days * 86400
+    logs = recent_logs(args.log, since)
+    circuits = wanted_circuits(vs.logged_queries(logs, since), args.ssn_file, args.quantize, args.ssn_step)
+    log(f"{len(circuits)} distinct circuits in {len(logs)} log file(s) over {args.days:g} days")
+
+    # Entries younger than half the TTL are left alone; older ones are recomputed
+    fresh = vb.BandCache(args.cache_dir, args.cache_ttl // 2)
+    cache = vb.BandCache(args.cache_dir, args.cache_ttl, max_bytes=int(args.cache_max_mb * 2**20))
+    eng = vb.PredictionEngine()
+    cpu0 = time.process_time()
+    done = skipped = 0
+    for key, canon in circuits:
+        if time.process_time() - cpu0 >= args.cpu_seconds:
+            log(f"CPU budget of {args.cpu_seconds:g}s used, stopping")
+            break
+        if fresh.get(key) is not None:
+            skipped += 1
+            continue
+        if args.dry_run:
+            done += 1
+            continue
+        while os.getloadavg()[0] > args.max_load and not (deadline and time.time() >= deadline):
+            time.sleep(15)
+        if deadline and time.time() >= deadline:
+            log(f"reached {args.until}, stopping")
+            break
+        try:
+            cache.put(key, vb.compute_rows(canon, eng=eng))
+            done += 1
+        except Exception as e:
+            log(f"{key[:12]}: {e}")
+    if not args.dry_run:
+        try:
+            with open(stamp, "w", encoding="utf-8") as f:
+                f.write(f"{ssn}\n")
+        except OSError as e:
+            log(f"{stamp}: {e}")
+    log(f"SSN {ssn}: {'would compute' if args.dry_run else 'computed'} {done}, already fresh {skipped}, "
+        f"left {len(circuits) - done - skipped}, cpu {time.process_time() - cpu0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Offline check of band-conditions request quantisation (voacap_bandconditions --quantize/--ssn-step).
+
+For each quantisation level, compares the rows served for sampled circuits
+with the rows of their canonical (snapped) form and reports the score error
+as HamClock sees it (values rounded to 2 decimals), and, given an access log,
+how many requests would share a cache entry.
+
+Usage:
+  voacap_quant_error.py --samples 50                       # random circuits
+  voacap_quant_error.py --log /var/log/lighttpd/access.log # circuits + hit rate from real requests
+  voacap_quant_error.py --levels subsquare,square --ssn-steps 0,5,10 --bound 0.05
+
+A level passes when its --stat error (worst case by default, or the 99th
+percentile) is <= --bound; exit status is 1 if any level fails.  Scores jump
+near band openings/closings, so a few cells can move a lot even for tiny
+snaps: on 12 random circuits subsquare/ssn0 gave p99 0.01 but max 0.12, and
+square-level snapping p99 0.33.
+
+Dependencies: python3, numpy, dvoacap (same as voacap_bandconditions.py)
+"""
+import argparse
+import random
+import sys
+
+import numpy as np
+
+import voacap_bandconditions as vb
+import voacap_bandserver as vs
+
+
+def log_requests(path: str, ssn_file: str) -> list:
+    """voacap_bandconditions args for every parseable band-conditions request in an access log."""
+    out = []
+    for qs in vs.logged_queries([path]):
+        try:
+            out.append(vs.parse_query(qs, ssn_file))
+        except vs.BadRequest:
+            pass
+    return out
+
+
+def random_requests(n: int, seed: int) -> list:
+    """n circuits uniform on the sphere, random month and SSN 0..200."""
+    rng = random.Random(seed)
+
+    def point():
+        return round(np.degrees(np.arcsin(rng.uniform(-1.0, 1.0))), 4), round(rng.uniform(-180.0, 180.0), 4)
+
+    out = []
+    for _ in range(n):
+        (txlat, txlng), (rxlat, rxlng) = point(), point()
+        out.append(argparse.Namespace(
+            year=2026, month=rng.randint(1, 12), utc=0, ssn=round(rng.uniform(0.0, 200.0)),
+            txlat=txlat, txlng=txlng, rxlat=rxlat, rxlng=rxlng,
+            path=0, pow=100, mode=19, toa=3.0, rx_default_lat=None, rx_default_lon=None,
+        ))
+    return out
+
+
+def served(rows) -> np.ndarray:
+    """Scores exactly as formatted in the response."""
+    return np.round(np.clip(np.nan_to_num(np.asarray(rows, dtype=np.float64)), 0.0, 1.0), 2)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Measure band-conditions quantisation error and cache sharing")
+    ap.add_argument("--log", help="lighttpd access log to take circuits and the request mix from")
+    ap.add_argument("--ssn-file", default="/opt/hamclock-backend/htdocs/ham/HamClock/ssn/ssn-31.txt",
+                    help="SSN source for logged requests without SSN=")
+    ap.add_argument("--samples", type=int, default=50, help="circuits to evaluate (random or from --log)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--levels", default=",".join(sorted(vb.QUANT_GRIDS)),
+                    help="comma list of grids to test ('none' = no snapping)")
+    ap.add_argument("--ssn-steps", default="0,5", help="comma list of SSN bucket sizes to test")
+    ap.add_argument("--bound", type=float, default=0.05, help="max acceptable absolute score error")
+    ap.add_argument("--stat", choices=("max", "p99"), default="max", help="error statistic held to --bound")
+    args = ap.parse_args()
+
+    levels = [(None if g == "none" else g, float(st))
+              for g in args.levels.split(",") for st in args.ssn_steps.split(",")]
+    levels = [lv for lv in levels if lv[0] or lv[1] > 0]
+    for g, _ in levels:
+        if g and g not in vb.QUANT_GRIDS:
+            ap.error(f"unknown level {g!r}; choose from {', '.join(sorted(vb.QUANT_GRIDS))} or none")
+
+    logged = log_requests(args.log, args.ssn_file) if args.log else []
+    if args.log:
+        print(f"{len(logged)} band-conditions requests in {args.log}")
+        if logged:
+            distinct = len({vb.cache_key(r) for r in logged})
+            print(f"  exact keys:          {distinct:6d} distinct, reuse {1 - distinct / len(logged):6.1%}")
+            for g, st in levels:
+                distinct = len({vb.cache_key(vb.canonical_args(r, g, st)) for r in logged})
+                print(f"  {g or 'none'}/ssn{st:g}:".ljust(23) +
+                      f"{distinct:6d} distinct, reuse {1 - distinct / len(logged):6.1%}")
+        rng = random.Random(args.seed)
+        sample = rng.sample(logged, min(args.samples, len(logged)))
+    else:
+        sample = random_requests(args.samples, args.seed)
+    if not sample:
+        print("no circuits to evaluate", file=sys.stderr)
+        return 1
+
+    eng = vb.PredictionEngine()
+    errors = {lv: [] for lv in levels}
+    for i, req in enumerate(sample, 1):
+        exact = served(vb.compute_rows(req, eng=eng))
+        for lv in levels:
+            errors[lv].append(np.abs(served(vb.compute_rows(vb.canonical_args(req, *lv), eng=eng)) - exact))
+        print(f"\r{i}/{len(sample)} circuits", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+
+    print(f"{'level':<20}{'max':>7}{'p99':>7}{'mean':>8}{'cells>0.01':>12}  {args.stat} <= {args.bound:g}")
+    failed = False
+    for (g, st), errs in errors.items():
+        e = np.stack(errs)
+        worst, p99 = float(e.max()), float(np.percentile(e, 99))
+        bad = (worst if args.stat == "max" else p99) > args.bound + 1e-9
+        failed |= bad
+        print(f"{(g or 'none') + '/ssn' + format(st, 'g'):<20}{worst:7.2f}{p99:7.2f}"
+              f"{e.mean():8.4f}{(e > 0.01 + 1e-9).mean():12.2%}  {'FAIL' if bad else 'ok'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,74 +1,94 @@
 #!/usr/bin/env python3
 
+import json
+import os
+import time
+
+import numpy as np
 import pandas as pd
-import requests
 from pathlib import Path
 
-URL = "https://services.swpc.noaa.gov/json/goes/primary/xrays-3-day.json"
+from lib_resample import bin_reduce
+from lib_ringbuf import RING_DIR, RingSeries
+from lib_upstream import fetch, output_mtime
+
+URL = "https://services.swpc.noaa.gov/json/goes/primary/xrays-6-hour.json"
+SEED_URL = "https://services.swpc.noaa.gov/json/goes/primary/xrays-3-day.json"
 OUT = Path("/opt/hamclock-backend/htdocs/ham/HamClock/xray/xray.txt")
 
+# History lives in a ring buffer (lib_ringbuf.py) fed from the 6-hour product;
+# the 3-day product only seeds it when empty or older than the 6-hour window.
+RING = f"{RING_DIR}/xray.ring"   # short, long
+RING_CAPACITY = 4320             # 3 days @ 1 minute
+SHORT_SPAN = 6 * 3600 - 900
+
 # CSI appears to lag the very newest bins; keep a safety margin so we don't
 # emit bins they haven't emitted yet. Tune if needed.
 CSI_LAG_MINUTES = 21
+BIN_SECONDS = 600
 
-def main() -> None:
-    r = requests.get(URL, timeout=30)
-    r.raise_for_status()
-
-    df = pd.DataFrame(r.json())
+def parse_xrays(body: bytes) -> pd.DataFrame:
+    """SWPC xrays-*.json -> one row per UTC timestamp with 'short' and 'long' flux columns."""
+    df = pd.DataFrame(json.loads(body))
     required = {"time_tag", "energy", "flux"}
     if not required.issubset(df.columns):
         raise RuntimeError("Unexpected SWPC JSON schema (missing required keys)")
 
-    # Parse timestamps as UTC
-    df["time_tag"] = pd.to_datetime(df["time_tag"], utc=True)
+    # Parse timestamps as UTC, in ns so index.asi8 // 10**9 is epoch seconds
+    df["time_tag"] = pd.to_datetime(df["time_tag"], utc=True).astype("datetime64[ns, UTC]")
 
     # Keep only the two GOES X-ray bands used by HamClock/CSI
     df = df[df["energy"].isin(["0.05-0.4nm", "0.1-0.8nm"])]
 
     # One row per timestamp with both flux columns
     df = df.pivot(index="time_tag", columns="energy", values="flux").dropna()
-    df = df.rename(columns={"0.05-0.4nm": "short", "0.1-0.8nm": "long"}).sort_index()
+    return df.rename(columns={"0.05-0.4nm": "short", "0.1-0.8nm": "long"}).sort_index()
+
+def main() -> None:
+    with RingSeries(RING, 2, RING_CAPACITY) as ring:
+        seed = ring.last is None or time.time() - ring.last > SHORT_SPAN
+        # Body unchanged since OUT was written: nothing new since the last
+        # build.  Bins held back by CSI_LAG_MINUTES are then released with the
+        # next upstream update.
+        body = fetch(SEED_URL if seed else URL, timeout=30, since=None if seed else output_mtime(OUT))
+        if body is None:
+            return
+        new = parse_xrays(body)
+        ring.append(new.index.asi8 // 10**9, new[["short", "long"]].to_numpy())
+        t, v = ring.read()
 
     # --- CSI-like 10-minute binning (fixed bins, UTC aligned) ---
-    # Floor to 10-minute boundaries
-    binned = df.copy()
-    binned["bin"] = binned.index.floor("10min")
+    # Drop newest bins with a safety lag so output ends where CSI tends to end:
+    # the last bin is the one holding now - CSI_LAG_MINUTES.
+    last_bin = (int(time.time()) - CSI_LAG_MINUTES * 60) // BIN_SECONDS * BIN_SECONDS
+    first_bin = int(t[0]) // BIN_SECONDS * BIN_SECONDS if len(t) else last_bin
+    nbins = max(0, (last_bin - first_bin) // BIN_SECONDS + 1)
 
     # CSI values look like per-bin MAX, not mean (MAX >= MEAN; your values were low)
-    binned = binned.groupby("bin", sort=True)[["short", "long"]].max()
-
-    # Stamp the bin at end-of-bin minute 9 (e.g., 12:50 bin -> 12:59)
-    binned.index = binned.index + pd.Timedelta(minutes=9)
-
-    # Drop newest bins with a safety lag so output ends where CSI tends to end
-    now = pd.Timestamp.now(tz="UTC")
-    last_allowed = now - pd.Timedelta(minutes=CSI_LAG_MINUTES)
-    # Ensure last_allowed is an end-of-bin time (:..:x9)
-    last_allowed = last_allowed.floor("10min") + pd.Timedelta(minutes=9)
-    binned = binned[binned.index <= last_allowed]
-
-    # Keep ~30 hours of history after binning
-    #if not binned.empty:
-    #   binned = binned[binned.index >= binned.index.max() - pd.Timedelta(hours=30)]
+    counts, vmax = bin_reduce(t, v, first_bin, BIN_SECONDS, nbins, how="max")
+    full = np.flatnonzero(counts)
 
     # Keep last 150 samples only (CSI behavior)
-    if len(binned) > 150:
-       binned = binned.iloc[-150:]
+    full = full[-150:]
 
     # Write output (CSI fixed columns)
     OUT.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(OUT, "w") as f:
-        for t, row in binned.iterrows():
+    # Atomic: a half-written OUT would look current to the next run
+    tmp = OUT.with_name(OUT.name + ".tmp")
+    with open(tmp, "w") as f:
+        for k in full:
+            # Stamp the bin at end-of-bin minute 9 (e.g., 12:50 bin -> 12:59)
+            tm = time.gmtime(first_bin + int(k) * BIN_SECONDS + 540)
+            short, long_ = vmax[k]
             # Column starts (1-based) matching CSI:
             # year 1, month 7, day 9, hhmm 13, zero1 20, zero2 27, short 37, long 49
-            hhmm = t.strftime("%H%M")
             f.write(
-                f"{t.year:4d}  {t.month:1d} {t.day:2d}  {hhmm:>4}   "
+                f"{tm.tm_year:4d}  {tm.tm_mon:1d} {tm.tm_mday:2d}  {tm.tm_hour:02d}{tm.tm_min:02d}   "
                 f"00000  00000     "
-                f"{row.short:8.2e}    {row.long:8.2e}\n"
+                f"{short:8.2e}    {long_:8.2e}\n"
             )
+    os.replace(tmp, OUT)
 
 if __name__ == "__main__":
     main()